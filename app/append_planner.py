@@ -0,0 +1,206 @@
+# app/append_planner.py
+#
+# Packs new blocks into as few blocks.children.append requests as the Notion
+# API allows: up to 100 blocks per children array, two levels of nesting and
+# 1000 blocks per request.  Subtrees that do not fit are sent as follow-up
+# requests once their parent's id is known; follow-ups for different parents
+# are independent and run concurrently on the shared pool (and therefore
+# under the shared rate limit of the client).
+
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from .block_loader import DEFAULT_MAX_WORKERS, get_executor
+from .notion_api import list_block_children
+
+MAX_CHILDREN_PER_ARRAY = 100
+MAX_NESTING_LEVELS = 2
+MAX_BLOCKS_PER_REQUEST = 1000
+
+# Blocks Notion will not create without their children (rows / columns / column content)
+PREFILLED_BLOCK_TYPES = {'table', 'column_list', 'column'}
+
+
+def append_block_tree(notion_client, parent_id, blocks, after=None, max_workers=DEFAULT_MAX_WORKERS, on_progress=None):
+    """
+    Append `blocks` (with nested 'children', and table rows in table['children'])
+    under parent_id, after the child `after` if given.  Returns the number of
+    requests made.  on_progress(count) is called with the number of blocks
+    created by each request, from the pool's threads.
+    """
+    if not blocks:
+        return 0
+    executor = get_executor(max_workers)
+    calls = 0
+    pending = {executor.submit(append_children, notion_client, parent_id, blocks, after, on_progress)}
+    try:
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                made, follow_ups = future.result()
+                calls += made
+                for follow_up_parent_id, children in follow_ups:
+                    pending.add(executor.submit(append_children, notion_client, follow_up_parent_id, children, None, on_progress))
+    finally:
+        # On error, let the requests already in flight finish before reporting it
+        wait(pending)
+    return calls
+
+
+def append_children(notion_client, parent_id, blocks, after=None, on_progress=None):
+    """
+    Append one list of siblings in order.  Returns (requests made, follow-ups),
+    where each follow-up is (new parent id, children still to append).
+    """
+    calls = 0
+    follow_ups = []
+    listings = {}
+    for chunk in plan_requests(blocks):
+        kwargs = {'after': after} if after else {}
+        written = sum(count_blocks(payload) for payload, _ in chunk)
+        response = notion_client.blocks.children.append(
+            block_id=parent_id,
+            children=[payload for payload, _ in chunk],
+            **kwargs
+        )
+        calls += 1
+        if on_progress is not None:
+            on_progress(written)
+        results = response['results']
+        for (_, deferred), result in zip(chunk, results):
+            for path, children in deferred:
+                follow_up_parent_id, reads = resolve_block_path(notion_client, result['id'], path, listings)
+                calls += reads
+                follow_ups.append((follow_up_parent_id, children))
+        if after:
+            # The next chunk goes right behind the blocks just created
+            after = results[-1]['id']
+    return calls, follow_ups
+
+
+def plan_requests(blocks):
+    """
+    Split siblings into request-sized chunks of (payload, deferred children).
+    """
+    chunk = []
+    chunk_size = 0
+    for block in blocks:
+        payload, deferred = prepare_block(block)
+        size = count_blocks(payload)
+        if chunk and (len(chunk) >= MAX_CHILDREN_PER_ARRAY or chunk_size + size > MAX_BLOCKS_PER_REQUEST):
+            yield chunk
+            chunk = []
+            chunk_size = 0
+        chunk.append((payload, deferred))
+        chunk_size += size
+    if chunk:
+        yield chunk
+
+
+def prepare_block(block):
+    """
+    Returns (payload, deferred): the block with every descendant that fits in
+    the same request inlined, and the children that must follow once it exists
+    as [(path, children)], path being the child indices leading to their parent.
+    """
+    children = get_block_children(block)
+    if not children or subtree_fits(block, MAX_NESTING_LEVELS):
+        return inline_block(block, MAX_NESTING_LEVELS), []
+    if block['type'] in PREFILLED_BLOCK_TYPES:
+        # Cannot be created empty: send as much as fits now, the rest once the nested ids are known
+        deferred = []
+        return inline_partial(block, MAX_NESTING_LEVELS, (), deferred, [MAX_BLOCKS_PER_REQUEST - 1]), deferred
+    return with_children(block, []), [((), children)]
+
+
+def inline_partial(block, levels, path, deferred, budget):
+    """
+    Inline what fits of block's subtree; the rest is added to deferred.
+    budget is a one-item list with the blocks the request can still take.
+    """
+    children = get_block_children(block)
+    if not children:
+        return with_children(block, [])
+    if levels == 0:
+        deferred.append((path, children))
+        return with_children(block, [])
+    inlined = []
+    for idx, child in enumerate(children[:MAX_CHILDREN_PER_ARRAY]):
+        prefilled = child['type'] in PREFILLED_BLOCK_TYPES and get_block_children(child)
+        if (prefilled and levels < 2) or budget[0] < (2 if prefilled else 1):
+            # It could not bring the children it must be created with; send it and its later siblings afterwards
+            deferred.append((path, children[idx:]))
+            break
+        budget[0] -= 1
+        inlined.append(inline_partial(child, levels - 1, path + (idx,), deferred, budget))
+    else:
+        if len(children) > MAX_CHILDREN_PER_ARRAY:
+            deferred.append((path, children[MAX_CHILDREN_PER_ARRAY:]))
+    return with_children(block, inlined)
+
+
+def resolve_block_path(notion_client, block_id, path, listings):
+    """
+    Id of the block reached from block_id by following child indices; the append
+    response only carries top-level ids.  Returns (id, children listings made).
+    """
+    reads = 0
+    for idx in path:
+        if block_id not in listings:
+            listings[block_id] = [child['id'] for child in list_block_children(notion_client, block_id)]
+            reads += 1
+        block_id = listings[block_id][idx]
+    return block_id, reads
+
+
+def subtree_fits(block, levels):
+    if count_blocks(block) > MAX_BLOCKS_PER_REQUEST:
+        return False
+    stack = [(block, levels)]
+    while stack:
+        current, remaining = stack.pop()
+        children = get_block_children(current)
+        if not children:
+            continue
+        if remaining == 0 or len(children) > MAX_CHILDREN_PER_ARRAY:
+            return False
+        stack.extend((child, remaining - 1) for child in children)
+    return True
+
+
+def inline_block(block, levels):
+    children = get_block_children(block)
+    if not children or levels == 0:
+        return with_children(block, [])
+    return with_children(block, [inline_block(child, levels - 1) for child in children])
+
+
+def with_children(block, children):
+    """
+    Copy of block for the API (no id / has_children) carrying `children`.
+    The API only takes nested children inside the type object, e.g.
+    {"toggle": {"rich_text": [...], "children": [...]}}.
+    """
+    payload = {key: value for key, value in block.items() if key not in ('id', 'has_children', 'children')}
+    content = {key: value for key, value in (block.get(block['type']) or {}).items() if key != 'children'}
+    if children or block['type'] == 'table':
+        content['children'] = children
+    payload[block['type']] = content
+    return payload
+
+
+def get_block_children(block):
+    # Blocks from html_to_notion_blocks carry their children next to the type
+    # object; payloads (and tables) inside it
+    content = block.get(block.get('type'))
+    nested = content.get('children') if isinstance(content, dict) else None
+    return block.get('children') or nested or []
+
+
+def count_blocks(block):
+    count = 0
+    stack = [block]
+    while stack:
+        current = stack.pop()
+        count += 1
+        stack.extend(get_block_children(current))
+    return count
@@ -0,0 +1,98 @@
+# app/block_loader.py
+
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .notion_api import DEFAULT_PAGE_SIZE, list_block_children
+
+# Block types whose children parse_block renders inline.  child_page / child_database
+# children belong to another page and are never fetched here.
+NESTED_BLOCK_TYPES = {
+    'paragraph',
+    'heading_1',
+    'heading_2',
+    'heading_3',
+    'bulleted_list_item',
+    'numbered_list_item',
+    'to_do',
+    'callout',
+    'table',
+    'toggle',
+    'quote'
+}
+
+DEFAULT_MAX_WORKERS = 3  # Notion allows an average of 3 requests per second
+
+_executors = {}
+_executor_lock = threading.Lock()
+
+
+def get_executor(max_workers=DEFAULT_MAX_WORKERS, name='fetch'):
+    """
+    Process-wide pools, so concurrent page views share one cap on in-flight Notion calls.
+    'fetch' runs the Notion calls; 'subtree' only waits on them (see iter_loaded_blocks).
+    """
+    with _executor_lock:
+        pool, pool_workers = _executors.get(name, (None, None))
+        if pool is None or pool_workers != max_workers:
+            if pool is not None:
+                pool.shutdown(wait=False)
+            pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f'notion-{name}')
+            _executors[name] = (pool, max_workers)
+        return pool
+
+
+def needs_children(block):
+    return block.get('has_children') and block.get('type') in NESTED_BLOCK_TYPES and 'children' not in block
+
+
+def load_block_tree(notion_client, blocks, max_workers=DEFAULT_MAX_WORKERS, page_size=DEFAULT_PAGE_SIZE, should_load=needs_children):
+    """
+    Fetch the nested children of `blocks` breadth-first and attach them in place
+    as block['children'].
+
+    All blocks of one level are fetched concurrently on the shared pool, so a
+    page costs one round of parallel calls per nesting level instead of one
+    serial call per nested block.  Rendering can then run over the in-memory tree.
+    should_load(block) picks the blocks whose children are fetched.
+    """
+    level = [block for block in blocks if should_load(block)]
+    executor = get_executor(max_workers)
+    while level:
+        futures = [executor.submit(list_block_children, notion_client, block['id'], page_size) for block in level]
+        next_level = []
+        for block, future in zip(level, futures):
+            children = future.result()
+            block['children'] = children
+            next_level.extend(child for child in children if should_load(child))
+        level = next_level
+    return blocks
+
+
+def iter_loaded_blocks(notion_client, blocks, max_workers=DEFAULT_MAX_WORKERS, page_size=DEFAULT_PAGE_SIZE, lookahead=None):
+    """
+    Yield `blocks` in order, each one as soon as its own subtree has been loaded.
+
+    `blocks` may be a lazy iterator.  Up to `lookahead` subtrees are loaded ahead
+    of the one being yielded; their Notion calls still go through the shared
+    'fetch' pool, so the overall concurrency cap is unchanged.
+    """
+    lookahead = lookahead or max_workers
+    executor = get_executor(lookahead, name='subtree')
+    pending = deque()
+    for block in blocks:
+        future = None
+        if needs_children(block):
+            future = executor.submit(load_block_tree, notion_client, [block], max_workers, page_size)
+        pending.append((block, future))
+        if len(pending) > lookahead:
+            yield _wait_for_subtree(*pending.popleft())
+    while pending:
+        yield _wait_for_subtree(*pending.popleft())
+
+
+def _wait_for_subtree(block, future):
+    if future is not None:
+        future.result()
+    return block
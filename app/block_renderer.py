@@ -0,0 +1,272 @@
+# app/block_renderer.py
+#
+# Block type -> handler registry used by parse_block.  Handlers append HTML
+# fragments to a shared list buffer which is joined once per render, instead of
+# building strings with `content += ...` at every level of the recursion.
+#
+# This module has no dependency on the Notion client; anything that needs the
+# API (fetching children that were not preloaded, looking up page titles) is
+# passed in by the caller.
+
+BLOCK_RENDERERS = {}
+
+
+def register_block_renderer(*block_types):
+    """
+    Decorator registering `handler(block, out, renderer)` for one or more block types.
+
+    The handler appends HTML strings to `out`; use renderer.render_children(block, out)
+    for nested blocks and renderer.write_rich_text(rich_text, out) for text.
+    Registering a type again replaces its handler.
+    """
+    def decorator(handler):
+        for block_type in block_types:
+            BLOCK_RENDERERS[block_type] = handler
+        return handler
+    return decorator
+
+
+class BlockRenderer:
+    """
+    Renders Notion blocks to the HTML understood by the editor and html_to_notion_blocks.
+
+    get_children(block) returns a block's children (preloaded or fetched);
+    get_page_title(page_id) resolves link_to_page titles.
+    """
+
+    def __init__(self, get_children=None, get_page_title=None, renderers=None):
+        self.get_children = get_children or (lambda block: block.get('children') or [])
+        self.get_page_title = get_page_title or (lambda page_id: 'Untitled')
+        self.renderers = BLOCK_RENDERERS if renderers is None else renderers
+
+    def render(self, block):
+        out = []
+        self.render_into(block, out)
+        return ''.join(out)
+
+    def render_blocks(self, blocks):
+        out = []
+        for block in blocks:
+            self.render_into(block, out)
+        return ''.join(out)
+
+    def render_into(self, block, out):
+        handler = self.renderers.get(block['type'], render_unsupported)
+        handler(block, out, self)
+
+    def render_children(self, block, out):
+        for child in self.get_children(block):
+            self.render_into(child, out)
+
+    def write_rich_text(self, rich_text_array, out):
+        write_rich_text(rich_text_array, out)
+
+
+def write_rich_text(rich_text_array, out):
+    append = out.append
+    for text_obj in rich_text_array:
+        annotations = text_obj.get('annotations', {})
+        text = text_obj.get('plain_text', '')
+        href = text_obj.get('href')
+
+        if annotations.get('bold'):
+            text = f'<strong>{text}</strong>'
+        if annotations.get('italic'):
+            text = f'<em>{text}</em>'
+        if annotations.get('underline'):
+            text = f'<u>{text}</u>'
+        if annotations.get('strikethrough'):
+            text = f'<s>{text}</s>'
+        color = annotations.get('color')
+        if color and color != 'default':
+            # check if color ends with 'background'：
+            if color.endswith('_background'):
+                background_color = color.replace('_background', '')
+                text = f'<span style="background-color:{background_color}">{text}</span>'
+            else:
+                text = f'<span style="color:{color}">{text}</span>'
+        if annotations.get('code'):
+            text = f'<code>{text}</code>'
+        if href:
+            text = f'<a href="{href}">{text}</a>'
+        append(text)
+
+
+def rich_text_to_html(rich_text_array):
+    out = []
+    write_rich_text(rich_text_array, out)
+    return ''.join(out)
+
+
+def render_unsupported(block, out, renderer):
+    block_type = block['type']
+    out.append(f'<p data-notion-block-type="{block_type}" data-notion-block-id="{block["id"]}">[Unsupported block type: {block_type}]</p>')
+
+
+_TEXT_BLOCK_TAGS = {
+    'paragraph': 'p',
+    'heading_1': 'h1',
+    'heading_2': 'h2',
+    'heading_3': 'h3',
+    'quote': 'blockquote'
+}
+
+
+@register_block_renderer(*_TEXT_BLOCK_TAGS)
+def render_text_block(block, out, renderer):
+    block_type = block['type']
+    tag = _TEXT_BLOCK_TAGS[block_type]
+    out.append(f'<{tag} data-notion-block-type="{block_type}" data-notion-block-id="{block["id"]}">')
+    renderer.write_rich_text(block[block_type]['rich_text'], out)
+    out.append(f'</{tag}>')
+    # 处理子块
+    if block['has_children']:
+        renderer.render_children(block, out)
+
+
+_LIST_TAGS = {
+    'bulleted_list_item': ('ul', 'bulleted_list'),
+    'numbered_list_item': ('ol', 'numbered_list')
+}
+
+
+@register_block_renderer(*_LIST_TAGS)
+def render_list_item(block, out, renderer):
+    block_type = block['type']
+    tag, list_type = _LIST_TAGS[block_type]
+    out.append(f'<{tag} data-notion-block-type="{list_type}" data-notion-block-id="{block["id"]}"><li>')
+    renderer.write_rich_text(block[block_type]['rich_text'], out)
+    # 处理子块
+    if block['has_children']:
+        out.append(f'<{tag}>')
+        renderer.render_children(block, out)
+        out.append(f'</{tag}>')
+    out.append(f'</li></{tag}>')
+
+
+@register_block_renderer('to_do')
+def render_to_do(block, out, renderer):
+    # 获取任务内容和完成状态
+    checked = block['to_do']['checked']
+    # 构建 CKEditor 的待办事项 HTML
+    checkbox = f'<input type="checkbox" tabindex="-1" {"checked" if checked else ""}>'
+    # 包装为 CKEditor 的待办事项格式
+    out.append(f'''
+        <ul class="todo-list" data-notion-block-type="to_do" data-notion-block-id="{block['id']}">
+            <li>
+                <span class="todo-list__label">
+                    <span contenteditable="false">{checkbox}</span>
+                    <span class="todo-list__label__description">''')
+    renderer.write_rich_text(block['to_do']['rich_text'], out)
+    out.append('''</span>
+                </span>
+        ''')
+    # 处理子块（如果有）
+    if block['has_children']:
+        renderer.render_children(block, out)
+    out.append('</li></ul>')
+
+
+@register_block_renderer('divider')
+def render_divider(block, out, renderer):
+    out.append(f'<hr data-notion-block-type="divider" data-notion-block-id="{block["id"]}"/>')
+
+
+@register_block_renderer('image')
+def render_image(block, out, renderer):
+    image_url = block['image'].get('file', {}).get('url', '') or block['image'].get('external', {}).get('url', '')
+    caption = rich_text_to_html(block['image'].get('caption', []))
+    out.append(f'<figure data-notion-block-type="image" data-notion-block-id="{block["id"]}"><img src="{image_url}" alt="{caption}"/><figcaption>{caption}</figcaption></figure>')
+
+
+@register_block_renderer('callout')
+def render_callout(block, out, renderer):
+    icon = block['callout'].get('icon', {}).get('emoji', '')
+    out.append(f'<div class="callout" data-notion-block-type="callout" data-notion-block-id="{block["id"]}">{icon} ')
+    renderer.write_rich_text(block['callout']['rich_text'], out)
+    # 处理子块（如果有）
+    if block['has_children']:
+        renderer.render_children(block, out)
+    out.append('</div>')
+
+
+@register_block_renderer('code')
+def render_code(block, out, renderer):
+    code_text = ''.join([t['plain_text'] for t in block['code']['rich_text']])
+    language = block['code'].get('language', '').lower()
+    code_text_escaped = code_text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+    out.append(f'<pre data-notion-block-type="code" data-notion-block-id="{block["id"]}"><code class="language-{language}">{code_text_escaped}</code></pre>')
+
+
+@register_block_renderer('file')
+def render_file(block, out, renderer):
+    file_info = block['file']
+    file_url = file_info.get('file', {}).get('url', '') or file_info.get('external', {}).get('url', '')
+    file_name = file_info.get('name', 'Download File')
+    out.append(f'<p data-notion-block-type="file" data-notion-block-id="{block["id"]}"><a href="{file_url}" download="{file_name}">{file_name}</a></p>')
+
+
+@register_block_renderer('bookmark')
+def render_bookmark(block, out, renderer):
+    url = block['bookmark']['url']
+    caption = rich_text_to_html(block['bookmark'].get('caption', []))
+    display_text = caption if caption else url
+    out.append(f'<p data-notion-block-type="bookmark" data-notion-block-id="{block["id"]}"><a href="{url}">{display_text}</a></p>')
+
+
+@register_block_renderer('link_preview')
+def render_link_preview(block, out, renderer):
+    url = block['link_preview']['url']
+    out.append(f'<p data-notion-block-type="link_preview" data-notion-block-id="{block["id"]}"><a href="{url}">{url}</a></p>')
+
+
+@register_block_renderer('link_to_page')
+def render_link_to_page(block, out, renderer):
+    block_id = block['id']
+    if block['link_to_page']['type'] == 'page_id':
+        linked_page_id = block['link_to_page']['page_id']
+        page_title = renderer.get_page_title(linked_page_id)
+        out.append(f'<p data-notion-block-type="link_to_page" data-notion-block-id="{block_id}"><a href="/page/{linked_page_id}">{page_title}</a></p>')
+    else:
+        out.append(f'<p data-notion-block-type="link_to_page" data-notion-block-id="{block_id}">[Unsupported link type]</p>')
+
+
+@register_block_renderer('table')
+def render_table(block, out, renderer):
+    has_column_header = block['table']['has_column_header']
+    out.append(f'<table data-notion-block-type="table" data-notion-block-id="{block["id"]}">')
+    for idx, row_block in enumerate(renderer.get_children(block)):
+        if row_block['type'] == 'table_row':
+            row_tag = 'th' if has_column_header and idx == 0 else 'td'
+            out.append('<tr>')
+            for cell in row_block['table_row']['cells']:
+                out.append(f'<{row_tag}>')
+                renderer.write_rich_text(cell, out)
+                out.append(f'</{row_tag}>')
+            out.append('</tr>')
+    out.append('</table>')
+
+
+@register_block_renderer('toggle')
+def render_toggle(block, out, renderer):
+    out.append(f'<details data-notion-block-type="toggle" data-notion-block-id="{block["id"]}"><summary>')
+    renderer.write_rich_text(block['toggle']['rich_text'], out)
+    out.append('</summary>')
+    # 处理子块
+    if block['has_children']:
+        renderer.render_children(block, out)
+    out.append('</details>')
+
+
+@register_block_renderer('audio')
+def render_audio(block, out, renderer):
+    audio_info = block['audio']
+    audio_url = audio_info.get('file', {}).get('url', '') or audio_info.get('external', {}).get('url', '')
+    out.append(f'<audio controls data-notion-block-type="audio" data-notion-block-id="{block["id"]}"><source src="{audio_url}">Your browser does not support the audio element.</audio>')
+
+
+@register_block_renderer('child_page')
+def render_child_page(block, out, renderer):
+    block_id = block['id']
+    page_title = block['child_page']['title']
+    out.append(f'<p data-notion-block-type="child_page" data-notion-block-id="{block_id}"><a href="/page/{block_id}">{page_title}</a></p>')
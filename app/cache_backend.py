@@ -0,0 +1,236 @@
+# app/cache_backend.py
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Content rows that are caches (rendered pages, page versions, copy progress) and
+# may be pruned; the other keys hold single pieces of state (delta_sync:state, ...)
+PRUNABLE_CONTENT = ('page_html:', 'page_version:', 'copy_job:')
+PRUNE_INTERVAL = 60
+
+
+def _to_json(value):
+    # Page tree nodes (PageNode) are logged in their plain dict shape
+    if hasattr(value, 'to_dict'):
+        return value.to_dict()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+class MemoryCacheBackend:
+    """
+    Default backend: nothing is shared, every process keeps its own cache.
+    """
+    shared = False
+
+    def record(self, op, args, since=None):
+        return [], None
+
+    def changes_since(self, seq):
+        return [], seq
+
+    def get_timestamp(self):
+        return None
+
+    def set_timestamp(self, timestamp):
+        pass
+
+    def try_lock(self, name, ttl):
+        return True
+
+    def release_lock(self, name):
+        pass
+
+    def get_content(self, key):
+        return None
+
+    def set_content(self, key, version, value):
+        pass
+
+    def delete_content(self, key):
+        pass
+
+    def prune_content(self):
+        return 0
+
+
+class SQLiteCacheBackend:
+    """
+    Host-wide cache shared by all worker processes through a SQLite file in WAL mode.
+
+    Page tree mutations are stored as an append-only log of PageTree operations.
+    Each worker replays the entries it has not seen yet, so a write made by one
+    worker reaches the others without rebuilding the tree from Notion.  A
+    'replace' entry carries a full tree and lets older entries be compacted.
+    Rendered content is kept in a plain key/value table; cached rows
+    (PRUNABLE_CONTENT) not written for content_max_age seconds, or beyond the
+    content_max_entries most recently written, are pruned once a minute.
+    """
+    shared = True
+
+    def __init__(self, path, content_max_age=7 * 86400, content_max_entries=10000):
+        self.path = path
+        self.content_max_age = content_max_age
+        self.content_max_entries = content_max_entries
+        self._last_prune = 0.0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS tree_changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                op TEXT NOT NULL,
+                args TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS content (
+                key TEXT PRIMARY KEY,
+                version TEXT,
+                value TEXT,
+                updated REAL
+            );
+            CREATE INDEX IF NOT EXISTS content_updated ON content (updated);
+        ''')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=10000')
+            self._local.conn = conn
+        return conn
+
+    def record(self, op, args, since=0):
+        """
+        Append an operation to the log.
+
+        Returns (changes, seq): the entries after `since` that were written by
+        other workers before this one, and the seq assigned to this entry.  Both
+        are read in the same write transaction, so the caller can replay them in
+        log order before applying its own change locally.
+        """
+        conn = self._conn()
+        payload = json.dumps(args, ensure_ascii=False, default=_to_json)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute(
+                'SELECT seq, op, args FROM tree_changes WHERE seq > ? ORDER BY seq', (since or 0,)
+            ).fetchall()
+            seq = conn.execute('INSERT INTO tree_changes (op, args) VALUES (?, ?)', (op, payload)).lastrowid
+            if op == 'replace':
+                # The full tree supersedes everything recorded before it
+                conn.execute('DELETE FROM tree_changes WHERE seq < ?', (seq,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return [(row[0], row[1], json.loads(row[2])) for row in rows], seq
+
+    def changes_since(self, seq):
+        """
+        Returns ([(seq, op, args), ...], last_seq) for entries newer than seq.
+        """
+        rows = self._conn().execute(
+            'SELECT seq, op, args FROM tree_changes WHERE seq > ? ORDER BY seq', (seq or 0,)
+        ).fetchall()
+        if not rows:
+            return [], seq
+        return [(row[0], row[1], json.loads(row[2])) for row in rows], rows[-1][0]
+
+    def get_timestamp(self):
+        row = self._conn().execute("SELECT value FROM meta WHERE key = 'timestamp'").fetchone()
+        return float(row[0]) if row and row[0] is not None else None
+
+    def set_timestamp(self, timestamp):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('timestamp', ?)", (str(timestamp),)
+        )
+
+    def try_lock(self, name, ttl):
+        """
+        Host-wide advisory lock with a TTL, so a crashed holder cannot block others forever.
+        """
+        conn = self._conn()
+        key = f'lock:{name}'
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+            if row and float(row[0]) > now:
+                conn.execute('COMMIT')
+                return False
+            conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(now + ttl)))
+            conn.execute('COMMIT')
+            return True
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def release_lock(self, name):
+        self._conn().execute('DELETE FROM meta WHERE key = ?', (f'lock:{name}',))
+
+    def get_content(self, key):
+        """
+        Returns (version, value) or None.
+        """
+        row = self._conn().execute('SELECT version, value FROM content WHERE key = ?', (key,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set_content(self, key, version, value):
+        now = time.time()
+        self._conn().execute(
+            'INSERT OR REPLACE INTO content (key, version, value, updated) VALUES (?, ?, ?, ?)',
+            (key, version, value, now)
+        )
+        if now - self._last_prune >= PRUNE_INTERVAL:
+            self._last_prune = now
+            try:
+                self.prune_content()
+            except sqlite3.Error as e:
+                print(f"Error pruning cached content: {e}")
+
+    def delete_content(self, key):
+        self._conn().execute('DELETE FROM content WHERE key = ?', (key,))
+
+    def prune_content(self):
+        """
+        Delete cached rows older than content_max_age and those beyond the
+        content_max_entries most recently written.  Returns the rows deleted.
+        """
+        cached = '(' + ' OR '.join('key GLOB ?' for _ in PRUNABLE_CONTENT) + ')'
+        patterns = [prefix + '*' for prefix in PRUNABLE_CONTENT]
+        conn = self._conn()
+        deleted = conn.execute(
+            f'DELETE FROM content WHERE updated < ? AND {cached}',
+            [time.time() - self.content_max_age] + patterns
+        ).rowcount
+        deleted += conn.execute(
+            f'DELETE FROM content WHERE key IN (SELECT key FROM content WHERE {cached} ORDER BY updated DESC LIMIT -1 OFFSET ?)',
+            patterns + [self.content_max_entries]
+        ).rowcount
+        return deleted
+
+
+def create_cache_backend(config):
+    """
+    Pick the cache backend from config: "memory" (default) or "sqlite".
+    """
+    backend = config.get('cache_backend', 'memory')
+    if backend == 'sqlite':
+        return SQLiteCacheBackend(
+            config.get('cache_db_path', 'app/cache/notion_cache.db'),
+            content_max_age=config.get('cache_content_max_age', 7 * 86400),
+            content_max_entries=config.get('cache_content_max_entries', 10000)
+        )
+    if backend == 'memory':
+        return MemoryCacheBackend()
+    raise ValueError(f"Unknown cache_backend: {backend}")
@@ -1,16 +1,21 @@
 import re
+from functools import lru_cache
+
+# 优化后的正则表达式：
+# - \s* 匹配可选的空格
+# - (\d+(?:\.\d+)?) 匹配整数或浮点数
+HSL_PATTERN = re.compile(r'hsl\(\s*(\d+(?:\.\d+)?)\s*,\s*(\d+(?:\.\d+)?)%\s*,\s*(\d+(?:\.\d+)?)%\s*\)\s*;?', re.IGNORECASE)
+HEX_PATTERN = re.compile(r'^#([0-9a-f]{3}|[0-9a-f]{6})$')
+
+# Distinct colour strings remembered per function; a page only uses a handful
+COLOR_CACHE_SIZE = 1024
 
 def parse_hsl(hsl_str):
     """
     解析 HSL 字符串，返回 (h, s, l)
     支持带或不带分号，并允许各部分有可选空格。
     """
-    # 优化后的正则表达式：
-    # - \s* 匹配可选的空格
-    # - (\d+(?:\.\d+)?) 匹配整数或浮点数
-    pattern = r'hsl\(\s*(\d+(?:\.\d+)?)\s*,\s*(\d+(?:\.\d+)?)%\s*,\s*(\d+(?:\.\d+)?)%\s*\)\s*;?'
-    
-    match = re.match(pattern, hsl_str.strip(), re.IGNORECASE)
+    match = HSL_PATTERN.match(hsl_str.strip())
     if not match:
         raise ValueError(f"Invalid HSL format: {hsl_str}")
     
@@ -27,6 +32,17 @@ def hsl_to_color_name(h, s, l):
     """
     根据 HSL 值映射到指定的颜色名称
     """
+    if h.__class__ is int or (h.__class__ is float and h.is_integer()):
+        # Integer hues (all of them for hex colours) come from the tables
+        if s < 10:
+            return "gray"
+        hue = int(h)
+        if hue in BROWN_HUES and s >= 30 and l <= 50:
+            return "brown"
+        return HUE_NAMES[hue] if 0 <= hue <= 360 else _hsl_to_color_name(h, s, l)
+    return _hsl_to_color_name(h, s, l)
+
+def _hsl_to_color_name(h, s, l):
     if s < 10:
         return "gray"
     
@@ -50,6 +66,11 @@ def hsl_to_color_name(h, s, l):
     else:
         return "default"
 
+# Precomputed hue -> name for every integer hue; brown only applies to dark, saturated colours in BROWN_HUES
+HUE_NAMES = tuple(_hsl_to_color_name(hue, 100, 100) for hue in range(361))
+BROWN_HUES = frozenset(range(20, 41))
+
+@lru_cache(maxsize=COLOR_CACHE_SIZE)
 def hsl_to_css_color_name_notion(hsl_str):
     """
     将 HSL 字符串转换为指定的 CSS 颜色名称
@@ -68,8 +89,7 @@ def parse_hex(hex_str):
     支持 #rgb 和 #rrggbb 格式
     """
     hex_str = hex_str.strip().lower()
-    pattern = r'^#([0-9a-f]{3}|[0-9a-f]{6})$'
-    match = re.match(pattern, hex_str)
+    match = HEX_PATTERN.match(hex_str)
     if not match:
         raise ValueError(f"Invalid hex color format: {hex_str}")
     
@@ -122,6 +142,7 @@ def rgb_to_hsl(r, g, b):
     
     return h_deg % 360, s_pct, l_pct
 
+@lru_cache(maxsize=COLOR_CACHE_SIZE)
 def hex_to_css_color_name_limited(hex_str):
     """
     将十六进制颜色字符串转换为指定的 CSS 颜色名称
@@ -135,6 +156,50 @@ def hex_to_css_color_name_limited(hex_str):
         return "default"
 
 
+@lru_cache(maxsize=COLOR_CACHE_SIZE)
+def style_to_notion_color(style):
+    """
+    Notion color for the style attribute of an editor <span> ("color:..." or
+    "background-color:..."), or None if it sets no colour.
+    """
+    if 'color' in style and 'background-color' not in style:
+        text_color = style.replace('color:', '').replace(';', '')
+        # check if hsl color, convert to css color name
+        if 'hsl' in text_color:
+            return hsl_to_css_color_name_notion(text_color)
+        # check if rgb hex (#rrggbb or #rgb) color, convert to css color name
+        if '#' in text_color:
+            return hex_to_css_color_name_limited(text_color)
+        if 'black' in text_color or 'white' in text_color:
+            return "default"
+        return text_color
+    if 'background-color' in style:
+        text_color = style.replace('background-color:', '').replace(';', '')
+        if 'hsl' in text_color:
+            return hsl_to_css_color_name_notion(text_color) + '_background'
+        return text_color + '_background'
+    return None
+
+
+def classify_styles(styles):
+    """
+    Batch form of style_to_notion_color: {style: Notion color or None} for every
+    distinct style string, e.g. all the <span style> values of a page.
+    """
+    return {style: style_to_notion_color(style) for style in set(styles)}
+
+
+def get_color_cache_stats():
+    return {
+        name: func.cache_info()._asdict()
+        for name, func in (
+            ('style', style_to_notion_color),
+            ('hsl', hsl_to_css_color_name_notion),
+            ('hex', hex_to_css_color_name_limited)
+        )
+    }
+
+
 
 
 
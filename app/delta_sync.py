@@ -0,0 +1,174 @@
+# app/delta_sync.py
+#
+# Picks up edits made directly in Notion without waiting for the page tree to
+# expire.  Notion's search endpoint can be sorted by last_edited_time, so one
+# call per interval (more only when many pages changed) returns every page
+# edited since the last poll; only those pages are patched in the tree and
+# dropped from the rendered page cache.
+
+import json
+import threading
+import time
+from datetime import datetime, timezone
+
+SEARCH_PAGE_SIZE = 100
+# Edits show up in search a little after they are made; a minute is only taken as over this much later
+SETTLE_SECONDS = 120
+
+
+def to_notion_time(timestamp):
+    """
+    Unix time -> Notion's timestamp format ("2024-01-01T12:00:00.000Z"), which sorts as a string.
+    """
+    moment = datetime.fromtimestamp(timestamp, timezone.utc)
+    return moment.strftime('%Y-%m-%dT%H:%M:%S.') + f'{moment.microsecond // 1000:03d}Z'
+
+
+class DeltaSync:
+    """
+    Polls search (pages, newest last_edited_time first) back to a watermark.
+
+    apply_change(page) patches the caches for one changed page object.  If a
+    poll hits max_pages before reaching the watermark, on_overflow() is called
+    instead (e.g. a full rebuild) and the watermark jumps to the newest edit.
+
+    Notion truncates last_edited_time to the minute, so pages stamped exactly
+    with the watermark are fetched again on the next poll.  While that minute
+    can still get edits (a rename seconds after the first one carries the same
+    time) they are applied again, which is harmless; once it is over
+    (SETTLE_SECONDS later) their ids are remembered and skipped.  The
+    watermark is kept in the shared backend, so a restarted or different
+    worker carries on from it and only one process polls at a time (the
+    'delta_sync' lock).
+    """
+
+    LOCK_NAME = 'delta_sync'
+    STATE_KEY = 'delta_sync:state'
+
+    def __init__(self, notion_client, apply_change, on_overflow, backend=None, interval=30, max_pages=10, initial_watermark=None):
+        self.notion = notion_client
+        self.apply_change = apply_change
+        self.on_overflow = on_overflow
+        self.backend = backend
+        self.interval = interval
+        self.max_pages = max_pages
+        self._state = {'watermark': initial_watermark or to_notion_time(time.time()), 'seen': []}
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'polls': 0,
+            'search_calls': 0,
+            'changes': 0,
+            'overflows': 0,
+            'errors': 0,
+            'last_poll_at': None
+        }
+
+    def start(self):
+        """
+        Start this process's polling thread (once).
+        """
+        with self._thread_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._thread = threading.Thread(target=self._run, name='notion-delta-sync', daemon=True)
+            self._thread.start()
+            return True
+
+    def _run(self):
+        while True:
+            try:
+                self.poll_once()
+            except Exception as e:
+                self._count(errors=1)
+                print(f"Error syncing Notion changes: {e}")
+            time.sleep(self.interval)
+
+    def poll_once(self):
+        """
+        Apply the pages edited since the watermark; returns how many, or None if another process polls.
+        """
+        if self.backend is not None and not self.backend.try_lock(self.LOCK_NAME, self.interval * 2 + 60):
+            return None
+        try:
+            state = self._load_state()
+            changes, calls, complete = self._fetch_changes(state['watermark'], set(state['seen']))
+            self._count(polls=1, search_calls=calls)
+            if not complete:
+                self._count(overflows=1)
+                self.on_overflow()
+            else:
+                # Oldest first, so the latest state of the tree wins
+                for page in reversed(changes):
+                    self.apply_change(page)
+            self._count(changes=len(changes))
+            self._save_state(self._advance(state, changes, time.time()))
+            with self._stats_lock:
+                self.stats['last_poll_at'] = time.time()
+            return len(changes)
+        finally:
+            if self.backend is not None:
+                self.backend.release_lock(self.LOCK_NAME)
+
+    def _fetch_changes(self, watermark, seen):
+        # Returns (pages edited at or after watermark, search calls, reached the watermark)
+        changes = []
+        cursor = None
+        for calls in range(1, self.max_pages + 1):
+            kwargs = {
+                'filter': {'property': 'object', 'value': 'page'},
+                'sort': {'direction': 'descending', 'timestamp': 'last_edited_time'},
+                'page_size': SEARCH_PAGE_SIZE
+            }
+            if cursor:
+                kwargs['start_cursor'] = cursor
+            response = self.notion.search(**kwargs)
+            for page in response.get('results', []):
+                edited = page.get('last_edited_time') or ''
+                if edited < watermark:
+                    return changes, calls, True
+                if edited == watermark and page['id'] in seen:
+                    continue
+                changes.append(page)
+            if not response.get('has_more') or not response.get('next_cursor'):
+                return changes, calls, True
+            cursor = response['next_cursor']
+        return changes, self.max_pages, False
+
+    @staticmethod
+    def _advance(state, changes, now):
+        watermark = state['watermark']
+        seen = set(state['seen'])
+        for page in changes:
+            edited = page.get('last_edited_time') or ''
+            if edited > watermark:
+                watermark = edited
+                seen = set()
+        # Only skip pages of a minute that can no longer get edits (see the class docstring)
+        if watermark[:16] < to_notion_time(now - SETTLE_SECONDS)[:16]:
+            seen.update(page['id'] for page in changes if page.get('last_edited_time') == watermark)
+        return {'watermark': watermark, 'seen': sorted(seen)}
+
+    def _load_state(self):
+        if self.backend is not None and self.backend.shared:
+            stored = self.backend.get_content(self.STATE_KEY)
+            if stored:
+                self._state = json.loads(stored[1])
+        return self._state
+
+    def _save_state(self, state):
+        self._state = state
+        if self.backend is not None and self.backend.shared:
+            self.backend.set_content(self.STATE_KEY, state['watermark'], json.dumps(state))
+
+    def _count(self, **amounts):
+        with self._stats_lock:
+            for key, amount in amounts.items():
+                self.stats[key] += amount
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats['watermark'] = self._state['watermark']
+        return stats
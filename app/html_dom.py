@@ -0,0 +1,303 @@
+# app/html_dom.py
+#
+# Parser backends for html_to_notion_blocks.
+#
+# "fast" builds a light element tree in one pass over html.parser.HTMLParser
+# events.  It mirrors what BeautifulSoup's html.parser builder produces
+# (same nesting rules, void elements, whitespace handling, multi-valued
+# class attribute) and implements the small part of the bs4 Tag API the
+# converter uses: name, attrs, contents, get, has_attr, [], find, find_all
+# and get_text.  Skipping bs4's tree builder makes parsing several times
+# cheaper on large editor pastes.
+#
+# "html.parser" and "lxml" return a BeautifulSoup tree as before; lxml is an
+# optional dependency and is only imported when selected.
+
+from html import unescape
+from html.entities import html5
+from html.parser import HTMLParser
+
+PARSER_BACKENDS = ('fast', 'html.parser', 'lxml')
+
+# As in bs4's HTMLTreeBuilder
+VOID_ELEMENTS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'menuitem',
+    'meta', 'param', 'source', 'track', 'wbr', 'basefont', 'bgsound', 'command', 'frame',
+    'image', 'isindex', 'nextid', 'spacer'
+}
+PRESERVE_WHITESPACE_ELEMENTS = {'pre', 'textarea'}
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+
+
+class TextNode(str):
+    """
+    A text child; a str, like bs4's NavigableString.
+    """
+    __slots__ = ()
+
+
+class SpecialString(TextNode):
+    """
+    Comment, declaration or processing instruction: kept in contents, left out of get_text().
+    """
+    __slots__ = ()
+
+
+class ContainedString(TextNode):
+    """
+    Text inside <script>, <style>, ...: only part of that element's own get_text().
+    """
+    __slots__ = ()
+
+
+# As bs4's string containers
+CONTAINER_STRINGS = {
+    name: type(f'{name.capitalize()}String', (ContainedString,), {'__slots__': ()})
+    for name in ('script', 'style', 'template', 'rt', 'rp')
+}
+
+
+class Element:
+    __slots__ = ('name', 'attrs', 'contents', 'parent')
+
+    def __init__(self, name, attrs, parent=None):
+        self.name = name
+        self.attrs = attrs
+        self.contents = []
+        self.parent = parent
+
+    def get(self, key, default=None):
+        return self.attrs.get(key, default)
+
+    def has_attr(self, key):
+        return key in self.attrs
+
+    def __getitem__(self, key):
+        return self.attrs[key]
+
+    def __contains__(self, item):
+        return item in self.contents
+
+    def __len__(self):
+        return len(self.contents)
+
+    def __bool__(self):
+        return True
+
+    def __eq__(self, other):
+        # Structural, like bs4's Tag.__eq__
+        if self is other:
+            return True
+        if not isinstance(other, Element) or self.name != other.name or self.attrs != other.attrs or len(self.contents) != len(other.contents):
+            return False
+        return all(mine == theirs for mine, theirs in zip(self.contents, other.contents))
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = object.__hash__
+
+    def __repr__(self):
+        return f'<{self.name} {self.attrs!r}>'
+
+    def iter_descendants(self):
+        """
+        Every node below this one, in document order.
+        """
+        stack = [iter(self.contents)]
+        while stack:
+            for node in stack[-1]:
+                yield node
+                if isinstance(node, Element) and node.contents:
+                    stack.append(iter(node.contents))
+                    break
+            else:
+                stack.pop()
+
+    def find_all(self, name=None, recursive=True, class_=None, **attrs):
+        matches = _matcher(name, class_, attrs)
+        nodes = self.iter_descendants() if recursive else self.contents
+        return [node for node in nodes if isinstance(node, Element) and matches(node)]
+
+    def find(self, name=None, recursive=True, class_=None, **attrs):
+        matches = _matcher(name, class_, attrs)
+        nodes = self.iter_descendants() if recursive else self.contents
+        for node in nodes:
+            if isinstance(node, Element) and matches(node):
+                return node
+        return None
+
+    def get_text(self):
+        wanted = CONTAINER_STRINGS.get(self.name, TextNode)
+        return ''.join(node for node in self.iter_descendants() if type(node) is wanted)
+
+    @property
+    def text(self):
+        return self.get_text()
+
+
+def _matcher(name, class_, attrs):
+    if isinstance(name, str):
+        names = (name,)
+    else:
+        names = tuple(name) if name else None
+
+    def matches(element):
+        if names is not None and element.name not in names:
+            return False
+        if class_ is not None:
+            classes = element.attrs.get('class')
+            if classes is None:
+                return False
+            if class_ not in classes and ' '.join(classes) != class_:
+                return False
+        for key, value in attrs.items():
+            if element.attrs.get(key) != value:
+                return False
+        return True
+    return matches
+
+
+class _TreeBuilder(HTMLParser):
+    # Replays BeautifulSoup's handling of html.parser events (bs4/builder/_htmlparser.py)
+
+    def __init__(self):
+        # References are resolved below, the way bs4 does it
+        super().__init__(convert_charrefs=False)
+        self.root = Element('[document]', {})
+        self.stack = [self.root]
+        self.open_counts = {}
+        self.data = []
+        self.containers = []  # open elements whose text is a ContainedString
+        self.already_closed_void = {}  # name -> void elements closed without an end tag yet
+
+    def handle_starttag(self, tag, attrs, handle_void=True):
+        self.flush()
+        attr_dict = {}
+        for key, value in attrs:
+            attr_dict[key] = '' if value is None else value
+        if 'class' in attr_dict:
+            attr_dict['class'] = attr_dict['class'].split()
+        element = Element(tag, attr_dict, self.stack[-1])
+        self.stack[-1].contents.append(element)
+        self.stack.append(element)
+        self.open_counts[tag] = self.open_counts.get(tag, 0) + 1
+        if tag in CONTAINER_STRINGS:
+            self.containers.append(element)
+        if handle_void and tag in VOID_ELEMENTS:
+            self.handle_endtag(tag, check_already_closed=False)
+            self.already_closed_void[tag] = self.already_closed_void.get(tag, 0) + 1
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs, handle_void=False)
+        self.handle_endtag(tag, check_already_closed=False)
+
+    def handle_endtag(self, tag, check_already_closed=True):
+        if check_already_closed and self.already_closed_void.get(tag):
+            # e.g. the </br> of <br></br>
+            self.already_closed_void[tag] -= 1
+            return
+        self.flush()
+        if not self.open_counts.get(tag):
+            return
+        # Close everything up to the most recent open element of that name
+        while len(self.stack) > 1:
+            element = self.stack.pop()
+            self.open_counts[element.name] -= 1
+            if self.containers and self.containers[-1] is element:
+                self.containers.pop()
+            if element.name == tag:
+                break
+
+    def handle_data(self, data):
+        self.data.append(data)
+
+    def handle_charref(self, name):
+        self.data.append(unescape(f'&#{name};'))
+
+    def handle_entityref(self, name):
+        # An unknown name stays literal (without its ';'), as in bs4
+        self.data.append(html5.get(name + ';', f'&{name}'))
+
+    def handle_comment(self, data):
+        self._special(data)
+
+    def handle_decl(self, decl):
+        # bs4 drops the first 8 characters ("DOCTYPE ") of any declaration
+        self._special(decl[len('DOCTYPE '):])
+
+    def unknown_decl(self, data):
+        if data.upper().startswith('CDATA['):
+            # CDATA counts as text, as bs4's CData does
+            self._special(data[len('CDATA['):], TextNode)
+        else:
+            self._special(data)
+
+    def handle_pi(self, data):
+        self._special(data)
+
+    def _special(self, data, node_class=SpecialString):
+        self.flush()
+        self.data.append(data)
+        self.flush(node_class)
+
+    def flush(self, node_class=TextNode):
+        if not self.data:
+            return
+        if node_class is TextNode and self.containers:
+            node_class = CONTAINER_STRINGS[self.containers[-1].name]
+        text = ''.join(self.data)
+        self.data = []
+        if not text.strip(ASCII_SPACES) and not any(self.open_counts.get(name) for name in PRESERVE_WHITESPACE_ELEMENTS):
+            # Whitespace-only strings are collapsed as bs4 does
+            text = '\n' if '\n' in text else ' '
+        self.stack[-1].contents.append(node_class(text))
+
+    def close(self):
+        super().close()
+        self.flush()
+
+
+try:
+    from bs4.element import CData, NavigableString
+    PLAIN_TEXT_TYPES = (TextNode, NavigableString, CData)
+except ImportError:
+    PLAIN_TEXT_TYPES = (TextNode,)
+
+
+def is_plain_text(node):
+    """
+    True for document text on any backend (not a comment, script, ... string).
+    """
+    return type(node) in PLAIN_TEXT_TYPES
+
+
+def parse_fast(html_content):
+    builder = _TreeBuilder()
+    builder.feed(html_content)
+    builder.close()
+    return builder.root
+
+
+def parse_html(html_content, backend='fast'):
+    """
+    Parse an HTML fragment; the result supports find_all(recursive=False) for the top-level elements.
+    """
+    if backend == 'fast':
+        return parse_fast(html_content)
+    from bs4 import BeautifulSoup
+    if backend == 'html.parser':
+        return BeautifulSoup(html_content, 'html.parser')
+    if backend == 'lxml':
+        soup = BeautifulSoup(html_content, 'lxml')
+        # lxml wraps a fragment in <html><body>
+        return soup.body or soup
+    raise ValueError(f"Unknown html parser backend: {backend}")
+
+
+def lxml_available():
+    try:
+        import lxml  # noqa: F401
+    except ImportError:
+        return False
+    return True
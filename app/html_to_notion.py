@@ -0,0 +1,577 @@
+# app/html_to_notion.py
+#
+# Editor HTML -> Notion blocks (the reverse of block_renderer.py).  The
+# converter only uses the part of the bs4 API that html_dom's light tree
+# also provides, so the parser backend can be chosen per config.
+
+import re
+
+from .color_converter import style_to_notion_color
+from .html_dom import PARSER_BACKENDS, is_plain_text, lxml_available, parse_html
+
+html_parser = 'fast'
+
+
+def set_html_parser(name):
+    """
+    Select the parser backend: "fast" (default), "html.parser" (BeautifulSoup) or "lxml".
+    """
+    global html_parser
+    if name not in PARSER_BACKENDS:
+        raise ValueError(f"Unknown html_parser: {name}")
+    if name == 'lxml' and not lxml_available():
+        print("lxml is not installed, using the fast html parser")
+        name = 'fast'
+    html_parser = name
+
+
+def html_to_notion_blocks(html_content, parser=None):
+    soup = parse_html(html_content, parser or html_parser)
+    blocks = []
+    elements=soup.find_all(recursive=False)
+    for element in elements:
+        block = element_to_notion_block(element)
+        
+        # Check if block is a list
+        if isinstance(block, list):
+            for item in block:
+                if isinstance(item, dict) and 'type' in item:  # Ensure each item in list has 'type'
+                    blocks.append(item)
+        
+        # Check if block is an object with 'type' attribute
+        elif isinstance(block, dict) and 'type' in block:
+            blocks.append(block)
+    
+    return blocks
+
+
+def element_to_notion_block(element):
+    # 初始化 block_type
+    block_type = element.get('data-notion-block-type')
+
+    # 如果没有 data-notion-block-type，根据元素类型和类名判断 block_type
+    if not block_type:
+        if element.name == 'p':
+            block_type = 'paragraph'
+        elif element.name == 'h1':
+            block_type = 'heading_1'
+        elif element.name == 'h2':
+            block_type = 'heading_2'
+        elif element.name == 'h3':
+            block_type = 'heading_3'
+        elif element.name == 'h4':
+            block_type = 'heading_3'
+        elif element.name == 'h5':
+            block_type = 'heading_3'
+        elif element.name == 'ul' and 'todo-list' in element.get('class', []):
+            block_type = 'to_do'
+        elif element.name == 'ul':
+            block_type = 'bulleted_list'
+        elif element.name == 'ol':
+            block_type = 'numbered_list'
+        elif element.name == 'hr':
+            block_type = 'divider'
+        elif element.name == 'pre' and element.find('code'):
+            block_type = 'code'
+        elif element.name == 'figure':
+            if element.find('img'):
+                block_type = 'image'
+            elif element.find('table'):
+                block_type = 'table'
+            else:
+                block_type = 'unsupported'
+        elif element.name == 'blockquote':
+            block_type = 'quote'
+        elif element.name == 'table':
+            block_type = 'table'
+        else:
+            block_type = 'unsupported'
+
+    # 开始根据 block_type 构建对应的 Notion 块
+    if block_type == 'paragraph':
+        block = {
+            "type": "paragraph",
+            "paragraph": {
+                "rich_text": html_to_rich_text(element),
+                "color": "default"
+            }
+        }
+        block_id = element.get('data-notion-block-id')
+        if block_id:
+            block['id'] = block_id
+        return block
+
+    #<details data-notion-block-type="toggle"> <summary>111</summary> <p data-notion-block-type="paragraph"> Write something </p> </details>
+    elif block_type == 'toggle':
+        summary = element.find('summary')
+        block = {
+            "type": "toggle",
+            "toggle": {
+                "rich_text": html_to_rich_text(summary)
+            },
+            "children": []
+        }
+        block_id = element.get('data-notion-block-id')
+        if block_id:
+            block['id'] = block_id
+        # 处理子元素
+        for child_element in element.find_all(recursive=False):
+            if child_element != summary:
+                child_block = element_to_notion_block(child_element)
+
+                # Check if a child-block is a list(eg. ul, ol)
+                if isinstance(child_block, list):
+                    for item in child_block:
+                        if isinstance(item, dict) and 'type' in item:  # Ensure each item in list has 'type'
+                            block["children"].append(item) # blocks.append(item)
+                elif child_block:
+                    block["children"].append(child_block)
+        return block
+
+
+
+    elif block_type == 'toggle':
+        block = {
+            "type": "toggle",
+            "toggle": {
+                "rich_text": html_to_rich_text(element.find('summary')),
+                "color": "default"
+            }
+        }
+        block_id = element.get('data-notion-block-id')
+        if block_id:
+            block['id'] = block_id
+        return block
+
+    elif block_type in ['heading_1', 'heading_2', 'heading_3']:
+        block = {
+            "type": block_type,
+            block_type: {
+                "rich_text": html_to_rich_text(element),
+                "color": "default",
+                "is_toggleable": False
+            }
+        }
+        block_id = element.get('data-notion-block-id')
+        if block_id:
+            block['id'] = block_id
+        return block
+
+    elif block_type in ['link_to_page', 'child_page']: # child_page - NOT WORKING
+
+        '''
+        <p data-notion-block-type="link_to_page" data-notion-block-id="135012cb-4981-815c-9e5a-e6de0edfb39b">
+            <a href="/page/135012cb-4981-8013-be94-e659e8bd472e">sub-1</a>
+        </p>
+        '''
+        href = element.find('a').get('href')
+        sub_id= href.split('/')[-1]
+
+        block = {
+                "type": "link_to_page",
+                "link_to_page": {
+                    "type": "page_id",
+                    "page_id": sub_id
+                }
+            }
+
+        block_id = element.get('data-notion-block-id')
+        if block_id:
+            block['id'] = block_id
+        return block
+
+
+
+
+
+    elif block_type == 'to_do':
+        blocks = []
+        items = element.find_all('li', recursive=False)
+        for li in items:
+            # CKEditor 输出 <label>，block_renderer 输出 <span>
+            label = li.find(['label', 'span'], class_='todo-list__label', recursive=False)
+            if label:
+                checkbox_input = label.find('input', type='checkbox')
+                checked = checkbox_input.has_attr('checked') if checkbox_input else False
+                description_span = label.find('span', class_='todo-list__label__description')
+                text = html_to_rich_text(description_span)
+                block = {
+                    "type": "to_do",
+                    "to_do": {
+                        "rich_text": text,
+                        "checked": checked,
+                        "color": "default"
+                    }
+                }
+                block_id = list_item_block_id(element, li, items)
+                if block_id:
+                    block['id'] = block_id
+                # 处理子任务（嵌套的 to_do_list，parse_block 把每个子任务放在各自的 <ul> 里）
+                children_blocks = []
+                for sub_list in li.find_all('ul', class_='todo-list', recursive=False):
+                    children_blocks.extend(element_to_notion_block(sub_list))
+                if children_blocks:
+                    block['has_children'] = True
+                    block['children'] = children_blocks
+                blocks.append(block)
+        return blocks
+
+    elif block_type in ['bulleted_list', 'numbered_list']:
+        list_type = 'bulleted_list_item' if block_type == 'bulleted_list' else 'numbered_list_item'
+        blocks = []
+        items = element.find_all('li', recursive=False)
+        for li in items:
+            text = html_to_rich_text(li, skip=('ul', 'ol'))
+            block = {
+                "type": list_type,
+                list_type: {
+                    "rich_text": text,
+                    "color": "default"
+                }
+            }
+            block_id = list_item_block_id(element, li, items)
+            if block_id:
+                block['id'] = block_id
+            # 处理嵌套列表
+            children_blocks = []
+            for sub_list in li.find_all(['ul', 'ol'], recursive=False):
+                children_blocks.extend(list_children_to_notion_blocks(sub_list))
+            if children_blocks:
+                block['has_children'] = True
+                block['children'] = children_blocks
+            blocks.append(block)
+        return blocks
+
+    elif block_type == 'divider':
+        block = {
+            "type": "divider",
+            "divider": {}
+        }
+        block_id = element.get('data-notion-block-id')
+        if block_id:
+            block['id'] = block_id
+        return block
+
+    elif block_type == 'code':
+        code_element = element.find('code')
+        code_text = code_element.get_text() if code_element else ''
+        language_class = code_element.get('class', [])
+        language = 'python'
+        # body.children[0].code.language should be `"abap"`, `"agda"`, `"arduino"`, `"ascii art"`, `"assembly"`, `"bash"`, `"basic"`, `"bnf"`, `"c"`, `"c#"`, `"c++"`, `"clojure"`, `"coffeescript"`, `"coq"`, `"css"`, `"dart"`, `"dhall"`, `"diff"`, `"docker"`, `"ebnf"`, `"elixir"`, `"elm"`, `"erlang"`, `"f#"`, `"flow"`, `"fortran"`, `"gherkin"`, `"glsl"`, `"go"`, `"graphql"`, `"groovy"`, `"haskell"`, `"hcl"`, `"html"`, `"idris"`, `"java"`, `"javascript"`, `"json"`, `"julia"`, `"kotlin"`, `"latex"`, `"less"`, `"lisp"`, `"livescript"`, `"llvm ir"`, `"lua"`, `"makefile"`, `"markdown"`, `"markup"`, `"matlab"`, `"mathematica"`, `"mermaid"`, `"nix"`, `"notion formula"`, `"objective-c"`, `"ocaml"`, `"pascal"`, `"perl"`, `"php"`, `"plain text"`, `"powershell"`, `"prolog"`, `"protobuf"`, `"purescript"`, `"python"`, `"r"`, `"racket"`, `"reason"`, `"ruby"`, `"rust"`, `"sass"`, `"scala"`, `"scheme"`, `"scss"`, `"shell"`, `"solidity"`, `"sql"`, `"swift"`, `"toml"`, `"typescript"`, `"vb.net"`, `"verilog"`, `"vhdl"`, `"visual basic"`, `"webassembly"`, `"xml"`, `"yaml"`, `"java/c/c++/c#"`, or `"notionscript"`
+        for cls in language_class:
+            if cls.startswith('language-'):
+                language = cls.replace('language-', '')
+                break
+        block = {
+            "type": "code",
+            "code": {
+                "rich_text": [{
+                    "type": "text",
+                    "text": {
+                        "content": code_text,
+                        "link": None
+                    },
+                    "plain_text": code_text,
+                    "href": None,
+                    "annotations": {
+                        "bold": False,
+                        "italic": False,
+                        "strikethrough": False,
+                        "underline": False,
+                        "code": False,
+                        "color": "default"
+                    }
+                }],
+                "language": language
+            }
+        }
+        block_id = element.get('data-notion-block-id')
+        if block_id:
+            block['id'] = block_id
+        return block
+
+    elif block_type == 'image':
+        img_tag = element.find('img')
+        if img_tag:
+            image_url = img_tag.get('src')
+            caption_element = element.find('figcaption')
+            caption = caption_element.get_text() if caption_element else ''
+            block = {
+                "type": "image",
+                "image": {
+                    "type": "external",
+                    "external": {
+                        "url": image_url
+                    },
+                    "caption": [{
+                        "type": "text",
+                        "text": {
+                            "content": caption,
+                            "link": None
+                        },
+                        "plain_text": caption,
+                        "href": None,
+                        "annotations": {
+                            "bold": False,
+                            "italic": False,
+                            "strikethrough": False,
+                            "underline": False,
+                            "code": False,
+                            "color": "default"
+                        }
+                    }]
+                }
+            }
+            block_id = element.get('data-notion-block-id')
+            if block_id:
+                block['id'] = block_id
+            return block
+
+    elif block_type == 'table':
+        # 处理表格
+        table_element = element.find('table') if element.name == 'figure' else element
+        if table_element:
+            rows = []
+            for tr in table_element.find_all('tr'):
+                cells = []
+                for td in tr.find_all(['td', 'th']):
+                    cell_content = html_to_rich_text(td)
+                    cells.append(cell_content)
+                row_block = {
+                    "type": "table_row",
+                    "table_row": {
+                        "cells": cells
+                    }
+                }
+                rows.append(row_block)
+            table_block = {
+                "type": "table",
+                "table": {
+                    "table_width": len(rows[0]['table_row']['cells']) if rows else 0,
+                    "has_column_header": False,
+                    "has_row_header": False,
+                    "children": rows
+                }
+            }
+            block_id = element.get('data-notion-block-id')
+            if block_id:
+                table_block['id'] = block_id
+            return table_block
+
+    elif block_type == 'quote':
+        # 处理引用块
+        # 引用块可能包含多个段落，需要将它们的内容合并 (one per line)
+        rich_text = html_to_rich_text(element)
+        block = {
+            "type": "quote",
+            "quote": {
+                "rich_text": rich_text,
+                "color": "default"
+            }
+        }
+        block_id = element.get('data-notion-block-id')
+        if block_id:
+            block['id'] = block_id
+        # 处理子块（如果有）
+        # if element.find_all(recursive=False):
+        #     child_blocks = []
+        #     for child_element in element.find_all(recursive=False):
+        #         child_block = element_to_notion_block(child_element)
+        #         if child_block:
+        #             child_blocks.append(child_block)
+        #     if child_blocks:
+        #         block['has_children'] = True
+        #         block['children'] = child_blocks
+        return block
+
+
+    else:
+        # 对于不支持的块类型，返回 None 或者按照段落处理
+        return None
+
+
+
+
+def list_children_to_notion_blocks(sub_list):
+    """
+    Child blocks of a list item from one of its nested <ul>/<ol>.
+    """
+    if sub_list.get('data-notion-block-type') or sub_list.find('li', recursive=False):
+        # A list as the editor writes it: <li>text<ul><li>child</li></ul></li>
+        children_blocks = element_to_notion_block(sub_list)
+        return children_blocks if isinstance(children_blocks, list) else [children_blocks]
+    # parse_block wraps a list item's children in a bare <ul>/<ol>, each child
+    # block (usually a one-item list of its own) as a direct element of it
+    children_blocks = []
+    for child_element in sub_list.find_all(recursive=False):
+        child_block = element_to_notion_block(child_element)
+        if isinstance(child_block, list):
+            children_blocks.extend(item for item in child_block if isinstance(item, dict) and 'type' in item)
+        elif isinstance(child_block, dict) and 'type' in child_block:
+            children_blocks.append(child_block)
+    return children_blocks
+
+
+def list_item_block_id(list_element, li, items):
+    # parse_block wraps every list item in its own <ul>/<ol> carrying the block id
+    block_id = li.get('data-notion-block-id')
+    if not block_id and len(items) == 1:
+        block_id = list_element.get('data-notion-block-id')
+    return block_id
+
+
+# Inline tags and the annotation they switch on
+ANNOTATION_TAGS = {
+    'strong': 'bold',
+    'b': 'bold',
+    'em': 'italic',
+    'i': 'italic',
+    's': 'strikethrough',
+    'strike': 'strikethrough',
+    'del': 'strikethrough',
+    'u': 'underline',
+    'code': 'code'
+}
+# Nested blocks whose text starts on a new line of the flattened rich text
+LINE_BREAK_TAGS = {'p', 'div', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li', 'blockquote', 'pre', 'tr'}
+MAX_TEXT_LENGTH = 2000  # Notion's limit for one text object
+_WHITESPACE = re.compile(r'[ \t\n\r\f]+')
+
+
+def html_to_rich_text(element, skip=()):
+    """
+    Flatten element's inline content into a Notion rich_text array in one pass.
+
+    Annotations, colour and link are carried down the tree, so nested formatting
+    such as <strong><em>x</em></strong> is kept.  Adjacent text with the same
+    style becomes one text object, whitespace is collapsed as a browser would,
+    and only non-default annotations are sent.  Elements named in `skip` (e.g. a
+    nested list that becomes child blocks) are left out.
+    """
+    runs = []  # [text, style]; style = (bold, italic, strikethrough, underline, code, color, href)
+    at_line_start = True
+    line_break = False  # a nested block ended: the next text starts a new line
+    stack = [(iter(element.contents), (False, False, False, False, False, 'default', None), False)]
+    while stack:
+        node = next(stack[-1][0], None)
+        if node is None:
+            if stack.pop()[2] and not at_line_start:
+                line_break = True
+            continue
+        style = stack[-1][1]
+        if isinstance(node, str):
+            if not is_plain_text(node):
+                continue  # comments, scripts, ...
+            text = _WHITESPACE.sub(' ', node)
+            if line_break and text.strip(' '):
+                _strip_trailing_space(runs)
+                _add_run(runs, '\n', style)
+                at_line_start = True
+                line_break = False
+            if at_line_start or runs[-1][0].endswith(' '):
+                text = text.lstrip(' ')
+            if text:
+                _add_run(runs, text, style)
+                at_line_start = False
+            continue
+        name = node.name
+        if name in skip:
+            continue
+        if name == 'br':
+            _strip_trailing_space(runs)
+            _add_run(runs, '\n', style)
+            at_line_start = True
+            line_break = False
+            continue
+        block = name in LINE_BREAK_TAGS
+        if block and not at_line_start:
+            line_break = True
+        stack.append((iter(node.contents), _element_style(node, style), block))
+
+    _strip_trailing_space(runs)
+    rich_text = []
+    for text, style in runs:
+        for start in range(0, len(text), MAX_TEXT_LENGTH):
+            rich_text.append(_text_object(text[start:start + MAX_TEXT_LENGTH], style))
+    return rich_text
+
+
+def _add_run(runs, text, style):
+    if runs and runs[-1][1] == style:
+        runs[-1][0] += text
+    else:
+        runs.append([text, style])
+
+
+def _strip_trailing_space(runs):
+    while runs:
+        runs[-1][0] = runs[-1][0].rstrip(' ')
+        if runs[-1][0]:
+            return
+        runs.pop()
+
+
+def _element_style(element, style):
+    bold, italic, strikethrough, underline, code, color, href = style
+    annotation = ANNOTATION_TAGS.get(element.name)
+    if annotation == 'bold':
+        bold = True
+    elif annotation == 'italic':
+        italic = True
+    elif annotation == 'strikethrough':
+        strikethrough = True
+    elif annotation == 'underline':
+        underline = True
+    elif annotation == 'code':
+        code = True
+    elif element.name == 'a':
+        href = element.get('href') or href
+    elif element.name == 'span':
+        color = style_to_notion_color(element.get('style', '')) or color
+    return (bold, italic, strikethrough, underline, code, color, href)
+
+
+def _text_object(text, style):
+    bold, italic, strikethrough, underline, code, color, href = style
+    text_obj = {"type": "text", "text": {"content": text}}
+    if href:
+        text_obj["text"]["link"] = {"url": href}
+    annotations = {}
+    if bold:
+        annotations["bold"] = True
+    if italic:
+        annotations["italic"] = True
+    if strikethrough:
+        annotations["strikethrough"] = True
+    if underline:
+        annotations["underline"] = True
+    if code:
+        annotations["code"] = True
+    if color != 'default':
+        annotations["color"] = color
+    if annotations:
+        text_obj["annotations"] = annotations
+    return text_obj
+
+
+def list_element_to_notion_block(element, list_type):
+    items = element.find_all('li', recursive=False)
+    blocks = []
+    for item in items:
+        text = html_to_rich_text(item)
+        block = {
+            "type": list_type,
+            list_type: {
+                "rich_text": text
+            }
+        }
+        # 检查是否有嵌套列表
+        for child in item.find_all(recursive=False):
+            if child.name in ['ul', 'ol']:
+                child_blocks = list_element_to_notion_block(
+                    child,
+                    'bulleted_list_item' if child.name == 'ul' else 'numbered_list_item'
+                )
+                block['children'].extend(child_blocks)
+        blocks.append(block)
+    return blocks
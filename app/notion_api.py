@@ -0,0 +1,261 @@
+# app/notion_api.py
+
+import os
+import random
+import struct
+import threading
+import time
+
+import httpx
+from notion_client import Client
+from notion_client.errors import RequestTimeoutError
+
+try:
+    import fcntl
+except ImportError:  # Windows: the limit is only shared between threads
+    fcntl = None
+
+DEFAULT_PAGE_SIZE = 100  # Notion's maximum for blocks.children.list
+
+
+def iter_block_children_pages(notion_client, block_id, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Yield the children of block_id one API page (list of blocks) at a time,
+    following has_more / next_cursor lazily.
+    """
+    cursor = None
+    while True:
+        kwargs = {'block_id': block_id, 'page_size': page_size}
+        if cursor:
+            kwargs['start_cursor'] = cursor
+        response = notion_client.blocks.children.list(**kwargs)
+        yield response['results']
+        cursor = response.get('next_cursor')
+        if not response.get('has_more') or not cursor:
+            return
+
+
+def iter_block_children(notion_client, block_id, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Yield every child block of block_id, fetching further pages only as they are consumed.
+    """
+    for results in iter_block_children_pages(notion_client, block_id, page_size):
+        yield from results
+
+
+def list_block_children(notion_client, block_id, page_size=DEFAULT_PAGE_SIZE):
+    return list(iter_block_children(notion_client, block_id, page_size))
+
+
+class TokenBucket:
+    """
+    Token bucket limiting Notion calls to `rate` per second with bursts of `burst`.
+
+    With a state_path the bucket lives in a small file guarded by flock, so every
+    worker process on the host draws from the same budget; without one (or on
+    platforms without fcntl) it is shared by the threads of this process only.
+    penalize() blocks the whole bucket, e.g. for a 429's Retry-After.
+    """
+    _STATE = struct.Struct('ddd')  # tokens, last refill, blocked until
+
+    def __init__(self, rate=3.0, burst=3.0, state_path=None):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.state_path = state_path if fcntl is not None else None
+        self._lock = threading.Lock()
+        self._state = (self.burst, time.time(), 0.0)
+        if self.state_path:
+            directory = os.path.dirname(self.state_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+    def acquire(self):
+        """
+        Take one token, sleeping until one is available; returns the time spent waiting.
+        """
+        waited = 0.0
+        while True:
+            delay = self._try_take()
+            if delay <= 0:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    def penalize(self, seconds):
+        with self._locked_state() as state:
+            tokens, last, blocked_until = state.value
+            state.value = (0.0, last, max(blocked_until, time.time() + seconds))
+
+    def _try_take(self):
+        with self._locked_state() as state:
+            tokens, last, blocked_until = state.value
+            now = time.time()
+            if now < blocked_until:
+                return blocked_until - now
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens >= 1:
+                state.value = (tokens - 1, now, blocked_until)
+                return 0.0
+            state.value = (tokens, now, blocked_until)
+            return (1 - tokens) / self.rate
+
+    def _locked_state(self):
+        return _BucketState(self)
+
+
+class _BucketState:
+    # Context manager holding the thread lock (and the file lock) around one read-modify-write
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.fd = None
+        self.value = None
+
+    def __enter__(self):
+        bucket = self.bucket
+        bucket._lock.acquire()
+        if bucket.state_path:
+            try:
+                self.fd = os.open(bucket.state_path, os.O_RDWR | os.O_CREAT, 0o600)
+                fcntl.flock(self.fd, fcntl.LOCK_EX)
+                raw = os.pread(self.fd, TokenBucket._STATE.size, 0)
+                if len(raw) == TokenBucket._STATE.size:
+                    bucket._state = TokenBucket._STATE.unpack(raw)
+            except OSError:
+                self._close()
+        self.value = bucket._state
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        bucket = self.bucket
+        bucket._state = self.value
+        try:
+            if self.fd is not None:
+                os.pwrite(self.fd, TokenBucket._STATE.pack(*self.value), 0)
+        finally:
+            self._close()
+            bucket._lock.release()
+
+    def _close(self):
+        if self.fd is not None:
+            os.close(self.fd)  # also releases the flock
+            self.fd = None
+
+
+class RateLimitedClient(Client):
+    """
+    notion_client.Client with a shared token-bucket limiter and retries.
+
+    Every request waits for a token first.  429 responses are retried for any
+    method (Notion did not process them) and block the shared bucket for the
+    Retry-After period; 5xx responses, timeouts and connection errors are retried
+    only for idempotent calls.  Appending block children (PATCH
+    blocks/<id>/children) is not one: a request that timed out may still have
+    been applied, and sending it again would duplicate the blocks.  Delays use
+    jittered exponential back-off.
+    """
+    RETRY_STATUSES = {500, 502, 503, 504}
+    IDEMPOTENT_METHODS = {'GET', 'DELETE', 'PATCH'}
+
+    def __init__(self, limiter, max_retries=5, base_delay=0.5, max_delay=30.0, **kwargs):
+        super().__init__(**kwargs)
+        # Retries are handled here; turn off the ones built into newer notion-client versions
+        self._max_retries = 0
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'requests': 0,
+            'throttled': 0,
+            'throttle_wait': 0.0,
+            'rate_limited': 0,
+            'retried': 0,
+            'failed': 0
+        }
+
+    def request(self, path, method, *args, **kwargs):
+        attempt = 0
+        while True:
+            waited = self.limiter.acquire()
+            self._count('requests')
+            if waited:
+                self._count('throttled')
+                self._count('throttle_wait', waited)
+            try:
+                return super().request(path, method, *args, **kwargs)
+            except Exception as error:
+                delay = self._retry_delay(error, path, method, attempt)
+                if delay is None:
+                    self._count('failed')
+                    raise
+                self._count('retried')
+                time.sleep(delay)
+                attempt += 1
+
+    def get_stats(self):
+        with self._stats_lock:
+            return dict(self.stats)
+
+    def _retry_delay(self, error, path, method, attempt):
+        """
+        Seconds to wait before retrying, or None if the error must be raised.
+        """
+        if attempt >= self.max_retries:
+            return None
+        status = getattr(error, 'status', None)
+        backoff = min(self.max_delay, self.base_delay * (2 ** attempt))
+        backoff = backoff / 2 + random.uniform(0, backoff / 2)
+        if status == 429:
+            self._count('rate_limited')
+            retry_after = parse_retry_after(getattr(error, 'headers', None))
+            delay = min(self.max_delay, retry_after) if retry_after is not None else backoff
+            # Make every thread and worker sharing the bucket back off, not just this one
+            self.limiter.penalize(delay)
+            return delay
+        if not self._is_idempotent(path, method):
+            return None
+        if status in self.RETRY_STATUSES or isinstance(error, (RequestTimeoutError, httpx.TransportError)):
+            return backoff
+        return None
+
+    def _is_idempotent(self, path, method):
+        method = method.upper()
+        if method == 'PATCH' and path.rstrip('/').endswith('/children'):
+            return False
+        return method in self.IDEMPOTENT_METHODS or path.startswith('search')
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+
+def parse_retry_after(headers):
+    if not headers:
+        return None
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+def create_notion_client(config):
+    """
+    The Notion client shared by notion_parser and routes, rate limited per config:
+    notion_rate_limit (requests/second), notion_rate_burst, notion_max_retries and
+    notion_rate_limit_path (state file shared by the worker processes; "" for
+    a per-process limit).
+    """
+    limiter = TokenBucket(
+        rate=config.get('notion_rate_limit', 3),
+        burst=config.get('notion_rate_burst', 3),
+        state_path=config.get('notion_rate_limit_path', 'app/cache/notion_rate_limit') or None
+    )
+    return RateLimitedClient(
+        limiter,
+        max_retries=config.get('notion_max_retries', 5),
+        auth=config['notion_token']
+    )
@@ -1,29 +1,157 @@
 # app/notion_parser.py
 
-from notion_client import Client
-from bs4 import BeautifulSoup, NavigableString, Tag
+import atexit
 import json
+import threading
 import time
-from .color_converter import hsl_to_css_color_name_notion, hex_to_css_color_name_limited
+from datetime import datetime, timezone
+from .page_tree import PageTree, TreeVersions, new_page_node
+from .cache_backend import create_cache_backend
+from .page_cache import RenderedPageCache
+from .tree_snapshot import load_tree_snapshot, save_tree_snapshot
+from .tree_crawler import TreeCrawler
+from .delta_sync import DeltaSync
+from .search_index import SearchIndex
+from .title_index import TitleIndex
+from .block_loader import get_executor, iter_loaded_blocks, load_block_tree
+from .block_renderer import BlockRenderer
+from .html_to_notion import html_to_notion_blocks, set_html_parser
+from .notion_api import create_notion_client, iter_block_children, iter_block_children_pages, list_block_children
 # 加载配置
 config = {}
 with open('app/config/config.json') as config_file:
     config = json.load(config_file)
 
-# 初始化 Notion 客户端
-notion = Client(auth=config['notion_token'])
+# 初始化 Notion 客户端 (rate limited, shared with routes)
+notion = create_notion_client(config)
+
+# Parser used to turn editor HTML back into blocks: "fast", "html.parser" or "lxml"
+set_html_parser(config.get('html_parser', 'fast'))
 
 
 # Global cache variable
 cache = {
-    'page_tree': None,
+    'page_tree': None,  # PageTree instance
     'timestamp': None,
-    'expiry': config.get('cache_expiry', 3600)  # Default expiry time is 1 hour
+    'expiry': config.get('cache_expiry', 3600),  # Default expiry time is 1 hour
+    'seq': 0,  # Last change-log entry applied from the shared backend
+    'version': 0,  # Bumped on every tree change; tells the snapshot writer what is unsaved
+    'restored': False  # Tree was loaded from the on-disk snapshot and not rebuilt since
+}
+
+# Shared with the other worker processes when cache_backend is "sqlite"
+cache_backend = create_cache_backend(config)
+cache_lock = threading.RLock()
+REBUILD_LOCK_TTL = 60
+
+# Rendered page HTML, validated against last_edited_time
+page_cache = RenderedPageCache(
+    max_entries=config.get('page_cache_max_entries', 256),
+    max_bytes=config.get('page_cache_max_bytes', 64 * 1024 * 1024),
+    backend=cache_backend
+)
+PAGE_CACHE_EDIT_WINDOW = 60
+
+# Refresh timings, exposed through /cache_stats
+cache_metrics = {
+    'refresh_count': 0,
+    'refresh_failures': 0,
+    'background_refreshes': 0,
+    'stale_served': 0,
+    'last_refresh_duration': None,
+    'max_refresh_duration': 0.0,
+    'total_refresh_duration': 0.0,
+    'last_refresh_at': None,
+    'restored_from_snapshot': None,
+    'snapshot_saves': 0,
+    'last_snapshot_at': None
 }
+_refresher = {'thread': None}
+_refresher_lock = threading.Lock()
+
+# Compact on-disk copy of the page tree, loaded at startup ("" disables it)
+TREE_SNAPSHOT_PATH = config.get('tree_snapshot_path', 'app/cache/page_tree.json.gz')
+TREE_SNAPSHOT_INTERVAL = config.get('tree_snapshot_interval', 300)
+_snapshotter = {'thread': None, 'saved_version': None}
+
+# Subtree versions behind the ETags of the sidebar endpoints, numbered by the shared change log
+tree_versions = TreeVersions(cache_backend, lambda: cache['seq'])
+
+# Full-text search over page titles and rendered page text ("" keeps it in memory only)
+search_index = SearchIndex(config.get('search_index_path', 'app/cache/search_index.json.gz'), lambda: cache['page_tree'])
+search_index.start(config.get('tree_snapshot_interval', 300))
+
+# Prefix / fuzzy lookup of cached page names for the quick switcher
+title_index = TitleIndex(lambda: cache['page_tree'])
+
+# Called as listener(page_tree, op, args) under cache_lock, before a tree change is applied
+tree_change_listeners = [tree_versions.on_tree_change, search_index.on_tree_change, title_index.on_tree_change]
 
 def get_cached_page_tree():
-    if cache['page_tree'] is None or cache_expired():
-        update_cache()
+    """
+    With cache_refresh_mode "background" an expired tree keeps being served while
+    one background thread rebuilds it (stale-while-revalidate); only a missing
+    tree, or one older than cache_hard_stale seconds, is rebuilt inline.
+    The default "blocking" mode rebuilds inline as soon as the tree expires,
+    except for a tree restored from the snapshot, which is always revalidated in
+    the background.
+    """
+    with cache_lock:
+        sync_cache_from_backend()
+        if cache['page_tree'] is None or cache_hard_stale():
+            refresh_cache_now()
+        elif cache_expired():
+            if cache['restored'] or config.get('cache_refresh_mode', 'blocking') == 'background':
+                cache_metrics['stale_served'] += 1
+                start_background_refresh()
+            else:
+                refresh_cache_now()
+        return cache['page_tree'].roots
+
+def refresh_cache_now():
+    if cache_backend.try_lock('rebuild', REBUILD_LOCK_TTL):
+        try:
+            # Another worker may have finished a rebuild while we waited
+            sync_cache_from_backend()
+            if cache['page_tree'] is None or cache_expired():
+                update_cache()
+        finally:
+            cache_backend.release_lock('rebuild')
+    elif cache['page_tree'] is None:
+        wait_for_shared_tree()
+
+def start_background_refresh():
+    """
+    Start the refresher thread unless one is already running in this process.
+    """
+    with _refresher_lock:
+        thread = _refresher['thread']
+        if thread is not None and thread.is_alive():
+            return False
+        thread = threading.Thread(target=_background_refresh, name='page-tree-refresh', daemon=True)
+        _refresher['thread'] = thread
+        thread.start()
+        return True
+
+def _background_refresh():
+    # Only one worker on the host rebuilds; the others pick the result up on their next sync
+    if not cache_backend.try_lock('rebuild', REBUILD_LOCK_TTL):
+        return
+    try:
+        sync_cache_from_backend()
+        if cache_expired():
+            cache_metrics['background_refreshes'] += 1
+            update_cache()
+    except Exception as e:
+        print(f"Error refreshing page tree in background: {e}")
+    finally:
+        cache_backend.release_lock('rebuild')
+
+def get_cached_tree_index():
+    """
+    Returns the PageTree behind the cache (id index + parent links).
+    """
+    get_cached_page_tree()
     return cache['page_tree']
 
 def cache_expired():
@@ -31,56 +159,261 @@ def cache_expired():
         return True
     return (time.time() - cache['timestamp']) > cache['expiry']
 
-def update_cache():
-    # Reload config
-    with open('app/config/config.json') as config_file:
-        config.update(json.load(config_file))
-    # Rebuild page tree
-    cache['page_tree'] = build_page_tree()
-    # Update timestamp
+def cache_hard_stale():
+    """
+    Past this age the tree is rebuilt inline even in background refresh mode.
+    """
+    if cache['timestamp'] is None:
+        return True
+    hard_stale = config.get('cache_hard_stale', cache['expiry'] * 24)
+    return (time.time() - cache['timestamp']) > hard_stale
+
+def get_cache_metrics():
+    metrics = dict(cache_metrics)
+    metrics['tree_age'] = time.time() - cache['timestamp'] if cache['timestamp'] else None
+    metrics['tree_size'] = len(cache['page_tree']) if cache['page_tree'] is not None else 0
+    metrics['refresh_in_progress'] = _refresher['thread'] is not None and _refresher['thread'].is_alive()
+    return metrics
+
+def touch_cache():
+    # Update cache timestamp
     cache['timestamp'] = time.time()
+    cache_backend.set_timestamp(cache['timestamp'])
+
+def sync_cache_from_backend():
+    """
+    Replay page tree changes written by other workers since our last sync.
+    """
+    if not cache_backend.shared:
+        return
+    with cache_lock:
+        changes, cache['seq'] = cache_backend.changes_since(cache['seq'])
+        _replay_tree_changes(changes)
+        timestamp = cache_backend.get_timestamp()
+        if timestamp is not None:
+            cache['timestamp'] = timestamp
+
+def _notify_tree_change(op, args):
+    for listener in tree_change_listeners:
+        listener(cache['page_tree'], op, args)
+
+def _replay_tree_changes(changes):
+    for seq, op, args in changes:
+        # The listeners see the seq of the change they are told about (see TreeVersions)
+        cache['seq'] = seq
+        _notify_tree_change(op, args)
+        if op == 'replace':
+            cache['page_tree'] = PageTree(args[0])
+            cache['restored'] = False
+        elif cache['page_tree'] is not None:
+            cache['page_tree'].apply(op, *args)
+        cache['version'] += 1
+
+def apply_tree_op(op, *args):
+    """
+    Apply a PageTree mutation locally and record it for the other workers.
+    'replace' swaps in a whole new tree built from a list of root nodes.
+    """
+    with cache_lock:
+        missed, seq = cache_backend.record(op, args, since=cache['seq'])
+        _replay_tree_changes(missed)
+        if seq is not None:
+            cache['seq'] = seq
+        cache['version'] += 1
+        _notify_tree_change(op, args)
+        if op == 'replace':
+            cache['page_tree'] = PageTree(args[0])
+            return cache['page_tree']
+        if cache['page_tree'] is None:
+            return None
+        return cache['page_tree'].apply(op, *args)
+
+def wait_for_shared_tree():
+    # Another worker holds the rebuild lock; pick up its tree instead of calling Notion again
+    deadline = time.time() + REBUILD_LOCK_TTL
+    while cache['page_tree'] is None and time.time() < deadline:
+        time.sleep(0.2)
+        sync_cache_from_backend()
+    if cache['page_tree'] is None:
+        update_cache()
+
+def update_cache(keep_loaded=True):
+    """
+    Refresh the root pages and their titles from Notion.  The levels loaded
+    below the roots (expanded, prefetched, crawled or restored from the
+    snapshot) are kept: roots are renamed, added and removed in place.
+    keep_loaded=False starts again from the roots alone.
+    """
+    started = time.time()
+    try:
+        # Reload config
+        with open('app/config/config.json') as config_file:
+            config.update(json.load(config_file))
+        # Rebuild page tree (outside cache_lock, so a background rebuild does not block readers)
+        page_tree = build_page_tree()
+    except Exception:
+        cache_metrics['refresh_failures'] += 1
+        raise
+    with cache_lock:
+        if not keep_loaded or not refresh_tree_roots(page_tree):
+            if keep_loaded:
+                carry_over_loaded_children(page_tree)
+            apply_tree_op('replace', page_tree)
+        cache['restored'] = False
+    # Update timestamp
+    touch_cache()
+    duration = time.time() - started
+    cache_metrics['refresh_count'] += 1
+    cache_metrics['last_refresh_duration'] = duration
+    cache_metrics['max_refresh_duration'] = max(cache_metrics['max_refresh_duration'], duration)
+    cache_metrics['total_refresh_duration'] += duration
+    cache_metrics['last_refresh_at'] = cache['timestamp']
+    # A full rebuild is the expensive part; persist it right away
+    _save_tree_snapshot_quietly()
+
+def refresh_tree_roots(roots):
+    """
+    Apply a fresh list of root nodes to the cached tree as renames, new roots
+    and removed roots.  False if there is no tree yet or the roots changed
+    order, which takes a 'replace'.
+    """
+    with cache_lock:
+        if cache['page_tree'] is None:
+            return False
+        root_ids = [root['id'] for root in roots]
+        cached_ids = [root['id'] for root in cache['page_tree'].roots]
+        wanted = set(root_ids)
+        new_ids = wanted - set(cached_ids)
+        if any(page_id in cache['page_tree'] for page_id in new_ids):
+            # A configured root cached further down (e.g. reached by a deep link)
+            return False
+        # Kept roots stay in place and new ones are appended, which must give the configured order
+        kept_ids = [page_id for page_id in cached_ids if page_id in wanted]
+        if kept_ids + [page_id for page_id in root_ids if page_id in new_ids] != root_ids:
+            return False
+        for page_id in cached_ids:
+            if page_id not in wanted:
+                apply_tree_op('remove', page_id)
+        for root in roots:
+            node = cache['page_tree'].get(root['id'])
+            if node is None:
+                apply_tree_op('add_root', root)
+            elif node['name'] != root['name']:
+                apply_tree_op('rename', root['id'], root['name'])
+        return True
+
+def carry_over_loaded_children(roots):
+    # Give the new root nodes the levels already loaded below the cached ones
+    if cache['page_tree'] is None:
+        return
+    for root in roots:
+        node = cache['page_tree'].get(root['id'])
+        if node is not None and node['children'] and cache['page_tree'].get_parent(root['id']) is None:
+            root['children'] = list(node['children'])
+
+def restore_tree_snapshot():
+    """
+    Load the last on-disk snapshot so the sidebar can be served right after a restart.
+    Skipped if the shared backend already holds a tree.  The restored tree is
+    served while it is revalidated in the background (see get_cached_page_tree).
+    """
+    if not TREE_SNAPSHOT_PATH:
+        return False
+    with cache_lock:
+        sync_cache_from_backend()
+        if cache['page_tree'] is not None:
+            return False
+        snapshot = load_tree_snapshot(TREE_SNAPSHOT_PATH)
+        if snapshot is None:
+            return False
+        roots, timestamp = snapshot
+        apply_tree_op('replace', roots)
+        cache['timestamp'] = timestamp
+        if timestamp is not None:
+            cache_backend.set_timestamp(timestamp)
+        cache['restored'] = True
+        _snapshotter['saved_version'] = cache['version']
+        cache_metrics['restored_from_snapshot'] = timestamp
+    return True
+
+def save_tree_snapshot_if_changed():
+    if not TREE_SNAPSHOT_PATH:
+        return False
+    with cache_lock:
+        if cache['page_tree'] is None or cache['version'] == _snapshotter['saved_version']:
+            return False
+        version = cache['version']
+        save_tree_snapshot(TREE_SNAPSHOT_PATH, cache['page_tree'].roots, cache['timestamp'])
+        _snapshotter['saved_version'] = version
+        cache_metrics['snapshot_saves'] += 1
+        cache_metrics['last_snapshot_at'] = time.time()
+    return True
+
+def _save_tree_snapshot_quietly():
+    try:
+        save_tree_snapshot_if_changed()
+    except Exception as e:
+        print(f"Error saving page tree snapshot: {e}")
+
+def start_snapshot_writer():
+    """
+    Save the tree every tree_snapshot_interval seconds if it changed, and once more at exit.
+    """
+    with _refresher_lock:
+        thread = _snapshotter['thread']
+        if thread is not None and thread.is_alive():
+            return False
+        thread = threading.Thread(target=_snapshot_loop, name='page-tree-snapshot', daemon=True)
+        _snapshotter['thread'] = thread
+        thread.start()
+    atexit.register(_save_tree_snapshot_quietly)
+    return True
+
+def _snapshot_loop():
+    while True:
+        time.sleep(TREE_SNAPSHOT_INTERVAL)
+        _save_tree_snapshot_quietly()
+
+if TREE_SNAPSHOT_PATH:
+    restore_tree_snapshot()
+    start_snapshot_writer()
 
 def build_page_tree():
     pages = []
     for root_page_id in get_page_ids():
         page_title = get_page_title(root_page_id)
-        root_page = {
-            'id': root_page_id,
-            'name': page_title,
-            'has_children': True,  # Assume root pages have children
-            'children': []  # We'll leave children empty for now
-        }
+        # Assume root pages have children; we'll leave children empty for now
+        root_page = new_page_node(root_page_id, page_title, has_children=True)
         pages.append(root_page)
     return pages
 
 
+def fetch_sub_pages(page_id):
+    """
+    Fetch the child_page blocks of page_id from Notion as cache nodes.
+    """
+    sub_pages = []
+    for child in iter_block_children(notion, page_id, get_notion_page_size()):
+        if child['type'] == 'child_page':
+            # We won't load grandchildren yet
+            sub_pages.append(new_page_node(child['id'], child['child_page']['title'], child['has_children']))
+    return sub_pages
+
 
 def get_sub_pages_from_cache(page_id):
     # First, check if the sub-pages are already in the cache
-    page_tree = get_cached_page_tree()
-    sub_pages = find_sub_pages_in_cache(page_id, page_tree)
+    page_tree = get_cached_tree_index()
+    sub_pages = find_sub_pages_in_cache(page_id)
     if sub_pages is not None and len(sub_pages) >0:
         return sub_pages
     else:
         # Sub-pages not in cache, fetch from Notion API and update cache
         sub_pages = []
-        parent_page = find_page_in_cache(page_id, page_tree)
-        if not parent_page['has_children']:
+        parent_page = page_tree.get(page_id)
+        if parent_page is None or not parent_page['has_children']:
             return sub_pages
         try:
-            children = notion.blocks.children.list(block_id=page_id, page_size=100)['results']
-            for child in children:
-                if child['type'] == 'child_page':
-                    sub_page_id = child['id']
-                    sub_page_title = child['child_page']['title']
-                    has_children = child['has_children']
-                    sub_page = {
-                        'id': sub_page_id,
-                        'name': sub_page_title,
-                        'has_children': has_children,
-                        'children': []  # We won't load grandchildren yet
-                    }
-                    sub_pages.append(sub_page)
+            sub_pages = fetch_sub_pages(page_id)
             # Update cache with the sub-pages
             add_sub_pages_to_cache(page_id, sub_pages)
         except Exception as e:
@@ -88,40 +421,92 @@ def get_sub_pages_from_cache(page_id):
         return sub_pages
 
 
+def get_sub_page_tree(page_id, depth=1, max_fetches=None):
+    """
+    The sub pages of page_id down to `depth` levels, as nested copies of the
+    cache nodes.  Levels missing from the cache are fetched breadth-first, all
+    nodes of one level concurrently on the shared pool; at most max_fetches
+    child listings are requested.  A node carries 'children' only when its
+    sub pages are included, so the sidebar knows which ones still need loading.
+    """
+    page_tree = get_cached_tree_index()
+    if page_tree.get(page_id) is None:
+        return []
+    if max_fetches is None:
+        max_fetches = config.get('sidebar_prefetch_max_fetches', 30)
+    executor = get_executor(config.get('notion_max_concurrency', 3))
+    level = [page_id]
+    for _ in range(depth):
+        missing = [node_id for node_id in level if _sub_pages_missing(page_tree.get(node_id))][:max_fetches]
+        max_fetches -= len(missing)
+        futures = [(node_id, executor.submit(fetch_sub_pages, node_id)) for node_id in missing]
+        for node_id, future in futures:
+            try:
+                sub_pages = future.result()
+            except Exception as e:
+                print(f"Error fetching children for page {node_id}: {e}")
+                continue
+            fill_missing_sub_pages(node_id, sub_pages)
+        next_level = []
+        for node_id in level:
+            node = page_tree.get(node_id)
+            if node is not None and not _sub_pages_missing(node):
+                next_level.extend(child['id'] for child in node['children'])
+        level = next_level
+    return _copy_sub_pages(page_tree.get(page_id), depth)
+
+
+def _sub_pages_missing(node):
+    # Same test as get_sub_pages_from_cache: has_children but nothing loaded yet
+    return node is not None and node['has_children'] and not node['children']
+
+
+def _copy_sub_pages(node, depth):
+    if node is None or _sub_pages_missing(node):
+        return []
+    with cache_lock:
+        result = []
+        stack = [(node['children'], result, depth)]
+        while stack:
+            children, out, remaining = stack.pop()
+            for child in children:
+                copy = {'id': child['id'], 'name': child['name'], 'has_children': child['has_children']}
+                out.append(copy)
+                if remaining > 1 and not _sub_pages_missing(child):
+                    copy['children'] = []
+                    stack.append((child['children'], copy['children'], remaining - 1))
+        return result
 
-def find_sub_pages_in_cache(page_id, pages=None):
-    if pages is None:
-        pages = get_cached_page_tree()
+
+
+def _search_pages(page_id, pages):
+    # Plain DFS, only used when a caller passes a detached list of nodes
     for page in pages:
         if page['id'] == page_id:
-            return page.get('children')
+            return page
         if 'children' in page and page['children']:
-            result = find_sub_pages_in_cache(page_id, page['children'])
+            result = _search_pages(page_id, page['children'])
             if result is not None:
                 return result
     return None
 
+def find_sub_pages_in_cache(page_id, pages=None):
+    page = find_page_in_cache(page_id, pages)
+    if page is None:
+        return None
+    return page.get('children')
+
 def add_sub_pages_to_cache(page_id, sub_pages):
-    # Find the page in the cache and add the sub_pages
-    page_tree = get_cached_page_tree()
-    page = find_page_in_cache(page_id, page_tree)
-    if page:
-        page['children'] = sub_pages
-        # Update has_children
-        page['has_children'] = len(sub_pages) > 0
+    # Find the page in the cache and add the sub_pages (updates has_children too)
+    get_cached_tree_index()
+    apply_tree_op('set_children', page_id, sub_pages)
 
 
 def find_page_in_cache(page_id, pages=None):
-    if pages is None:
-        pages = get_cached_page_tree()
-    for page in pages:
-        if page['id'] == page_id:
-            return page
-        if 'children' in page and page['children']:
-            result = find_page_in_cache(page_id, page['children'])
-            if result is not None:
-                return result
-    return None
+    page_tree = get_cached_tree_index()
+    if pages is None or pages is page_tree.roots:
+        return page_tree.get(page_id)
+    return _search_pages(page_id, pages)
 
 
 
@@ -130,7 +515,7 @@ def upTracePageAncestor2Cache(page_id):
     Traces the ancestors of the given page_id and inserts the path into the cache tree.
     """
     # Get the current cached page tree
-    page_tree = get_cached_page_tree()
+    page_tree = get_cached_tree_index()
 
     # List to hold the path from the root to the current page
     path = []
@@ -138,7 +523,7 @@ def upTracePageAncestor2Cache(page_id):
     current_page_id = page_id
     while True:
         # Check if current_page_id is already in cache
-        page_in_cache = find_page_in_cache(current_page_id, page_tree)
+        page_in_cache = page_tree.get(current_page_id)
         if page_in_cache:
             # Page is already in cache; we can attach the path here
             break
@@ -151,12 +536,7 @@ def upTracePageAncestor2Cache(page_id):
                 has_children = page.get('has_children', True) # True 
 
                 # Create a page dict
-                page_dict = {
-                    'id': current_page_id,
-                    'name': page_title,
-                    'has_children': has_children,
-                    'children': []
-                }
+                page_dict = new_page_node(current_page_id, page_title, has_children)
 
                 # Insert at the beginning of the path list
                 path.insert(0, page_dict)
@@ -166,10 +546,8 @@ def upTracePageAncestor2Cache(page_id):
                     current_page_id = parent_info.get('page_id')
                 else:
                     # Reached a root page not in cache; add it to the root of the cache tree
-                    page_tree.append(page_dict)
-                    # Update cache timestamp
-                    cache['timestamp'] = time.time()
-                    return
+                    page_in_cache = apply_tree_op('add_root', path.pop(0))
+                    break
             except Exception as e:
                 print(f"Error retrieving page {current_page_id}: {e}")
                 return
@@ -177,20 +555,11 @@ def upTracePageAncestor2Cache(page_id):
     # Now, we have a page in cache (`page_in_cache`) and a path of pages to attach
     parent_in_cache = page_in_cache
     for page_dict in path:
-        # Attach each page in the path to the appropriate parent in the cache
-        # Check if the child already exists in the parent's children
-        child_in_cache = find_page_in_children(page_dict['id'], parent_in_cache['children'])
-        if not child_in_cache:
-            parent_in_cache['children'].append(page_dict) #todo: add ony 1???  or traverse all children??
-            parent_in_cache['has_children'] = True
-            # Move to the next level
-            parent_in_cache = page_dict
-        else:
-            # Child already exists; move to it
-            parent_in_cache = child_in_cache
+        # Attach each page in the path to the appropriate parent in the cache;
+        # add_child keeps an existing child and moves to it
+        parent_in_cache = apply_tree_op('add_child', parent_in_cache['id'], page_dict)
 
-    # Update cache timestamp
-    cache['timestamp'] = time.time()
+    touch_cache()
 
 
 def find_page_in_children(page_id, children):
@@ -203,35 +572,18 @@ def generate_breadcrumbs_from_cache(page_id):
     """
     Generates a list of breadcrumbs from the root to the given page_id.
     Each breadcrumb is a dictionary with 'id' and 'name'.
+    Walks the parent links, so the cost is O(depth).
     """
-    breadcrumbs = []
-    page = find_page_in_cache(page_id, get_cached_page_tree())
-    if page is None:
-        return breadcrumbs  # Empty list if page not found
-
-    # Traverse up to the root
-    while page:
-        breadcrumbs.insert(0, {'id': page['id'], 'name': page['name']})
-        parent_page = find_parent_in_cache(page['id'], get_cached_page_tree())
-        page = parent_page
-    return breadcrumbs
-
-# def find_parent_in_cache(child_id, pages):
-#     for page in pages:
-#         if any(child['id'] == child_id for child in page.get('children', [])):
-#             return page
-#         # Recursively search in children
-#         result = find_parent_in_cache(child_id, page.get('children', []))
-#         if result:
-#             return result
-#     return None
+    return get_cached_tree_index().breadcrumbs(page_id)
 
 # find parent by child_id
 def find_parent_in_cache(child_id, pages=None):
+    page_tree = get_cached_tree_index()
     # ensuring upTracePageAncestor2Cache 
-    title = get_cached_page_title(child_id)
-    if pages is None:
-        pages = get_cached_page_tree()
+    if child_id not in page_tree:
+        upTracePageAncestor2Cache(child_id)
+    if pages is None or pages is page_tree.roots:
+        return page_tree.get_parent(child_id)
     for page in pages:
         if any(child['id'] == child_id for child in page.get('children', [])):
             return page
@@ -247,39 +599,20 @@ def find_parent_in_cache(child_id, pages=None):
 
 
 def update_page_name_in_cache(page_id, new_name):
-    page_tree = get_cached_page_tree()
-    page = find_page_in_cache(page_id, page_tree)
-    if page:
-        page['name'] = new_name
-        # Update cache timestamp
-        cache['timestamp'] = time.time()
+    get_cached_tree_index()
+    if apply_tree_op('rename', page_id, new_name):
+        touch_cache()
 
 
 
 def update_parent_children_in_cache(parent_id):
     try:
         # Fetch the latest children of the parent page
-        children = notion.blocks.children.list(block_id=parent_id, page_size=100)['results']
-        sub_pages = []
-        for child in children:
-            if child['type'] == 'child_page':
-                sub_page_id = child['id']
-                sub_page_title = child['child_page']['title']
-                has_children = child['has_children']
-                sub_page = {
-                    'id': sub_page_id,
-                    'name': sub_page_title,
-                    'has_children': has_children,
-                    'children': []
-                }
-                sub_pages.append(sub_page)
+        sub_pages = fetch_sub_pages(parent_id)
         # Update the parent in the cache
-        page_tree = get_cached_page_tree()
-        parent_page = find_page_in_cache(parent_id, page_tree)
-        if parent_page:
-            parent_page['children'] = sub_pages
-            parent_page['has_children'] = len(sub_pages) > 0
-            cache['timestamp'] = time.time()
+        get_cached_tree_index()
+        if apply_tree_op('set_children', parent_id, sub_pages):
+            touch_cache()
     except Exception as e:
         print(f"Error updating parent children in cache: {e}")
 
@@ -287,31 +620,125 @@ def update_parent_children_in_cache(parent_id):
 def update_node_children_in_cache(page_id):
     try:
         # Fetch the latest children of the node
-        children = notion.blocks.children.list(block_id=page_id, page_size=100)['results']
-        sub_pages = []
-        for child in children:
-            if child['type'] == 'child_page':
-                sub_page_id = child['id']
-                sub_page_title = child['child_page']['title']
-                has_children = child['has_children']
-                sub_page = {
-                    'id': sub_page_id,
-                    'name': sub_page_title,
-                    'has_children': has_children,
-                    'children': []
-                }
-                sub_pages.append(sub_page)
-        # Update the node in the cache
-        page_tree = get_cached_page_tree()
-        node = find_page_in_cache(page_id, page_tree)
-        if node:
-            node['children'] = sub_pages
-            node['has_children'] = len(sub_pages) > 0
-            cache['timestamp'] = time.time()
+        sub_pages = fetch_sub_pages(page_id)
+        # Update the node in the cache, unless nothing changed (keeps its version / ETag)
+        node = get_cached_tree_index().get(page_id)
+        if node is not None and _same_sub_pages(node, sub_pages):
+            touch_cache()
+            return
+        if apply_tree_op('set_children', page_id, sub_pages):
+            touch_cache()
     except Exception as e:
         print(f"Error updating node children in cache: {e}")
 
 
+def fill_missing_sub_pages(page_id, sub_pages):
+    """
+    Store fetched sub pages of page_id unless they were loaded meanwhile
+    (which would drop the deeper levels loaded since); returns True if stored.
+    """
+    with cache_lock:
+        if not _sub_pages_missing(get_cached_tree_index().get(page_id)):
+            return False
+        apply_tree_op('set_children', page_id, sub_pages)
+        return True
+
+
+# Walks the whole workspace into the page tree in the background (tree_crawl)
+tree_crawler = TreeCrawler(
+    get_cached_tree_index,
+    fetch_sub_pages,
+    fill_missing_sub_pages,
+    backend=cache_backend,
+    max_workers=config.get('tree_crawl_max_concurrency', 2),
+    budget_per_minute=config.get('tree_crawl_budget_per_minute', 60),
+    idle_interval=config.get('tree_crawl_interval', 60)
+)
+if config.get('tree_crawl', False):
+    tree_crawler.start()
+
+
+def _page_object_title(page):
+    # Title of a page object from pages.retrieve / search; None if it has no "title" property
+    title = page.get('properties', {}).get('title', {}).get('title')
+    if title is None:
+        return None
+    return ''.join(t['plain_text'] for t in title) or 'Untitled'
+
+
+def apply_page_change(page):
+    """
+    Patch the caches for a page object edited in Notion (see delta_sync):
+    its rendered HTML and content version, and its node in the page tree
+    (renamed, moved, added under a loaded parent, or removed if archived).
+    The parent's rendered page lists its sub pages, so it is dropped as well
+    when the tree changed.
+    """
+    page_id = page['id']
+    page_cache.invalidate(page_id)
+    if page.get('last_edited_time'):
+        page_cache.observe(page_id, page['last_edited_time'])
+    parent = page.get('parent') or {}
+    parent_id = parent.get('page_id') if parent.get('type') == 'page_id' else None
+    title = _page_object_title(page)
+    touched = set()
+    with cache_lock:
+        page_tree = cache['page_tree']
+        if page_tree is None:
+            return
+        node = page_tree.get(page_id)
+        old_parent = page_tree.get_parent(page_id) if node is not None else None
+        new_parent = page_tree.get(parent_id) if parent_id else None
+        if page.get('archived') or page.get('in_trash'):
+            # Configured roots stay; the next rebuild drops them if they are gone
+            if old_parent is not None:
+                apply_tree_op('remove', page_id)
+                touched.add(old_parent['id'])
+        elif node is not None:
+            if title is not None and node['name'] != title:
+                apply_tree_op('rename', page_id, title)
+                touched.add(old_parent['id'] if old_parent is not None else None)
+            if old_parent is not None and parent_id and old_parent['id'] != parent_id:
+                # Moved: keep its loaded subtree if the new parent's sub pages are loaded
+                if new_parent is not None and not _sub_pages_missing(new_parent):
+                    apply_tree_op('add_child', parent_id, node)
+                else:
+                    apply_tree_op('remove', page_id)
+                touched.update((old_parent['id'], parent_id))
+        elif new_parent is not None and not _sub_pages_missing(new_parent):
+            # New page under a loaded node; whether it has sub pages is found out when expanded
+            apply_tree_op('add_child', parent_id, new_page_node(page_id, title or 'Untitled'))
+            touched.add(parent_id)
+        if touched:
+            touch_cache()
+    for touched_id in touched - {None}:
+        page_cache.invalidate(touched_id)
+
+
+# Polls Notion for pages edited since the last poll and patches only those (delta_sync)
+delta_sync = DeltaSync(
+    notion,
+    apply_page_change,
+    lambda: update_cache(keep_loaded=False),
+    backend=cache_backend,
+    interval=config.get('delta_sync_interval', 30),
+    max_pages=config.get('delta_sync_max_pages', 10)
+)
+if config.get('delta_sync', False):
+    delta_sync.start()
+
+
+def _same_sub_pages(node, sub_pages):
+    # Same pages, names and has_children, and no deeper level loaded that a refresh would drop
+    children = node['children']
+    if node['has_children'] != (len(sub_pages) > 0) or len(children) != len(sub_pages):
+        return False
+    for child, sub_page in zip(children, sub_pages):
+        if child['children'] or (child['id'], child['name'], child['has_children']) != (sub_page['id'], sub_page['name'], sub_page['has_children']):
+            return False
+    return True
+
+
 
 
 
@@ -335,8 +762,7 @@ def get_page_title(page_id):
         return 'Untitled'
 
 def get_cached_page_title(page_id):
-    page_tree = get_cached_page_tree()
-    page = find_page_in_cache(page_id, page_tree)
+    page = get_cached_tree_index().get(page_id)
     if page:
         return page["name"]
     else:
@@ -359,800 +785,148 @@ def get_page_tree():
 def get_block_content(block_id):
     content = ''
     try:
-        children = notion.blocks.children.list(block_id=block_id)['results']
-        for block in children:
-            content += parse_block(block)
+        content += render_block_content(block_id)
     except Exception as e:
         content += f'<p>[Error fetching block content: {e}]</p>'
     return content
 
-def parse_block(block):
-    block_type = block['type']
-    block_id = block['id']
-    content = ''
-
-    if block_type == 'paragraph':
-        text = rich_text_to_html(block['paragraph']['rich_text'])
-        content += f'<p data-notion-block-type="paragraph" data-notion-block-id="{block_id}">{text}</p>'
-        # 处理子块
-        if block['has_children']:
-            children = notion.blocks.children.list(block_id=block_id)['results']
-            for child in children:
-                content += parse_block(child)
-
-    elif block_type == 'heading_1':
-        text = rich_text_to_html(block['heading_1']['rich_text'])
-        content += f'<h1 data-notion-block-type="heading_1" data-notion-block-id="{block_id}">{text}</h1>'
-        if block['has_children']:
-            children = notion.blocks.children.list(block_id=block_id)['results']
-            for child in children:
-                content += parse_block(child)
-
-    elif block_type == 'heading_2':
-        text = rich_text_to_html(block['heading_2']['rich_text'])
-        content += f'<h2 data-notion-block-type="heading_2" data-notion-block-id="{block_id}">{text}</h2>'
-        if block['has_children']:
-            children = notion.blocks.children.list(block_id=block_id)['results']
-            for child in children:
-                content += parse_block(child)
-
-    elif block_type == 'heading_3':
-        text = rich_text_to_html(block['heading_3']['rich_text'])
-        content += f'<h3 data-notion-block-type="heading_3" data-notion-block-id="{block_id}">{text}</h3>'
-        if block['has_children']:
-            children = notion.blocks.children.list(block_id=block_id)['results']
-            for child in children:
-                content += parse_block(child)
-
-    elif block_type == 'bulleted_list_item':
-        text = rich_text_to_html(block['bulleted_list_item']['rich_text'])
-        content += f'<ul data-notion-block-type="bulleted_list" data-notion-block-id="{block_id}"><li>{text}'
-        # 处理子块
-        if block['has_children']:
-            content += '<ul>'
-            children = notion.blocks.children.list(block_id=block_id)['results']
-            for child in children:
-                content += parse_block(child)
-            content += '</ul>'
-        content += '</li></ul>'
-
-    elif block_type == 'numbered_list_item':
-        text = rich_text_to_html(block['numbered_list_item']['rich_text'])
-        content += f'<ol data-notion-block-type="numbered_list" data-notion-block-id="{block_id}"><li>{text}'
-        # 处理子块
-        if block['has_children']:
-            content += '<ol>'
-            children = notion.blocks.children.list(block_id=block_id)['results']
-            for child in children:
-                content += parse_block(child)
-            content += '</ol>'
-        content += '</li></ol>'
-
-    elif block_type == 'to_do':
-        # 获取任务内容和完成状态
-        text = rich_text_to_html(block['to_do']['rich_text'])
-        checked = block['to_do']['checked']
-        # 构建 CKEditor 的待办事项 HTML
-        checkbox = f'<input type="checkbox" tabindex="-1" {"checked" if checked else ""}>'
-        # 包装为 CKEditor 的待办事项格式
-        content += f'''
-        <ul class="todo-list" data-notion-block-type="to_do" data-notion-block-id="{block_id}">
-            <li>
-                <span class="todo-list__label">
-                    <span contenteditable="false">{checkbox}</span>
-                    <span class="todo-list__label__description">{text}</span>
-                </span>
-        '''
-
-        # 处理子块（如果有）
-        if block['has_children']:
-            children = notion.blocks.children.list(block_id=block_id)['results']
-            for child in children:
-                content += parse_block(child)
-        content+= '</li></ul>'
-
-    elif block_type == 'divider':
-        content += f'<hr data-notion-block-type="divider" data-notion-block-id="{block_id}"/>'
-
-    elif block_type == 'image':
-        image_url = block['image'].get('file', {}).get('url', '') or block['image'].get('external', {}).get('url', '')
-        caption = rich_text_to_html(block['image'].get('caption', []))
-        content += f'<figure data-notion-block-type="image" data-notion-block-id="{block_id}"><img src="{image_url}" alt="{caption}"/><figcaption>{caption}</figcaption></figure>'
-
-    elif block_type == 'callout':
-        text = rich_text_to_html(block['callout']['rich_text'])
-        icon = block['callout'].get('icon', {}).get('emoji', '')
-        content += f'<div class="callout" data-notion-block-type="callout" data-notion-block-id="{block_id}">{icon} {text}'
-
-        # 处理子块（如果有）
-        if block['has_children']:
-            children = notion.blocks.children.list(block_id=block_id)['results']
-            for child in children:
-                content += parse_block(child)
-        content += '</div>'
-        
-    elif block_type == 'code':
-        code_text = ''.join([t['plain_text'] for t in block['code']['rich_text']])
-        language = block['code'].get('language', '').lower()
-        code_text_escaped = code_text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-        content += f'<pre data-notion-block-type="code" data-notion-block-id="{block_id}"><code class="language-{language}">{code_text_escaped}</code></pre>'
-
-    elif block_type == 'file':
-        file_info = block['file']
-        file_url = file_info.get('file', {}).get('url', '') or file_info.get('external', {}).get('url', '')
-        file_name = file_info.get('name', 'Download File')
-        content += f'<p data-notion-block-type="file" data-notion-block-id="{block_id}"><a href="{file_url}" download="{file_name}">{file_name}</a></p>'
-
-    elif block_type == 'bookmark':
-        url = block['bookmark']['url']
-        caption = rich_text_to_html(block['bookmark'].get('caption', []))
-        display_text = caption if caption else url
-        content += f'<p data-notion-block-type="bookmark" data-notion-block-id="{block_id}"><a href="{url}">{display_text}</a></p>'
-
-    elif block_type == 'link_preview':
-        url = block['link_preview']['url']
-        content += f'<p data-notion-block-type="link_preview" data-notion-block-id="{block_id}"><a href="{url}">{url}</a></p>'
-
-    elif block_type == 'link_to_page':
-        link_type = block['link_to_page']['type']
-        if link_type == 'page_id':
-            linked_page_id = block['link_to_page']['page_id']
-            page_title = get_page_title(linked_page_id)
-            page_url = f"/page/{linked_page_id}"
-            content += f'<p data-notion-block-type="link_to_page" data-notion-block-id="{block_id}"><a href="{page_url}">{page_title}</a></p>'
-        else:
-            content += f'<p data-notion-block-type="link_to_page" data-notion-block-id="{block_id}">[Unsupported link type]</p>'
-
-    elif block_type == 'table':
-        table_info = block['table']
-        has_column_header = table_info['has_column_header']
-        content += f'<table data-notion-block-type="table" data-notion-block-id="{block_id}">'
-        table_rows = notion.blocks.children.list(block_id=block_id)['results']
-        for idx, row_block in enumerate(table_rows):
-            if row_block['type'] == 'table_row':
-                cells = row_block['table_row']['cells']
-                row_tag = 'th' if has_column_header and idx == 0 else 'td'
-                content += '<tr>'
-                for cell in cells:
-                    cell_content = rich_text_to_html(cell)
-                    content += f'<{row_tag}>{cell_content}</{row_tag}>'
-                content += '</tr>'
-        content += '</table>'
-
-    elif block_type == 'toggle':
-        title = rich_text_to_html(block['toggle']['rich_text'])
-        content += f'<details data-notion-block-type="toggle" data-notion-block-id="{block_id}"><summary>{title}</summary>'
-        # 处理子块
-        if block['has_children']:
-            children = notion.blocks.children.list(block_id=block_id)['results']
-            for child in children:
-                content += parse_block(child)
-        content += '</details>'
-
-    elif block_type == 'audio':
-        audio_info = block['audio']
-        audio_url = audio_info.get('file', {}).get('url', '') or audio_info.get('external', {}).get('url', '')
-        content += f'<audio controls data-notion-block-type="audio" data-notion-block-id="{block_id}"><source src="{audio_url}">Your browser does not support the audio element.</audio>'
-
-    elif block_type == 'child_page':
-        page_title = block['child_page']['title']
-        page_url = f"/page/{block_id}"
-        content += f'<p data-notion-block-type="child_page" data-notion-block-id="{block_id}"><a href="{page_url}">{page_title}</a></p>'
-
-    elif block_type == 'quote':
-        text = rich_text_to_html(block['quote']['rich_text'])
-        content += f'<blockquote data-notion-block-type="quote" data-notion-block-id="{block_id}">{text}</blockquote>'
-        # 处理子块
-        if block['has_children']:
-            children = notion.blocks.children.list(block_id=block_id)['results']
-            for child in children:
-                content += parse_block(child)
-
-    else:
-        content += f'<p data-notion-block-type="{block_type}" data-notion-block-id="{block_id}">[Unsupported block type: {block_type}]</p>'
-
-    return content
+def render_block_content(block_id):
+    # Raises on Notion errors, so callers can decide whether the result is cacheable
+    out = []
+    page_size = get_notion_page_size()
+    # One page of top-level blocks at a time: fetch its nested levels concurrently,
+    # render from memory, then drop it, so memory stays flat on very large pages
+    for children in iter_block_children_pages(notion, block_id, page_size):
+        load_block_tree(notion, children, max_workers=config.get('notion_max_concurrency', 3), page_size=page_size)
+        for block in children:
+            block_renderer.render_into(block, out)
+    return ''.join(out)
 
-def rich_text_to_html(rich_text_array):
-    html_content = ''
-    for text_obj in rich_text_array:
-        annotations = text_obj.get('annotations', {})
-        plain_text = text_obj.get('plain_text', '')
-        href = text_obj.get('href')
-
-        text = plain_text
-        if annotations.get('bold'):
-            text = f'<strong>{text}</strong>'
-        if annotations.get('italic'):
-            text = f'<em>{text}</em>'
-        if annotations.get('underline'):
-            text = f'<u>{text}</u>'
-        if annotations.get('strikethrough'):
-            text = f'<s>{text}</s>'
-        if annotations.get('color') and annotations['color'] != 'default':
-            # check if color ends with 'background'：
-            if annotations['color'].endswith('_background'):
-                background_color = annotations['color'].replace('_background', '')
-                text = f'<span style="background-color:{background_color}">{text}</span>'
-            else:
-                text = f'<span style="color:{annotations["color"]}">{text}</span>'
-        if annotations.get('code'):
-            text = f'<code>{text}</code>'
-        if href:
-            text = f'<a href="{href}">{text}</a>'
-        html_content += text
-    return html_content
-
-def html_to_notion_blocks(html_content):
-    soup = BeautifulSoup(html_content, 'html.parser')
-    blocks = []
-    elements=soup.find_all(recursive=False)
-    for element in elements:
-        block = element_to_notion_block(element)
-        
-        # Check if block is a list
-        if isinstance(block, list):
-            for item in block:
-                if isinstance(item, dict) and 'type' in item:  # Ensure each item in list has 'type'
-                    blocks.append(item)
-        
-        # Check if block is an object with 'type' attribute
-        elif isinstance(block, dict) and 'type' in block:
-            blocks.append(block)
-    
-    return blocks
-
-
-def element_to_notion_block(element):
-    # 初始化 block_type
-    block_type = element.get('data-notion-block-type')
-
-    # 如果没有 data-notion-block-type，根据元素类型和类名判断 block_type
-    if not block_type:
-        if element.name == 'p':
-            block_type = 'paragraph'
-        elif element.name == 'h1':
-            block_type = 'heading_1'
-        elif element.name == 'h2':
-            block_type = 'heading_2'
-        elif element.name == 'h3':
-            block_type = 'heading_3'
-        elif element.name == 'h4':
-            block_type = 'heading_3'
-        elif element.name == 'h5':
-            block_type = 'heading_3'
-        elif element.name == 'ul' and 'todo-list' in element.get('class', []):
-            block_type = 'to_do'
-        elif element.name == 'ul':
-            block_type = 'bulleted_list'
-        elif element.name == 'ol':
-            block_type = 'numbered_list'
-        elif element.name == 'hr':
-            block_type = 'divider'
-        elif element.name == 'pre' and element.find('code'):
-            block_type = 'code'
-        elif element.name == 'figure':
-            if element.find('img'):
-                block_type = 'image'
-            elif element.find('table'):
-                block_type = 'table'
-            else:
-                block_type = 'unsupported'
-        elif element.name == 'blockquote':
-            block_type = 'quote'
-        elif element.name == 'table':
-            block_type = 'table'
-        else:
-            block_type = 'unsupported'
-
-    # 开始根据 block_type 构建对应的 Notion 块
-    if block_type == 'paragraph':
-        block = {
-            "type": "paragraph",
-            "paragraph": {
-                "rich_text": html_to_rich_text(element),
-                "color": "default"
-            }
-        }
-        block_id = element.get('data-notion-block-id')
-        if block_id:
-            block['id'] = block_id
-        return block
-
-    #<details data-notion-block-type="toggle"> <summary>111</summary> <p data-notion-block-type="paragraph"> Write something </p> </details>
-    elif block_type == 'toggle':
-        summary = element.find('summary')
-        title_text = summary.get_text() if summary else ''
-        block = {
-            "type": "toggle",
-            "toggle": {
-                "rich_text": html_to_rich_text(summary)
-            },
-            "children": []
-        }
-        # 处理子元素
-        for child_element in element.find_all(recursive=False):
-            if child_element != summary:
-                child_block = element_to_notion_block(child_element)
-
-                # Check if a child-block is a list(eg. ul, ol)
-                if isinstance(child_block, list):
-                    for item in child_block:
-                        if isinstance(item, dict) and 'type' in item:  # Ensure each item in list has 'type'
-                            block["children"].append(item) # blocks.append(item)
-                elif child_block:
-                    block["children"].append(child_block)
-        return block
-
-
-
-    elif block_type == 'toggle':
-        block = {
-            "type": "toggle",
-            "toggle": {
-                "rich_text": html_to_rich_text(element.find('summary')),
-                "color": "default"
-            }
-        }
-        block_id = element.get('data-notion-block-id')
-        if block_id:
-            block['id'] = block_id
-        return block
-
-    elif block_type in ['heading_1', 'heading_2', 'heading_3']:
-        block = {
-            "type": block_type,
-            block_type: {
-                "rich_text": html_to_rich_text(element),
-                "color": "default",
-                "is_toggleable": False
-            }
-        }
-        block_id = element.get('data-notion-block-id')
-        if block_id:
-            block['id'] = block_id
-        return block
-
-    elif block_type in ['link_to_page', 'child_page']: # child_page - NOT WORKING
-
-        '''
-        <p data-notion-block-type="link_to_page" data-notion-block-id="135012cb-4981-815c-9e5a-e6de0edfb39b">
-            <a href="/page/135012cb-4981-8013-be94-e659e8bd472e">sub-1</a>
-        </p>
-        '''
-        href = element.find('a').get('href')
-        sub_id= href.split('/')[-1]
-
-        block = {
-                "type": "link_to_page",
-                "link_to_page": {
-                    "type": "page_id",
-                    "page_id": sub_id
-                }
-            }
-
-        block_id = element.get('data-notion-block-id')
-        if block_id:
-            block['id'] = block_id
-        return block
-
-
-
-
-
-    elif block_type == 'to_do':
-        blocks = []
-        for li in element.find_all('li', recursive=False):
-            label = li.find('label', class_='todo-list__label')
-            if label:
-                checkbox_input = label.find('input', type='checkbox')
-                checked = checkbox_input.has_attr('checked') if checkbox_input else False
-                description_span = label.find('span', class_='todo-list__label__description')
-                text = html_to_rich_text2(description_span)
-                block = {
-                    "type": "to_do",
-                    "to_do": {
-                        "rich_text": text,
-                        "checked": checked,
-                        "color": "default"
-                    }
-                }
-                block_id = li.get('data-notion-block-id')
-                if block_id:
-                    block['id'] = block_id
-                # 处理子任务（嵌套的 to_do_list）
-                sub_list = li.find('ul', class_='todo-list', recursive=False)
-                if sub_list:
-                    children_blocks = element_to_notion_block(sub_list)
-                    if children_blocks:
-                        block['has_children'] = True
-                        block['children'] = children_blocks
-                blocks.append(block)
-        return blocks
-
-    elif block_type in ['bulleted_list', 'numbered_list']:
-        list_type = 'bulleted_list_item' if block_type == 'bulleted_list' else 'numbered_list_item'
-        blocks = []
-        for li in element.find_all('li', recursive=False):
-            text = html_to_rich_text(li)
-            block = {
-                "type": list_type,
-                list_type: {
-                    "rich_text": text,
-                    "color": "default"
-                }
-            }
-            block_id = li.get('data-notion-block-id')
-            if block_id:
-                block['id'] = block_id
-            # 处理嵌套列表
-            sub_list = li.find(['ul', 'ol'], recursive=False)
-            if sub_list:
-                child_list_type = 'bulleted_list_item' if sub_list.name == 'ul' else 'numbered_list_item'
-                children_blocks = element_to_notion_block(sub_list)
-                if children_blocks:
-                    block['has_children'] = True
-                    block['children'] = children_blocks
-            blocks.append(block)
-        return blocks
-
-    elif block_type == 'divider':
-        block = {
-            "type": "divider",
-            "divider": {}
-        }
-        return block
-
-    elif block_type == 'code':
-        code_element = element.find('code')
-        code_text = code_element.get_text() if code_element else ''
-        language_class = code_element.get('class', [])
-        language = 'python'
-        # body.children[0].code.language should be `"abap"`, `"agda"`, `"arduino"`, `"ascii art"`, `"assembly"`, `"bash"`, `"basic"`, `"bnf"`, `"c"`, `"c#"`, `"c++"`, `"clojure"`, `"coffeescript"`, `"coq"`, `"css"`, `"dart"`, `"dhall"`, `"diff"`, `"docker"`, `"ebnf"`, `"elixir"`, `"elm"`, `"erlang"`, `"f#"`, `"flow"`, `"fortran"`, `"gherkin"`, `"glsl"`, `"go"`, `"graphql"`, `"groovy"`, `"haskell"`, `"hcl"`, `"html"`, `"idris"`, `"java"`, `"javascript"`, `"json"`, `"julia"`, `"kotlin"`, `"latex"`, `"less"`, `"lisp"`, `"livescript"`, `"llvm ir"`, `"lua"`, `"makefile"`, `"markdown"`, `"markup"`, `"matlab"`, `"mathematica"`, `"mermaid"`, `"nix"`, `"notion formula"`, `"objective-c"`, `"ocaml"`, `"pascal"`, `"perl"`, `"php"`, `"plain text"`, `"powershell"`, `"prolog"`, `"protobuf"`, `"purescript"`, `"python"`, `"r"`, `"racket"`, `"reason"`, `"ruby"`, `"rust"`, `"sass"`, `"scala"`, `"scheme"`, `"scss"`, `"shell"`, `"solidity"`, `"sql"`, `"swift"`, `"toml"`, `"typescript"`, `"vb.net"`, `"verilog"`, `"vhdl"`, `"visual basic"`, `"webassembly"`, `"xml"`, `"yaml"`, `"java/c/c++/c#"`, or `"notionscript"`
-        for cls in language_class:
-            if cls.startswith('language-'):
-                language = cls.replace('language-', '')
-                break
-        block = {
-            "type": "code",
-            "code": {
-                "rich_text": [{
-                    "type": "text",
-                    "text": {
-                        "content": code_text,
-                        "link": None
-                    },
-                    "plain_text": code_text,
-                    "href": None,
-                    "annotations": {
-                        "bold": False,
-                        "italic": False,
-                        "strikethrough": False,
-                        "underline": False,
-                        "code": False,
-                        "color": "default"
-                    }
-                }],
-                "language": language
-            }
-        }
-        block_id = element.get('data-notion-block-id')
-        if block_id:
-            block['id'] = block_id
-        return block
-
-    elif block_type == 'image':
-        img_tag = element.find('img')
-        if img_tag:
-            image_url = img_tag.get('src')
-            caption_element = element.find('figcaption')
-            caption = caption_element.get_text() if caption_element else ''
-            block = {
-                "type": "image",
-                "image": {
-                    "type": "external",
-                    "external": {
-                        "url": image_url
-                    },
-                    "caption": [{
-                        "type": "text",
-                        "text": {
-                            "content": caption,
-                            "link": None
-                        },
-                        "plain_text": caption,
-                        "href": None,
-                        "annotations": {
-                            "bold": False,
-                            "italic": False,
-                            "strikethrough": False,
-                            "underline": False,
-                            "code": False,
-                            "color": "default"
-                        }
-                    }]
-                }
-            }
-            block_id = element.get('data-notion-block-id')
-            if block_id:
-                block['id'] = block_id
-            return block
-
-    elif block_type == 'table':
-        # 处理表格
-        table_element = element.find('table') if element.name == 'figure' else element
-        if table_element:
-            rows = []
-            for tr in table_element.find_all('tr'):
-                cells = []
-                for td in tr.find_all(['td', 'th']):
-                    cell_content = html_to_rich_text(td)
-                    cells.append(cell_content)
-                row_block = {
-                    "type": "table_row",
-                    "table_row": {
-                        "cells": cells
-                    }
-                }
-                rows.append(row_block)
-            table_block = {
-                "type": "table",
-                "table": {
-                    "table_width": len(rows[0]['table_row']['cells']) if rows else 0,
-                    "has_column_header": False,
-                    "has_row_header": False,
-                    "children": rows
-                }
-            }
-            block_id = element.get('data-notion-block-id')
-            if block_id:
-                table_block['id'] = block_id
-            return table_block
-
-    elif block_type == 'quote':
-        # 处理引用块
-        # 引用块可能包含多个段落，需要将它们的内容合并
-        rich_text = []
-        for child in element.contents:
-            if isinstance(child, Tag):
-                rich_text.extend(html_to_rich_text(child))
-            elif isinstance(child, NavigableString):
-                text_content = str(child).strip()
-                if text_content:
-                    rich_text.append({
-                        "type": "text",
-                        "text": {
-                            "content": text_content,
-                            "link": None
-                        },
-                        "plain_text": text_content,
-                        "href": None,
-                        "annotations": {
-                            "bold": False,
-                            "italic": False,
-                            "strikethrough": False,
-                            "underline": False,
-                            "code": False,
-                            "color": "default"
-                        }
-                    })
-        block = {
-            "type": "quote",
-            "quote": {
-                "rich_text": rich_text,
-                "color": "default"
-            }
-        }
-        block_id = element.get('data-notion-block-id')
-        if block_id:
-            block['id'] = block_id
-        # 处理子块（如果有）
-        # if element.find_all(recursive=False):
-        #     child_blocks = []
-        #     for child_element in element.find_all(recursive=False):
-        #         child_block = element_to_notion_block(child_element)
-        #         if child_block:
-        #             child_blocks.append(child_block)
-        #     if child_blocks:
-        #         block['has_children'] = True
-        #         block['children'] = child_blocks
-        return block
+def get_notion_page_size():
+    return config.get('notion_page_size', 100)
 
+def get_page_last_edited_time(page_id):
+    try:
+        return notion.pages.retrieve(page_id=page_id).get('last_edited_time')
+    except Exception as e:
+        print(f"Error fetching last_edited_time for page {page_id}: {e}")
+        return None
 
-    else:
-        # 对于不支持的块类型，返回 None 或者按照段落处理
+def observe_page_version(page_id):
+    """
+    Look up the page's last_edited_time (one Notion call) and return its
+    content version record from page_cache, or None if Notion did not answer.
+    """
+    last_edited_time = get_page_last_edited_time(page_id)
+    if last_edited_time is None:
         return None
+    return page_cache.observe(page_id, last_edited_time)
 
+def get_page_version(page_id):
+    """
+    The page's content version without calling Notion: None if it was not
+    checked within etag_max_age seconds or was edited too recently to tell
+    edits apart (see recently_edited).
+    """
+    version = page_cache.get_version(page_id, config.get('etag_max_age', 30))
+    if version is None or recently_edited(version['last_edited_time']):
+        return None
+    return version
 
+def get_cached_block_content(page_id, version=None):
+    """
+    Rendered page HTML, served from page_cache while the page's last_edited_time is unchanged.
+    """
+    return ''.join(iter_cached_block_content(page_id, version))
 
+def iter_cached_block_content(page_id, version=None):
+    """
+    Yields the page HTML in chunks: the cached HTML in one piece on a hit, otherwise
+    each top-level block as soon as its subtree has been fetched.  A complete
+    render is stored in page_cache once the last chunk has been produced.
+    version is a record from observe_page_version, to save looking it up again.
+    """
+    if version is None:
+        version = observe_page_version(page_id)
+    last_edited_time = version['last_edited_time'] if version is not None else None
+    if last_edited_time is not None:
+        content = page_cache.get(page_id, last_edited_time)
+        if content is not None:
+            if not search_index.has_text(page_id):
+                search_index.set_text(page_id, content)
+            yield content
+            return
+    chunks = []
+    rendered = []
+    page_size = get_notion_page_size()
+    try:
+        blocks = iter_loaded_blocks(
+            notion,
+            iter_block_children(notion, page_id, page_size),
+            max_workers=config.get('notion_max_concurrency', 3),
+            page_size=page_size
+        )
+        for block in blocks:
+            chunk = parse_block(block)
+            chunks.append(chunk)
+            rendered.append(block)
+            yield chunk
+    except Exception as e:
+        yield f'<p>[Error fetching block content: {e}]</p>'
+        return
+    content = ''.join(chunks)
+    search_index.set_text(page_id, content)
+    if last_edited_time is not None and not recently_edited(last_edited_time):
+        # Signed URLs of Notion-hosted files expire although the page does not change
+        page_cache.put(page_id, last_edited_time, content, earliest_file_expiry(rendered))
+
+def earliest_file_expiry(blocks):
+    """
+    Earliest expiry_time (unix time) of the Notion-hosted files (images, files,
+    icons, ...) in blocks and their loaded children, or None if there are none.
+    """
+    earliest = None
+    stack = list(blocks)
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            expiry_time = value.get('expiry_time')
+            if isinstance(expiry_time, str):
+                try:
+                    expires = datetime.fromisoformat(expiry_time.replace('Z', '+00:00')).timestamp()
+                except ValueError:
+                    expires = 0  # Unknown: not cached
+                earliest = expires if earliest is None else min(earliest, expires)
+            stack.extend(value.values())
+        elif isinstance(value, list):
+            stack.extend(value)
+    return earliest
+
+def recently_edited(last_edited_time):
+    """
+    Notion truncates last_edited_time to the minute, so an edit made in the same
+    minute as an earlier one leaves it unchanged; don't cache pages edited that recently.
+    """
+    try:
+        edited = datetime.fromisoformat(last_edited_time.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return True
+    return (datetime.now(timezone.utc) - edited).total_seconds() < PAGE_CACHE_EDIT_WINDOW
 
-# for to_do block only
-def html_to_rich_text2(element):
-    rich_text = []
-    for content in element.contents:
-        if isinstance(content, str):
-            if content.strip():
-                rich_text.append({
-                    "type": "text",
-                    "text": {
-                        "content": content.strip()
-                    },
-                    "plain_text": content.strip()
-                })
-        elif content.name == 'strong' or content.name == 'b':
-            text = content.get_text()
-            rich_text.append({
-                "type": "text",
-                "text": {
-                    "content": text
-                },
-                "annotations": {
-                    "bold": True
-                },
-                "plain_text": text
-            })
-        elif content.name == 'em' or content.name == 'i':
-            text = content.get_text()
-            rich_text.append({
-                "type": "text",
-                "text": {
-                    "content": text
-                },
-                "annotations": {
-                    "italic": True
-                },
-                "plain_text": text
-            })
-        elif content.name == 'u':
-            text = content.get_text()
-            rich_text.append({
-                "type": "text",
-                "text": {
-                    "content": text
-                },
-                "annotations": {
-                    "underline": True
-                },
-                "plain_text": text
-            })
-        elif content.name == 's':
-            text = content.get_text()
-            rich_text.append({
-                "type": "text",
-                "text": {
-                    "content": text
-                },
-                "annotations": {
-                    "strikethrough": True
-                },
-                "plain_text": text
-            })
-        elif content.name == 'code':
-            text = content.get_text()
-            rich_text.append({
-                "type": "text",
-                "text": {
-                    "content": text
-                },
-                "annotations": {
-                    "code": True
-                },
-                "plain_text": text
-            })
-        elif content.name == 'a':
-            text = content.get_text()
-            href = content.get('href')
-            rich_text.append({
-                "type": "text",
-                "text": {
-                    "content": text,
-                    "link": {
-                        "url": href
-                    }
-                },
-                "plain_text": '[' + text + ']: (' + href + ')'
-            })
-        else:
-            # 递归处理其他标签
-            rich_text.extend(html_to_rich_text(content))
-    return rich_text
-
-
-def html_to_rich_text(element):
-    rich_text = []
-
-    for content in element.contents:
-        if isinstance(content, NavigableString):
-            text_content = str(content).strip()
-            if text_content:
-                rich_text.append({
-                    "type": "text",
-                    "text": {
-                        "content": text_content,
-                        "link": None
-                    },
-                    "plain_text": text_content,
-                    "href": None,
-                    "annotations": {
-                        "bold": False,
-                        "italic": False,
-                        "strikethrough": False,
-                        "underline": False,
-                        "code": False,
-                        "color": "default"
-                    }
-                })
-        elif isinstance(content, Tag):
-            text_content = content.get_text()
-            # f'<span class="colortag" style="color:{annotations["color"]}">{text}</span>'
-            text_color = "default"
-            # check if color is set, by checking 
-            # 1. if is a span with classname:colortag
-            # 2. the style <color> attribute
-            if content.name == 'span':# and 'colortag' in content.get('class', []):
-                # check if color exist and is set:
-                if 'style' in content.attrs and 'color' in content['style'] and 'background-color' not in content['style']:
-                    text_color = content.get('style', '').replace('color:', '').replace(';', '')
-                    # check if hsl color, convert to css color name
-                    if 'hsl' in text_color:
-                        text_color = hsl_to_css_color_name_notion(text_color)
-                    # check if rgb hex (#rrggbb or #rgb) color, convert to css color name
-                    elif '#' in text_color:
-                        text_color = hex_to_css_color_name_limited(text_color)
-                    elif 'black' in text_color:
-                        text_color = "default"
-                    elif 'white' in text_color:
-                        text_color = "default"
-                    else:
-                        text_color = text_color
-                # check if background color exist and is set:
-                elif 'style' in content.attrs and 'background-color' in content['style']:
-                    text_color = content.get('style', '').replace('background-color:', '').replace(';', '')
-                    if 'hsl' in text_color:
-                        text_color = hsl_to_css_color_name_notion(text_color) + '_background'
-                    else:
-                        text_color = text_color + '_background'
-            annotations = {
-                "bold": content.name in ['strong', 'b'],
-                "italic": content.name in ['em', 'i'],
-                "strikethrough": content.name == 's',
-                "underline": content.name == 'u',
-                "code": content.name == 'code',
-                "color": text_color
-            }
-            href = content.get('href') if content.name == 'a' else None
-            rich_text.append({
-                "type": "text",
-                "text": {
-                    "content": text_content,
-                    "link": {"url": href} if href else None
-                },
-                "plain_text": text_content,
-                "href": href,
-                "annotations": annotations
-            })
-    return rich_text
-        
-def list_element_to_notion_block(element, list_type):
-    items = element.find_all('li', recursive=False)
-    blocks = []
-    for item in items:
-        text = html_to_rich_text(item)
-        block = {
-            "type": list_type,
-            list_type: {
-                "rich_text": text
-            }
-        }
-        # 检查是否有嵌套列表
-        for child in item.find_all(recursive=False):
-            if child.name in ['ul', 'ol']:
-                child_blocks = list_element_to_notion_block(
-                    child,
-                    'bulleted_list_item' if child.name == 'ul' else 'numbered_list_item'
-                )
-                block['children'].extend(child_blocks)
-        blocks.append(block)
-    return blocks
+def get_child_blocks(block):
+    """
+    Children attached by load_block_tree, or fetched from Notion when not preloaded.
+    """
+    children = block.get('children')
+    if children is None:
+        children = list_block_children(notion, block['id'], get_notion_page_size())
+    return children
 
+# Block type -> HTML handlers; extend with block_renderer.py's register_block_renderer(block_type)
+block_renderer = BlockRenderer(get_children=get_child_blocks, get_page_title=get_page_title)
 
+def parse_block(block):
+    """
+    Render one block (and its children) to HTML through the block_renderer registry.
+    """
+    return block_renderer.render(block)
@@ -0,0 +1,176 @@
+# app/page_cache.py
+
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# Pages with Notion-hosted files are dropped this long before their signed URLs expire
+FILE_URL_MARGIN = 300
+
+
+class RenderedPageCache:
+    """
+    Size-bounded LRU of rendered page HTML, validated against the page's last_edited_time.
+
+    Entries are keyed by page id and hold (last_edited_time, html).  A lookup only
+    hits when the caller passes the same last_edited_time, so validating an entry
+    costs one pages.retrieve call instead of re-fetching the whole block tree.
+    If a shared backend is given it is used as a second level, so a page rendered
+    by one worker process can be served by the others.
+
+    HTML embedding Notion-hosted files carries their signed URLs, which expire
+    (after about an hour) even though the page is unchanged; put() is given the
+    earliest expiry and the entry is dropped FILE_URL_MARGIN seconds before it.
+
+    It also keeps a content version per page (observe / get_version), used as
+    the page's ETag so an unchanged page can be answered with a 304.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, backend=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.backend = backend
+        self._entries = OrderedDict()
+        self._versions = {}  # page_id -> content version record (see observe)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'shared_hits': 0,
+            'misses': 0,
+            'stale': 0,
+            'expired': 0,
+            'invalidations': 0,
+            'evictions': 0
+        }
+
+    def get(self, page_id, last_edited_time):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(page_id)
+            if entry is not None:
+                if entry[0] == last_edited_time and (entry[2] is None or now < entry[2]):
+                    self._entries.move_to_end(page_id)
+                    self.stats['hits'] += 1
+                    return entry[1]
+                self._drop(page_id)
+                self.stats['stale' if entry[0] != last_edited_time else 'expired'] += 1
+        if self.backend is not None and self.backend.shared:
+            shared = self.backend.get_content(self._backend_key(page_id))
+            if shared is not None:
+                shared_edited_time, expires = self._split_version(shared[0])
+                if shared_edited_time == last_edited_time and (expires is None or now < expires):
+                    with self._lock:
+                        self._store(page_id, last_edited_time, shared[1], expires)
+                        self.stats['shared_hits'] += 1
+                    return shared[1]
+        with self._lock:
+            self.stats['misses'] += 1
+        return None
+
+    def put(self, page_id, last_edited_time, html, files_expire=None):
+        """
+        Cache html; files_expire is the earliest expiry (unix time) of the
+        signed file URLs in it, if any.
+        """
+        expires = files_expire - FILE_URL_MARGIN if files_expire is not None else None
+        if expires is not None and expires <= time.time():
+            return
+        with self._lock:
+            self._store(page_id, last_edited_time, html, expires)
+        if self.backend is not None:
+            version = f"{last_edited_time}@{expires if expires is not None else ''}"
+            self.backend.set_content(self._backend_key(page_id), version, html)
+
+    def invalidate(self, page_id):
+        with self._lock:
+            self._drop(page_id)
+            self.stats['invalidations'] += 1
+        if self.backend is not None:
+            self.backend.delete_content(self._backend_key(page_id))
+        # Whatever the page's last_edited_time says next, it is a new version
+        self._set_version(page_id, {'version': uuid.uuid4().hex, 'last_edited_time': None, 'checked': 0, 'modified': time.time()})
+
+    def observe(self, page_id, last_edited_time):
+        """
+        Record last_edited_time as just read from Notion.  Returns the page's
+        content version: {'version', 'last_edited_time', 'checked', 'modified'}.
+        The version changes whenever last_edited_time does or the page is invalidated.
+        """
+        record = self._get_version(page_id)
+        now = time.time()
+        if record is None or record['last_edited_time'] != last_edited_time:
+            record = {'version': uuid.uuid4().hex, 'last_edited_time': last_edited_time, 'modified': now}
+        record['checked'] = now
+        self._set_version(page_id, record)
+        return record
+
+    def get_version(self, page_id, max_age):
+        """
+        The content version recorded by observe, if it was checked against Notion
+        within max_age seconds; lets a conditional GET be answered without a Notion call.
+        """
+        record = self._get_version(page_id)
+        if record is None or record['last_edited_time'] is None or time.time() - record['checked'] > max_age:
+            return None
+        return record
+
+    def _get_version(self, page_id):
+        if self.backend is not None and self.backend.shared:
+            stored = self.backend.get_content(self._version_key(page_id))
+            return json.loads(stored[1]) if stored else None
+        with self._lock:
+            record = self._versions.get(page_id)
+            return dict(record) if record is not None else None
+
+    def _set_version(self, page_id, record):
+        if self.backend is not None and self.backend.shared:
+            # Shared, so every worker answers with the same ETag
+            self.backend.set_content(self._version_key(page_id), record['last_edited_time'], json.dumps(record))
+            return
+        with self._lock:
+            self._versions[page_id] = record
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._size
+        return stats
+
+    def _store(self, page_id, last_edited_time, html, expires=None):
+        self._drop(page_id)
+        # Rough size: str length; good enough for bounding memory
+        size = len(html)
+        if size > self.max_bytes:
+            return
+        self._entries[page_id] = (last_edited_time, html, expires)
+        self._size += size
+        while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+            evicted_id, _ = next(iter(self._entries.items()))
+            self._drop(evicted_id)
+            self.stats['evictions'] += 1
+
+    def _drop(self, page_id):
+        entry = self._entries.pop(page_id, None)
+        if entry is not None:
+            self._size -= len(entry[1])
+
+    @staticmethod
+    def _split_version(version):
+        # Shared entries are versioned "last_edited_time@expires" ("last_edited_time@" without hosted
+        # files); entries written before expiries were kept have no "@" and never match
+        last_edited_time, separator, expires = (version or '').partition('@')
+        if not separator:
+            return None, None
+        return last_edited_time, float(expires) if expires else None
+
+    @staticmethod
+    def _backend_key(page_id):
+        return f'page_html:{page_id}'
+
+    @staticmethod
+    def _version_key(page_id):
+        return f'page_version:{page_id}'
@@ -0,0 +1,404 @@
+# app/page_copy.py
+#
+# Deep copy of a Notion page.  The source block tree is fetched breadth-first
+# on the shared pool (load_block_tree), turned into create payloads without
+# the read-only fields, and written with the batched appends of
+# append_planner, so a large page costs a handful of requests per nesting
+# level instead of one per block -- and nothing past the first 100 children
+# or below the first level is lost.
+#
+# Files uploaded to Notion come with signed URLs that expire after an hour, so
+# the copy cannot simply link to them: they are re-uploaded through the
+# rehost_file hook (the MinIO bucket behind /upload_image), or left out and
+# reported in the job status when that is not possible.
+
+import json
+import os
+import threading
+import time
+import uuid
+from urllib.parse import unquote, urlparse
+
+from .append_planner import append_block_tree, count_blocks
+from .block_loader import DEFAULT_MAX_WORKERS, get_executor, load_block_tree
+from .notion_api import DEFAULT_PAGE_SIZE, iter_block_children_pages
+from .page_diff import count_loaded_children
+
+# Fields Notion sets itself; create/append requests reject them
+READ_ONLY_BLOCK_KEYS = {
+    'id',
+    'object',
+    'parent',
+    'created_time',
+    'last_edited_time',
+    'created_by',
+    'last_edited_by',
+    'has_children',
+    'archived',
+    'in_trash',
+    'request_id'
+}
+
+# Blocks the API can list but not create
+UNCOPYABLE_BLOCK_TYPES = {
+    'child_database',
+    'unsupported',
+    'link_preview',
+    'template',
+    'breadcrumb_placeholder'
+}
+
+FILE_BLOCK_TYPES = {'image', 'video', 'file', 'pdf', 'audio'}
+
+# Database properties a copied row can be created with (the others are computed, or hold expiring file URLs)
+COPYABLE_PROPERTY_TYPES = {
+    'title',
+    'rich_text',
+    'number',
+    'select',
+    'multi_select',
+    'status',
+    'date',
+    'checkbox',
+    'url',
+    'email',
+    'phone_number',
+    'people',
+    'relation'
+}
+
+# copy job states
+FETCHING = 'fetching'
+WRITING = 'writing'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def needs_copy_children(block):
+    """
+    should_load for load_block_tree: every nested block except sub pages,
+    databases and synced block references (their content lives elsewhere).
+    """
+    if not block.get('has_children') or 'children' in block:
+        return False
+    block_type = block.get('type')
+    if block_type in ('child_page', 'child_database') or block_type in UNCOPYABLE_BLOCK_TYPES:
+        return False
+    if block_type == 'synced_block' and (block.get('synced_block') or {}).get('synced_from'):
+        return False
+    return True
+
+
+def is_hosted_file(block):
+    """
+    A file block whose file Notion hosts (behind an expiring signed URL).
+    """
+    block_type = block.get('type')
+    return block_type in FILE_BLOCK_TYPES and (block.get(block_type) or {}).get('type') == 'file'
+
+
+def iter_hosted_files(blocks):
+    stack = list(blocks)
+    while stack:
+        block = stack.pop()
+        if is_hosted_file(block):
+            yield block
+        stack.extend(block.get('children') or [])
+
+
+def file_name(url, default='file'):
+    # Last path segment of a (signed) file URL
+    return unquote(os.path.basename(urlparse(url).path)) or default
+
+
+def copy_block(block, file_urls=None):
+    """
+    Create payload for `block` and its loaded children, or None if it cannot be
+    created.  file_urls maps the ids of Notion-hosted file blocks to the
+    permanent URL of their re-uploaded file; without one they are left out.
+    """
+    block_type = block.get('type')
+    if block_type in UNCOPYABLE_BLOCK_TYPES:
+        return None
+    if block_type == 'child_page':
+        # The sub page itself is not duplicated; the copy links to it
+        return {'type': 'link_to_page', 'link_to_page': {'type': 'page_id', 'page_id': block['id']}}
+
+    value = dict(block.get(block_type) or {})
+    if is_hosted_file(block):
+        url = (file_urls or {}).get(block['id'])
+        if url is None:
+            return None
+        value = {key: item for key, item in value.items() if key not in ('file', 'type')}
+        value['type'] = 'external'
+        value['external'] = {'url': url}
+    elif block_type == 'link_to_page' and value.get('type') == 'database_id':
+        value = {'type': 'database_id', 'database_id': value['database_id']}
+
+    payload = {key: item for key, item in block.items() if key not in READ_ONLY_BLOCK_KEYS and key not in ('children', block_type)}
+    payload[block_type] = value
+    if block_type == 'synced_block' and value.get('synced_from'):
+        # A reference to another synced block: its content comes with the reference
+        return payload
+
+    # Nested children go inside the type object, where the append endpoint expects them
+    children = [child for child in (copy_block(child, file_urls) for child in block.get('children') or []) if child]
+    value.pop('children', None)
+    if children or block_type == 'table':
+        value['children'] = children
+    return payload
+
+
+def copy_target(notion_client, original_page):
+    """
+    (parent, properties) for creating the copy of original_page next to it:
+    the title with " (copy)" appended, and for a database row its other
+    writable properties.  A page inside a block (e.g. a column) is copied to
+    the end of the page holding that block.  Raises ValueError for a page at
+    the top level of the workspace, where an integration cannot create pages.
+    """
+    parent = original_page.get('parent') or {}
+    while parent.get('type') == 'block_id':
+        parent = notion_client.blocks.retrieve(parent['block_id']).get('parent') or {}
+    properties = original_page.get('properties') or {}
+    if parent.get('type') == 'page_id':
+        title = ''.join(t['plain_text'] for t in properties['title']['title'])
+        return {'page_id': parent['page_id']}, {'title': {'title': [{'text': {'content': title + ' (copy)'}}]}}
+    if parent.get('type') == 'database_id':
+        copied = {}
+        for name, prop in properties.items():
+            prop_type = prop.get('type')
+            if prop_type not in COPYABLE_PROPERTY_TYPES:
+                continue
+            value = prop[prop_type]
+            if prop_type == 'title':
+                title = ''.join(t['plain_text'] for t in value)
+                value = [{'text': {'content': title + ' (copy)'}}]
+            elif prop_type == 'people':
+                value = [{'id': person['id']} for person in value]
+            elif prop_type == 'relation':
+                value = [{'id': related['id']} for related in value]
+            elif prop_type in ('select', 'status') and value:
+                value = {'name': value['name']}
+            elif prop_type == 'multi_select':
+                value = [{'name': option['name']} for option in value]
+            copied[name] = {prop_type: value}
+        return {'database_id': parent['database_id']}, copied
+    if parent.get('type') == 'workspace':
+        raise ValueError('Pages at the top level of the workspace cannot be duplicated: the integration can only create pages inside a page or database')
+    raise ValueError(f"Cannot duplicate a page whose parent is of type {parent.get('type')!r}")
+
+
+class CopyJob:
+    """
+    Progress of one page duplication, safe to read from the status endpoint
+    while the copy runs.
+    """
+
+    def __init__(self, job_id, page_id):
+        self.job_id = job_id
+        self.page_id = page_id
+        self.status = FETCHING
+        self.blocks_total = 0
+        self.blocks_written = 0
+        self.requests = 0
+        self.new_page_id = None
+        self.files_copied = 0
+        self.files_skipped = []  # [{'block_id', 'type', 'name', 'error'}] left out of the copy
+        self.error = None
+        self.started = time.time()
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def update(self, **fields):
+        with self._lock:
+            for key, value in fields.items():
+                setattr(self, key, value)
+
+    def add_written(self, count):
+        with self._lock:
+            self.blocks_written = min(self.blocks_total, self.blocks_written + count)
+
+    def skip_file(self, block_id, block_type, name, error):
+        with self._lock:
+            self.files_skipped.append({'block_id': block_id, 'type': block_type, 'name': name, 'error': error})
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'job_id': self.job_id,
+                'page_id': self.page_id,
+                'status': self.status,
+                'blocks_total': self.blocks_total,
+                'blocks_written': self.blocks_written,
+                'requests': self.requests,
+                'new_page_id': self.new_page_id,
+                'files_copied': self.files_copied,
+                'files_skipped': list(self.files_skipped),
+                'error': self.error,
+                'elapsed': round((self.finished or time.time()) - self.started, 3)
+            }
+
+
+class PageCopier:
+    """
+    Runs page duplications in background threads and keeps their progress.
+
+    With a shared cache backend the progress is also published there, so the
+    status can be polled through any worker process.  rehost_file(url, name)
+    re-uploads a Notion-hosted file and returns its permanent URL; without it
+    such files are left out of copies.
+    """
+
+    def __init__(self, notion_client, backend=None, max_workers=DEFAULT_MAX_WORKERS, page_size=DEFAULT_PAGE_SIZE, retention=3600, rehost_file=None):
+        self.notion = notion_client
+        self.backend = backend
+        self.rehost_file = rehost_file
+        self.max_workers = max_workers
+        self.page_size = page_size
+        self.retention = retention
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def start(self, page_id, on_done=None):
+        """
+        Start copying page_id; returns the job id.  on_done(job, new_page) runs
+        after a successful copy, e.g. to refresh the page tree cache.
+        """
+        job = CopyJob(uuid.uuid4().hex, page_id)
+        with self._lock:
+            self._purge()
+            self._jobs[job.job_id] = job
+        self._publish(job)
+        threading.Thread(target=self._run, args=(job, on_done), name=f'page-copy-{job.job_id[:8]}', daemon=True).start()
+        return job.job_id
+
+    def get_status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        if self.backend is not None and self.backend.shared:
+            stored = self.backend.get_content(f'copy_job:{job_id}')
+            if stored:
+                return json.loads(stored[1])
+        return None
+
+    def _run(self, job, on_done):
+        try:
+            new_page = copy_page(self.notion, job.page_id, job, self.max_workers, self.page_size, self._publish, self.rehost_file)
+        except Exception as e:
+            print(f"Error duplicating page {job.page_id}: {e}")
+            job.update(status=FAILED, error=str(e), finished=time.time())
+            self._publish(job)
+            return
+        if on_done is not None:
+            # Before reporting done, so a client reloading on 'done' sees the new page
+            try:
+                on_done(job, new_page)
+            except Exception as e:
+                print(f"Error after duplicating page {job.page_id}: {e}")
+        job.update(status=DONE, finished=time.time())
+        self._publish(job)
+
+    def _publish(self, job):
+        if self.backend is not None and self.backend.shared:
+            try:
+                self.backend.set_content(f'copy_job:{job.job_id}', 0, json.dumps(job.to_dict()))
+            except Exception as e:
+                print(f"Error publishing copy progress: {e}")
+
+    def _purge(self):
+        now = time.time()
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished and now - job.finished > self.retention]:
+            del self._jobs[job_id]
+            if self.backend is not None and self.backend.shared:
+                self.backend.delete_content(f'copy_job:{job_id}')
+
+
+def copy_page(notion_client, page_id, job, max_workers=DEFAULT_MAX_WORKERS, page_size=DEFAULT_PAGE_SIZE, publish=None, rehost_file=None):
+    """
+    Duplicate page_id (title + " (copy)", icon, cover and the whole block tree)
+    under the same parent, recording progress on `job`.  Returns the new page.
+    """
+    publish = publish or (lambda job: None)
+    original_page = notion_client.pages.retrieve(page_id)
+    # Before any copying, so a page that cannot be duplicated fails the job with the reason
+    parent, properties = copy_target(notion_client, original_page)
+    blocks = []
+    reads = 1
+    for results in iter_block_children_pages(notion_client, page_id, page_size):
+        blocks.extend(results)
+        reads += 1
+    load_block_tree(notion_client, blocks, max_workers, page_size, should_load=needs_copy_children)
+    reads += count_loaded_children(blocks)
+    file_urls = rehost_files(list(iter_hosted_files(blocks)), rehost_file, job, max_workers)
+    payloads = [payload for payload in (copy_block(block, file_urls) for block in blocks) if payload]
+    job.update(status=WRITING, blocks_total=sum(count_blocks(payload) for payload in payloads), requests=reads)
+    publish(job)
+
+    create_kwargs = {'parent': parent, 'properties': properties}
+    for key in ('icon', 'cover'):
+        if original_page.get(key):
+            media = _copy_page_media(original_page[key], key, rehost_file, job)
+            if media is not None:
+                create_kwargs[key] = media
+    new_page = notion_client.pages.create(**create_kwargs)
+    job.update(new_page_id=new_page['id'], requests=job.requests + 1)
+    publish(job)
+
+    def on_progress(count):
+        job.add_written(count)
+        publish(job)
+
+    calls = append_block_tree(notion_client, new_page['id'], payloads, max_workers=max_workers, on_progress=on_progress)
+    job.update(requests=job.requests + calls)
+    return new_page
+
+
+def rehost_files(file_blocks, rehost_file, job, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Re-upload the files of Notion-hosted file blocks concurrently; returns
+    {block id: permanent URL}.  Files that cannot be re-uploaded are recorded
+    in job.files_skipped.
+    """
+    if not file_blocks:
+        return {}
+    if rehost_file is None:
+        for block in file_blocks:
+            job.skip_file(block['id'], block['type'], _block_file_name(block), 'no file storage configured')
+        return {}
+    pool = get_executor(max_workers, 'copy-files')
+    futures = [(block, pool.submit(rehost_file, block[block['type']]['file']['url'], _block_file_name(block))) for block in file_blocks]
+    file_urls = {}
+    for block, future in futures:
+        try:
+            file_urls[block['id']] = future.result()
+        except Exception as e:
+            print(f"Error copying the file of block {block['id']}: {e}")
+            job.skip_file(block['id'], block['type'], _block_file_name(block), str(e))
+    job.update(files_copied=job.files_copied + len(file_urls))
+    return file_urls
+
+
+def _block_file_name(block):
+    value = block[block['type']]
+    return value.get('name') or file_name(value['file']['url'])
+
+
+def _copy_page_media(media, key, rehost_file, job):
+    # Icon / cover of the copy; a Notion-hosted one is re-uploaded or left out
+    if media.get('type') != 'file':
+        return media
+    name = file_name(media['file']['url'], key)
+    if rehost_file is None:
+        job.skip_file(None, key, name, 'no file storage configured')
+        return None
+    try:
+        url = rehost_file(media['file']['url'], name)
+    except Exception as e:
+        print(f"Error copying the page {key}: {e}")
+        job.skip_file(None, key, name, str(e))
+        return None
+    job.update(files_copied=job.files_copied + 1)
+    return {'type': 'external', 'external': {'url': url}}
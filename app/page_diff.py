@@ -0,0 +1,330 @@
+# app/page_diff.py
+#
+# Turns an editor save into the smallest set of Notion block operations.
+#
+# The submitted HTML is parsed by html_to_notion_blocks, which keeps each
+# block's data-notion-block-id.  Blocks are matched to the current block tree
+# by id; matched blocks are updated in place only when their content changed,
+# new blocks are appended after the nearest kept sibling, and blocks that
+# disappeared are archived.  Block ids of untouched content stay stable.
+
+from bisect import bisect_left
+
+from .block_loader import DEFAULT_MAX_WORKERS, load_block_tree
+from .notion_api import DEFAULT_PAGE_SIZE, iter_block_children_pages
+
+# Block types html_to_notion_blocks can produce.  Anything else (child_page,
+# child_database, callout, file, ...) does not survive the editor round trip
+# and is left untouched instead of being archived.
+EDITABLE_BLOCK_TYPES = {
+    'paragraph',
+    'heading_1',
+    'heading_2',
+    'heading_3',
+    'quote',
+    'bulleted_list_item',
+    'numbered_list_item',
+    'to_do',
+    'toggle',
+    'code',
+    'divider',
+    'image',
+    'link_to_page',
+    'table'
+}
+
+# Types Notion cannot update in place in a way the editor can express; a change means replace
+REPLACE_ON_CHANGE_TYPES = {'image', 'link_to_page', 'table'}
+
+
+class PageDiff:
+    """
+    Operations needed to turn the current block tree into the submitted one.
+
+    updates: [(block_id, payload)], appends: [(parent_id, after_id, blocks)],
+    archives: [block_id].  after_id None appends at the end of the parent.
+    """
+
+    def __init__(self):
+        self.updates = []
+        self.appends = []
+        self.archives = []
+        self.unchanged = 0
+
+    def update(self, block_id, payload):
+        self.updates.append((block_id, payload))
+
+    def append(self, parent_id, after_id, blocks):
+        self.appends.append((parent_id, after_id, [strip_block_ids(block) for block in blocks]))
+
+    def archive(self, block_id):
+        self.archives.append(block_id)
+
+
+def diff_blocks(parent_id, current_blocks, new_blocks, diff=None):
+    """
+    Diff the children of parent_id.  current_blocks must have their nested
+    children loaded (see load_block_tree); new_blocks come from html_to_notion_blocks.
+    """
+    diff = diff if diff is not None else PageDiff()
+    current = [block for block in current_blocks if block['type'] in EDITABLE_BLOCK_TYPES]
+    positions = {block['id']: idx for idx, block in enumerate(current)}
+    # e.g. a child_page comes back as a link_to_page with the same id; it stays as it is
+    preserved_ids = {block['id'] for block in current_blocks if block['type'] not in EDITABLE_BLOCK_TYPES}
+
+    # Pair submitted blocks with current blocks by id
+    pairs = []
+    paired = set()
+    for new_block in new_blocks:
+        block_id = new_block.get('id')
+        if block_id in preserved_ids:
+            diff.unchanged += 1
+            continue
+        match = None
+        if block_id in positions and block_id not in paired:
+            candidate = current[positions[block_id]]
+            if can_update_in_place(candidate, new_block):
+                match = candidate
+                paired.add(block_id)
+        pairs.append([new_block, match])
+
+    # Notion cannot move blocks: keep the longest run of matches that is still in
+    # the original order, the others are recreated at their new position
+    matched = [pair for pair in pairs if pair[1] is not None]
+    in_order = longest_increasing_subsequence([positions[pair[1]['id']] for pair in matched])
+    for idx, pair in enumerate(matched):
+        if idx not in in_order:
+            pair[1] = None
+
+    kept_ids = {pair[1]['id'] for pair in pairs if pair[1] is not None}
+    for block in current:
+        if block['id'] not in kept_ids:
+            diff.archive(block['id'])
+
+    anchor = None
+    run = []
+    for new_block, current_block in pairs:
+        if current_block is None:
+            run.append(new_block)
+            continue
+        if run and anchor is None:
+            # Blocks can only be inserted after an existing block: the first kept
+            # block hosts the leading run and is recreated right behind it
+            anchor = current_block['id']
+            diff.archive(current_block['id'])
+            run.append(new_block)
+            continue
+        if run:
+            diff.append(parent_id, anchor, run)
+            run = []
+        diff_block(current_block, new_block, diff)
+        anchor = current_block['id']
+    if run:
+        diff.append(parent_id, anchor, run)
+    return diff
+
+
+def diff_block(current_block, new_block, diff):
+    block_type = current_block['type']
+    if block_signature(current_block) != block_signature(new_block):
+        diff.update(current_block['id'], update_payload(new_block))
+    else:
+        diff.unchanged += 1
+
+    if block_type == 'table':
+        diff_table_rows(current_block, new_block, diff)
+    else:
+        # Children the editor renders outside their parent (e.g. under a paragraph)
+        # come back as siblings, so anything not resubmitted here is archived
+        diff_blocks(current_block['id'], current_block.get('children') or [], new_block.get('children') or [], diff)
+
+
+def diff_table_rows(current_block, new_block, diff):
+    current_rows = [row for row in current_block.get('children') or [] if row['type'] == 'table_row']
+    new_rows = new_block['table'].get('children') or []
+    for current_row, new_row in zip(current_rows, new_rows):
+        new_cells = new_row['table_row']['cells']
+        if [normalize_rich_text(cell) for cell in current_row['table_row']['cells']] != [normalize_rich_text(cell) for cell in new_cells]:
+            diff.update(current_row['id'], {'table_row': {'cells': new_cells}})
+        else:
+            diff.unchanged += 1
+    if len(new_rows) > len(current_rows):
+        after = current_rows[-1]['id'] if current_rows else None
+        diff.append(current_block['id'], after, new_rows[len(current_rows):])
+    for current_row in current_rows[len(new_rows):]:
+        diff.archive(current_row['id'])
+
+
+def can_update_in_place(current_block, new_block):
+    if current_block['type'] != new_block['type']:
+        return False
+    if current_block['type'] in REPLACE_ON_CHANGE_TYPES:
+        return block_signature(current_block) == block_signature(new_block)
+    return True
+
+
+def block_signature(block):
+    """
+    The parts of a block the editor can express, normalised so that an unedited
+    block compares equal to its parsed HTML.
+    """
+    block_type = block['type']
+    value = block.get(block_type) or {}
+    if block_type == 'image':
+        image = value.get('file') or value.get('external') or {}
+        # Notion-hosted file URLs are signed and change on every fetch; the editor
+        # sends them back as external URLs, so compare without the query string
+        url = image.get('url', '').split('?', 1)[0]
+        return (block_type, url, normalize_rich_text(value.get('caption')))
+    if block_type == 'link_to_page':
+        return (block_type, value.get('page_id'))
+    if block_type == 'table':
+        return (block_type, value.get('table_width'))
+    signature = (block_type, normalize_rich_text(value.get('rich_text')))
+    if block_type == 'to_do':
+        signature += (bool(value.get('checked')),)
+    elif block_type == 'code':
+        signature += ((value.get('language') or '').lower(),)
+    return signature
+
+
+def normalize_rich_text(rich_text):
+    """
+    Rich text as a tuple of (text, annotations, link) runs.  Adjacent runs with the
+    same style are merged and whitespace is collapsed, since the HTML parser
+    strips the whitespace at run boundaries.
+    """
+    runs = []
+    for text_obj in rich_text or []:
+        annotations = text_obj.get('annotations') or {}
+        text = text_obj.get('text') or {}
+        link = (text.get('link') or {}).get('url') or text_obj.get('href')
+        style = (
+            bool(annotations.get('bold')),
+            bool(annotations.get('italic')),
+            bool(annotations.get('strikethrough')),
+            bool(annotations.get('underline')),
+            bool(annotations.get('code')),
+            annotations.get('color') or 'default',
+            link
+        )
+        content = text.get('content', text_obj.get('plain_text', ''))
+        if runs and runs[-1][1] == style:
+            runs[-1][0] += ' ' + content
+        else:
+            runs.append([content, style])
+    return tuple((' '.join(content.split()), style) for content, style in runs if content.strip())
+
+
+def update_payload(block):
+    block_type = block['type']
+    value = block[block_type]
+    payload = {'rich_text': value.get('rich_text', [])}
+    if block_type == 'to_do':
+        payload['checked'] = value.get('checked', False)
+    elif block_type == 'code':
+        payload['language'] = value.get('language')
+    return {block_type: payload}
+
+
+def strip_block_ids(block):
+    """
+    Copy of a parsed block ready for blocks.children.append (no id / has_children).
+    """
+    block = {key: value for key, value in block.items() if key not in ('id', 'has_children')}
+    if block.get('children'):
+        block['children'] = [strip_block_ids(child) for child in block['children']]
+    return block
+
+
+def longest_increasing_subsequence(values):
+    """
+    Indices (into values) of one longest strictly increasing subsequence.
+    """
+    tails = []  # tails[k]: value ending the best subsequence of length k + 1
+    tail_indices = []
+    previous = [None] * len(values)
+    for idx, value in enumerate(values):
+        k = bisect_left(tails, value)
+        if k == len(tails):
+            tails.append(value)
+            tail_indices.append(idx)
+        else:
+            tails[k] = value
+            tail_indices[k] = idx
+        previous[idx] = tail_indices[k - 1] if k > 0 else None
+    result = set()
+    idx = tail_indices[-1] if tail_indices else None
+    while idx is not None:
+        result.add(idx)
+        idx = previous[idx]
+    return result
+
+
+def count_append_calls(blocks):
+    """
+    Calls the old recursive append_blocks makes for `blocks`: one per list of children.
+    """
+    if not blocks:
+        return 0
+    return 1 + sum(count_append_calls(block.get('children')) for block in blocks)
+
+
+def save_page_diff(notion_client, page_id, new_blocks, append_blocks, page_size=DEFAULT_PAGE_SIZE, max_workers=DEFAULT_MAX_WORKERS, on_write=None):
+    """
+    Write new_blocks to page_id with the minimal operations and return a report.
+
+    append_blocks(notion_client, parent_id, blocks, after=None, on_progress=None)
+    must return the number of API calls it made, calling on_progress(count)
+    after each request.  The report compares the calls made with what
+    archiving every block and re-appending the page would have cost.
+    on_write() is called before every write request; an exception from it
+    stops the save.
+    """
+    current_blocks = []
+    reads = 0
+    for results in iter_block_children_pages(notion_client, page_id, page_size):
+        current_blocks.extend(results)
+        reads += 1
+    reads += count_loaded_children(load_block_tree(notion_client, current_blocks, max_workers, page_size))
+
+    diff = diff_blocks(page_id, current_blocks, new_blocks)
+    before_write = on_write or (lambda: None)
+    for block_id, payload in diff.updates:
+        before_write()
+        notion_client.blocks.update(block_id=block_id, **payload)
+    append_calls = 0
+    for parent_id, after_id, blocks in diff.appends:
+        before_write()
+        # The planner's follow-up requests report back after each one
+        append_calls += append_blocks(notion_client, parent_id, blocks, after=after_id, on_progress=lambda count: before_write())
+    # Archive last, so every `after` anchor still exists while appending
+    for block_id in diff.archives:
+        before_write()
+        notion_client.blocks.update(block_id=block_id, archived=True)
+
+    calls = reads + len(diff.updates) + append_calls + len(diff.archives)
+    baseline_calls = (reads - count_loaded_children(current_blocks)) + len(current_blocks) + count_append_calls(new_blocks)
+    return {
+        'updated': len(diff.updates),
+        'appended': sum(len(blocks) for _, _, blocks in diff.appends),
+        'archived': len(diff.archives),
+        'unchanged': diff.unchanged,
+        'calls': calls,
+        'baseline_calls': baseline_calls,
+        'saved_calls': baseline_calls - calls
+    }
+
+
+def count_loaded_children(blocks):
+    """
+    Number of children listings load_block_tree made for `blocks`.
+    """
+    count = 0
+    stack = list(blocks)
+    while stack:
+        block = stack.pop()
+        if 'children' in block:
+            count += 1
+            stack.extend(block['children'])
+    return count
@@ -0,0 +1,305 @@
+# app/page_tree.py
+
+import itertools
+import sys
+import threading
+import time
+import uuid
+
+# Leaves share one empty tuple instead of an empty list each; add_child swaps in a list
+NO_CHILDREN = ()
+
+
+class PageNode:
+    """
+    A cached page.  Slots instead of a dict per node (64 bytes instead of
+    184), no list for pages without loaded children, the parent link on the
+    node instead of in a dict of its own, and interned ids take about a third
+    off a large tree (see benchmarks/bench_page_tree_memory.py).
+
+    Item access (node['name'], node.get('children')) works as it did on the
+    dicts, so callers need not care; to_dict() gives the plain
+    {'id', 'name', 'has_children', 'children'} shape for JSON.
+    """
+
+    __slots__ = ('id', 'name', 'has_children', 'children', 'parent_id')
+    FIELDS = frozenset(('id', 'name', 'has_children', 'children'))
+
+    def __init__(self, page_id, name, has_children=True, children=None):
+        self.id = sys.intern(page_id)
+        self.name = name
+        self.has_children = has_children
+        self.children = children or NO_CHILDREN
+        self.parent_id = None  # Set by PageTree, which keeps the parent links on the nodes
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.FIELDS
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.FIELDS else default
+
+    def keys(self):
+        return ('id', 'name', 'has_children', 'children')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'has_children': self.has_children,
+            'children': [child.to_dict() for child in self.children]
+        }
+
+    def __repr__(self):
+        return f'PageNode({self.id!r}, {self.name!r}, has_children={self.has_children}, children={len(self.children)})'
+
+
+def new_page_node(page_id, name, has_children=True, children=None):
+    """
+    Build a cache node (see PageNode).
+    """
+    return PageNode(page_id, name, has_children, children)
+
+
+def as_page_node(node):
+    """
+    The PageNode for a node given as a PageNode or as a dict (e.g. replayed from the shared backend).
+    """
+    if isinstance(node, PageNode):
+        return node
+    return PageNode(node['id'], node['name'], node['has_children'], [as_page_node(child) for child in node.get('children') or []])
+
+
+def to_plain(value):
+    """
+    PageNodes (also inside lists / tuples) as dicts, for JSON.
+    """
+    if isinstance(value, PageNode):
+        return value.to_dict()
+    if isinstance(value, (list, tuple)):
+        return [to_plain(item) for item in value]
+    return value
+
+
+class PageTree:
+    """
+    Cached page tree with an id -> node index and child -> parent links
+    (PageNode.parent_id).
+
+    `roots` keeps the nested list of PageNodes used by the templates; the index
+    and parent links are kept in sync by every mutation, so lookups are O(1) and
+    ancestor walks are O(depth).  All writes must go through the methods below,
+    which also turn nodes given as dicts into PageNodes.
+    """
+
+    # Mutations that can be recorded and replayed through PageTree.apply
+    OPS = ('add_root', 'add_child', 'set_children', 'rename', 'remove')
+
+    def __init__(self, roots=None):
+        self.roots = []
+        self._nodes = {}
+        for root in roots or []:
+            self.add_root(root)
+
+    def __contains__(self, page_id):
+        return page_id in self._nodes
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def get(self, page_id):
+        return self._nodes.get(page_id)
+
+    def get_parent(self, page_id):
+        node = self._nodes.get(page_id)
+        if node is None or node.parent_id is None:
+            return None
+        return self._nodes.get(node.parent_id)
+
+    def iter_ancestors(self, page_id):
+        """
+        Yield the node for page_id followed by each of its ancestors up to the root.
+        """
+        node = self._nodes.get(page_id)
+        while node is not None:
+            yield node
+            node = self.get_parent(node.id)
+
+    def breadcrumbs(self, page_id):
+        crumbs = [{'id': node.id, 'name': node.name} for node in self.iter_ancestors(page_id)]
+        crumbs.reverse()
+        return crumbs
+
+    def add_root(self, node):
+        if node['id'] in self._nodes:
+            return self._nodes[node['id']]
+        node = as_page_node(node)
+        self.roots.append(node)
+        self._index(node, None)
+        return node
+
+    def add_child(self, parent_id, node):
+        """
+        Append node under parent_id unless it is already there; returns the cached node.
+        """
+        parent = self._nodes.get(parent_id)
+        if parent is None:
+            return None
+        existing = self._nodes.get(node['id'])
+        if existing is not None and existing.parent_id == parent_id:
+            return existing
+        if existing is not None:
+            self.remove(node['id'])
+        node = as_page_node(node)
+        if not parent.children:
+            parent.children = []
+        parent.children.append(node)
+        parent.has_children = True
+        self._index(node, parent_id)
+        return node
+
+    def set_children(self, page_id, children):
+        """
+        Replace the children of page_id, re-indexing the old and new subtrees.
+        """
+        node = self._nodes.get(page_id)
+        if node is None:
+            return None
+        for child in node.children:
+            self._unindex(child)
+        node.children = [as_page_node(child) for child in children] or NO_CHILDREN
+        node.has_children = len(children) > 0
+        for child in node.children:
+            self._index(child, page_id)
+        return node
+
+    def rename(self, page_id, name):
+        node = self._nodes.get(page_id)
+        if node is not None:
+            node.name = name
+        return node
+
+    def remove(self, page_id):
+        node = self._nodes.get(page_id)
+        if node is None:
+            return None
+        parent = self.get_parent(page_id)
+        siblings = parent.children if parent is not None else self.roots
+        siblings[:] = [sibling for sibling in siblings if sibling.id != page_id]
+        self._unindex(node)
+        return node
+
+    def apply(self, op, *args):
+        """
+        Apply a mutation by name; used to replay changes recorded by another worker.
+        """
+        if op not in self.OPS:
+            raise ValueError(f"Unknown page tree operation: {op}")
+        return getattr(self, op)(*args)
+
+    def _index(self, node, parent_id):
+        stack = [(node, parent_id)]
+        while stack:
+            current, current_parent = stack.pop()
+            self._nodes[current.id] = current
+            current.parent_id = current_parent
+            for child in current.children:
+                stack.append((child, current.id))
+
+    def _unindex(self, node):
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            # Only drop entries that still point at this exact node object
+            if self._nodes.get(current.id) is current:
+                del self._nodes[current.id]
+            stack.extend(current.children)
+
+
+def changed_page_ids(page_tree, op, args):
+    """
+    Ids of the nodes whose subtree a PageTree operation changes: the node it
+    touches and all its ancestors (for a move, at the old place too).  Call it
+    before the operation is applied.  None means everything ('replace').
+    """
+    if op == 'replace' or page_tree is None:
+        return None
+    if op == 'add_root':
+        # A new top-level node has no ancestors; it only replaces a same-id node, if any
+        return {args[0]['id']}
+    changed = [args[0], args[1]['id']] if op == 'add_child' else [args[0]]
+    return {node['id'] for page_id in changed for node in page_tree.iter_ancestors(page_id)}
+
+
+class TreeVersions:
+    """
+    Version of every cached node's subtree, for ETags of the sidebar endpoints.
+
+    Used as a page tree change listener.  A change stamps the changed node and
+    its ancestors with a new version.  With a shared backend the version is
+    the change's seq in the backend's change log (get_seq()): every worker
+    replays the same log in the same order, so all of them hand out the same
+    versions and an ETag from one worker is valid at the others.  The token,
+    kept in the backend too, tells apart change logs (a recreated cache
+    file starts counting again).  Otherwise versions come from a counter and
+    the token tells apart processes and restarts.
+    """
+
+    TOKEN_KEY = 'tree_versions:token'
+
+    def __init__(self, backend=None, get_seq=None):
+        self.backend = backend if backend is not None and backend.shared else None
+        self.get_seq = get_seq
+        self._token = uuid.uuid4().hex[:8]
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+        self._base = (0 if self.backend is not None else next(self._counter), time.time())
+        self._latest = self._base
+        self._versions = {}  # page_id -> (version, changed at)
+
+    @property
+    def token(self):
+        if self.backend is None:
+            return self._token
+        stored = self.backend.get_content(self.TOKEN_KEY)
+        if stored is None:
+            self.backend.set_content(self.TOKEN_KEY, None, self._token)
+            # Read back: of two workers starting together, the last write wins for both
+            stored = self.backend.get_content(self.TOKEN_KEY)
+        return stored[1]
+
+    def on_tree_change(self, page_tree, op, args):
+        page_ids = changed_page_ids(page_tree, op, args)
+        with self._lock:
+            seq = self.get_seq() if self.backend is not None and self.get_seq is not None else None
+            stamp = (seq if seq is not None else next(self._counter), time.time())
+            self._latest = stamp
+            if page_ids is None:
+                self._base = stamp
+                self._versions.clear()
+            else:
+                for page_id in page_ids:
+                    self._versions[page_id] = stamp
+
+    def get(self, page_id):
+        """
+        (version, last change time) of page_id's subtree.
+        """
+        with self._lock:
+            return self._versions.get(page_id, self._base)
+
+    def latest(self):
+        """
+        (version, last change time) of the whole tree.
+        """
+        with self._lock:
+            return self._latest
@@ -1,21 +1,29 @@
-from flask import render_template, request, redirect, url_for, session, flash
+from flask import render_template, request, redirect, url_for, session, flash, stream_template, make_response
+import hashlib
+import io
 import json
+import uuid
+import httpx
 from app import app
-from notion_client import Client
 from markupsafe import Markup
 from flask import jsonify
 from bs4 import BeautifulSoup
 from werkzeug.utils import secure_filename
 from .minio_helper import S3Client
-from datetime import datetime
+from datetime import datetime, timezone
+from . import notion_parser
 from .notion_parser import (
     get_block_content,
+    get_cached_block_content,
+    iter_cached_block_content,
+    page_cache,
     parse_block,
     html_to_notion_blocks,
     get_page_title, 
     # get_page_tree,
     get_cached_page_tree,
     get_sub_pages_from_cache,
+    get_sub_page_tree,
     find_page_in_cache,
     upTracePageAncestor2Cache,
     generate_breadcrumbs_from_cache,
@@ -24,9 +32,22 @@ from .notion_parser import (
     update_page_name_in_cache,
     update_parent_children_in_cache,
     update_node_children_in_cache,
-    find_parent_in_cache
+    find_parent_in_cache,
+    get_cache_metrics,
+    get_notion_page_size,
+    get_page_version,
+    observe_page_version,
+    search_index,
+    title_index,
+    tree_versions
 )
-import copy
+from .notion_api import iter_block_children
+from .page_diff import save_page_diff
+from .append_planner import append_block_tree
+from .save_queue import SaveQueue
+from .page_copy import PageCopier
+from .sidebar_renderer import ICON_SPRITE, SidebarRenderer
+from .page_tree import to_plain
 
 
 
@@ -35,7 +56,14 @@ config = {}
 with open('app/config/config.json') as config_file:
     config = json.load(config_file)
 
-notion = Client(auth=config['notion_token'])
+# Shared, rate-limited client (see notion_api.create_notion_client)
+notion = notion_parser.notion
+
+# Rendered sidebar nodes, dropped when the page tree changes under them
+sidebar_renderer = SidebarRenderer(lambda page_id: url_for('view_page', page_id=page_id))
+notion_parser.tree_change_listeners.append(sidebar_renderer.on_tree_change)
+app.jinja_env.globals['sidebar_icon_sprite'] = ICON_SPRITE
+app.jinja_env.globals['render_sidebar_roots'] = sidebar_renderer.render_roots
 
 # Session management
 app.config['SECRET_KEY'] = 'your_secret_key'
@@ -86,41 +114,122 @@ def index():
     return render_template('index.html', page_tree=page_tree)
 
 
-def append_blocks(notion_client, parent_block_id, blocks):
+# Totals of the diff-based saves, exposed through /cache_stats
+save_metrics = {
+    'saves': 0,
+    'calls': 0,
+    'baseline_calls': 0,
+    'saved_calls': 0,
+    'last_report': None
+}
+
+
+def record_save_report(report):
+    save_metrics['saves'] += 1
+    save_metrics['calls'] += report['calls']
+    save_metrics['baseline_calls'] += report['baseline_calls']
+    save_metrics['saved_calls'] += report['saved_calls']
+    save_metrics['last_report'] = report
+
+
+def append_blocks(notion_client, parent_block_id, blocks, after=None, on_progress=None):
     """
-    Recursively append blocks (with potential nested children) to a parent block.
+    Append blocks (with potential nested children) to a parent block.
+
+    Blocks are packed into as few requests as the API limits allow and nested
+    subtrees that need their own request are sent concurrently (see append_planner.py).
 
     :param notion_client: The initialized Notion client.
     :param parent_block_id: The ID of the parent block (page or block).
     :param blocks: A list of blocks to append to the parent block.
+    :param after: Insert after this child block instead of at the end.
+    :param on_progress: Called with the number of blocks created by each request.
+    :return: The number of API calls made.
+    """
+    return append_block_tree(
+        notion_client,
+        parent_block_id,
+        blocks,
+        after=after,
+        max_workers=config.get('notion_max_concurrency', 3),
+        on_progress=on_progress
+    )
+
+
+def save_page_content(page_id, content_html, renew=None):
     """
-    # Prepare blocks for appending, removing 'children' but keeping a reference
-    blocks_to_append = []
-    children_map = []  # Keep track of blocks with children and their indices
-
-    for idx, block in enumerate(blocks):
-        # Deep copy to avoid modifying the original block
-        block_copy = copy.deepcopy(block)
-        children=None
-        try:
-            children = block_copy.pop('children', None)
-        except:
-            pass
-        blocks_to_append.append(block_copy)
-        if children:
-            children_map.append((children, idx))
-
-    # Append blocks to the parent block
-    response = notion_client.blocks.children.append(
-        block_id=parent_block_id,
-        children=blocks_to_append
+    Write the editor's HTML to a page.  Called by view_page with save_mode "sync",
+    otherwise by the save queue's worker thread, which passes renew to keep
+    the job's lease (and stop if another worker has taken the job over).
+    """
+    new_blocks = html_to_notion_blocks(content_html)
+    # 清空原有内容并添加新内容 - not working as -- AttributeError: 'BlocksChildrenEndpoint' object has no attribute 'replace'
+    # notion.blocks.children.replace(block_id=page_id, children=new_blocks)
+
+    # Only update / insert / archive the blocks that changed (see page_diff.py)
+    report = save_page_diff(
+        notion,
+        page_id,
+        new_blocks,
+        append_blocks,
+        page_size=get_notion_page_size(),
+        max_workers=config.get('notion_max_concurrency', 3),
+        on_write=renew
+    )
+    page_cache.invalidate(page_id)
+    search_index.set_text(page_id, content_html)
+    record_save_report(report)
+    return report
+
+
+# Durable write-behind queue for saves ("queue", default) or saving inside the request ("sync")
+save_queue = None
+if config.get('save_mode', 'queue') == 'queue':
+    save_queue = SaveQueue(
+        config.get('save_queue_path', 'app/cache/save_queue.db'),
+        save_page_content,
+        coalesce_delay=config.get('save_coalesce_delay', 2)
+    )
+    save_queue.start()
+
+def rehost_notion_file(url, name):
+    """
+    Copy a file Notion hosts (its signed URL expires after an hour) into the
+    bucket behind /upload_image; returns the public URL of the copy.
+    """
+    response = httpx.get(url, timeout=60, follow_redirects=True)
+    response.raise_for_status()
+    object_name = f"{get_timestamp_with_milliseconds()}_{uuid.uuid4().hex[:8]}_{secure_filename(name) or 'file'}"
+    s3_client.client.put_object(
+        s3_client.bucket_name,
+        object_name,
+        io.BytesIO(response.content),
+        length=len(response.content),
+        content_type=response.headers.get('content-type', 'application/octet-stream')
     )
-    appended_blocks = response['results']
+    s3_client.set_bucket_policy_public_read()
+    return s3_client.get_direct_url(object_name, days=-1)
+
+# Page duplications run in the background; progress is shared through the cache backend
+page_copier = PageCopier(
+    notion,
+    backend=notion_parser.cache_backend,
+    max_workers=config.get('notion_max_concurrency', 3),
+    page_size=get_notion_page_size(),
+    rehost_file=rehost_notion_file
+)
+
 
-    # Recursively append children to their respective parent blocks
-    for children, idx in children_map:
-        child_block_id = appended_blocks[idx]['id']
-        append_blocks(notion_client, child_block_id, children)
+@app.route('/save_status/<int:job_id>')
+def save_status(job_id):
+    if 'username' not in session:
+        return jsonify({'error': '未登录'}), 401
+    if save_queue is None:
+        return jsonify({'error': 'save queue disabled'}), 404
+    status = save_queue.get_status(job_id)
+    if status is None:
+        return jsonify({'error': 'unknown job'}), 404
+    return jsonify(status)
 
 
 @app.route('/page/<page_id>', methods=['GET', 'POST'])
@@ -130,28 +239,47 @@ def view_page(page_id):
     user_role = session.get('role')
     user_permissions = config['roles'][user_role]['operation']
     if request.method == 'POST':
+        # The editor posts with fetch and asks for JSON; a plain form post gets a redirect
+        wants_json = request.accept_mimetypes.best == 'application/json'
         if 'write' in user_permissions:
             new_content_html = request.form['content']
-            new_blocks = html_to_notion_blocks(new_content_html)
-            # 清空原有内容并添加新内容 - not working as -- AttributeError: 'BlocksChildrenEndpoint' object has no attribute 'replace'
-            # notion.blocks.children.replace(block_id=page_id, children=new_blocks)
-
-            # 获取现有的子块
-            existing_children = notion.blocks.children.list(block_id=page_id)
-            # 遍历并删除所有子块
-            for child in existing_children['results']:
-                notion.blocks.update(block_id=child['id'], archived=True)
-            # 追加新的子块
-            append_blocks(notion, page_id, new_blocks)
-            # notion.blocks.children.append(block_id=page_id, children=new_blocks)
-
-
-            flash('页面已更新')
+            if save_queue is not None:
+                # Acknowledge right away; the queue writes to Notion in the background
+                job_id = save_queue.enqueue(page_id, new_content_html)
+                if wants_json:
+                    return jsonify({
+                        'success': True,
+                        'job_id': job_id,
+                        'status_url': url_for('save_status', job_id=job_id)
+                    }), 202
+                flash(f'页面已加入保存队列 (#{job_id})')
+                return redirect(url_for('view_page', page_id=page_id))
+
+            report = save_page_content(page_id, new_content_html)
+            if wants_json:
+                return jsonify({'success': True, 'report': report})
+            flash(f"页面已更新 ({report['calls']} 次 API 调用，节省 {report['saved_calls']} 次)")
             return redirect(url_for('view_page', page_id=page_id))
         else:
+            if wants_json:
+                return jsonify({'success': False, 'message': '您没有权限编辑此页面'}), 403
             flash('您没有权限编辑此页面')
             return redirect(url_for('view_page', page_id=page_id))
     
+    # A queued save that has not reached Notion yet is shown instead of the stale page
+    pending_content = save_queue.get_pending_content(page_id) if save_queue is not None else None
+    # Flashed messages are shown once, so such a response must not be revalidated later
+    cacheable = pending_content is None and '_flashes' not in session
+
+    # Unchanged page, tree and role: 304 without calling Notion or rendering
+    if cacheable and request.if_none_match:
+        version = get_page_version(page_id)
+        if version is not None:
+            etag, last_modified = page_validators(version, user_role)
+            not_modified = conditional_response(etag, last_modified)
+            if not_modified is not None:
+                return not_modified
+
     # Check if the page is in the cache
     if not is_page_in_cache(page_id):
         # Load the page and its ancestors into the cache
@@ -159,12 +287,47 @@ def view_page(page_id):
         
     page_title = get_cached_page_title(page_id)
     page_tree = get_cached_page_tree() #get_page_tree()
-    content = get_block_content(page_id)
 
     # Generate breadcrumbs from the cache
     breadcrumbs = generate_breadcrumbs_from_cache(page_id)
-    
-    return render_template(
+
+    if pending_content is not None:
+        return render_template(
+            'page.html',
+            content=pending_content,
+            page_title=page_title,
+            page_id=page_id,
+            page_tree=page_tree,
+            user_permissions=user_permissions,
+            breadcrumbs=breadcrumbs
+        )
+
+    # One Notion call for last_edited_time; the content is then served from
+    # page_cache if it is unchanged
+    version = observe_page_version(page_id)
+    validators = None
+    if cacheable and version is not None and not notion_parser.recently_edited(version['last_edited_time']):
+        validators = page_validators(version, user_role)
+        not_modified = conditional_response(*validators)
+        if not_modified is not None:
+            return not_modified
+
+    if config.get('stream_pages', False):
+        # Header, sidebar and breadcrumbs go out at once; block HTML follows
+        # as each top-level block's subtree is fetched
+        response = make_response(stream_template(
+            'page.html',
+            content_chunks=iter_cached_block_content(page_id, version),
+            page_title=page_title,
+            page_id=page_id,
+            page_tree=page_tree,
+            user_permissions=user_permissions,
+            breadcrumbs=breadcrumbs
+        ))
+        return with_validators(response, *validators) if validators else response
+
+    content = get_cached_block_content(page_id, version)
+    response = make_response(render_template(
         'page.html',
         content=content,
         page_title=page_title,
@@ -172,7 +335,40 @@ def view_page(page_id):
         page_tree=page_tree,
         user_permissions=user_permissions,
         breadcrumbs=breadcrumbs
-    )
+    ))
+    return with_validators(response, *validators) if validators else response
+
+
+def make_etag(*parts):
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()[:24]
+
+
+def page_validators(version, user_role):
+    """
+    (ETag, Last-Modified) of a page view: its content version, the page tree
+    (sidebar, title, breadcrumbs) and the role (which buttons are shown).
+    """
+    tree_version, tree_changed = tree_versions.latest()
+    etag = make_etag(version['version'], tree_versions.token, tree_version, user_role)
+    return etag, max(version['modified'], tree_changed)
+
+
+def conditional_response(etag, last_modified):
+    """
+    A 304 response if the request's If-None-Match carries etag, else None.
+    """
+    if etag in request.if_none_match:
+        return with_validators(app.response_class(status=304), etag, last_modified)
+    return None
+
+
+def with_validators(response, etag, last_modified):
+    # Strong ETag; the browser keeps the body but revalidates on every use
+    response.set_etag(etag)
+    response.last_modified = datetime.fromtimestamp(last_modified, timezone.utc)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
 
 def is_page_in_cache(page_id):
     page_tree = get_cached_page_tree()
@@ -181,73 +377,8 @@ def is_page_in_cache(page_id):
 
 
 def render_page_tree(page):
-    page_url = url_for('view_page', page_id=page['id'])
-    has_children = page.get('has_children', False)
-
-    html = '<li class="nav-item">'
-    html += f'<div class="nav-link page-item" data-page-id="{page["id"]}" data-has-children="{has_children}">'
-
-    # Icon container
-    html += '<span class="icon-container" onclick="toggleSubPages(this)">'
-
-    # Document or chevron icon
-    if has_children:
-        html += '''
-            <svg class="icon chevron-icon" viewBox="0 0 12 12">
-                <!-- Chevron icon SVG path -->
-                <path d="M6.02734 8.80274C6.27148 8.80274 6.47168 8.71484 6.66211 8.51465L10.2803 4.82324C10.4268 4.67676 10.5 4.49609 10.5 4.28125C10.5 3.85156 10.1484 3.5 9.72363 3.5C9.50879 3.5 9.30859 3.58789 9.15234 3.74902L6.03223 6.9668L2.90722 3.74902C2.74609 3.58789 2.55078 3.5 2.33105 3.5C1.90137 3.5 1.55469 3.85156 1.55469 4.28125C1.55469 4.49609 1.62793 4.67676 1.77441 4.82324L5.39258 8.51465C5.58789 8.71973 5.78808 8.80274 6.02734 8.80274Z"></path>
-            </svg>
-        '''
-    else:
-        html += '''
-            <svg class="icon document-icon" viewBox="0 0 14 14">
-                <!-- Document icon SVG path -->
-                <path d="M3 1h8a1 1 0 011 1v10a1 1 0 01-1 1H3a1 1 0 01-1-1V2a1 1 0 011-1z"></path>
-            </svg>
-        '''
-    html += '</span>'
-
-    # Page title
-    html += f'<a href="{page_url}" class="page-title">{page["name"]}</a>'
-
-    # Action buttons
-    html += f'''
-        <div class="action-buttons">
-            <span class="button refresh-button" onclick="refreshPageTree('{page["id"]}')">
-                <!-- Refresh icon SVG -->
-                <svg fill="#000000" width="16px" height="16px" viewBox="0 0 1024 1024" xmlns="http://www.w3.org/2000/svg">
-                    <path d="M497.408 898.56c-.08-.193-.272-.323-.385-.483l-91.92-143.664c-6.528-10.72-20.688-14.527-31.728-8.512l-8.193 5.04c-11.007 6-10.767 21.537-4.255 32.256l58.927 91.409c-5.024-1.104-10.096-2-15.056-3.296-103.184-26.993-190.495-96.832-239.535-191.6-46.336-89.52-55.04-191.695-24.512-287.743 30.512-96.048 99.775-174.464 189.295-220.784 15.248-7.888 21.2-26.64 13.312-41.856-7.872-15.264-26.64-21.231-41.855-13.327-104.272 53.952-184.4 145.28-219.969 257.152C45.982 485.008 56.11 604.033 110.078 708.29c57.136 110.336 158.832 191.664 279.024 223.136 1.36.352 2.784.56 4.16.911l-81.311 41.233c-11.008 6.032-14.657 19.631-8.128 30.351l3.152 8.176c6.56 10.72 17.84 14.527 28.815 8.512L484.622 944.4c.193-.128.385-.096.578-.224l9.984-5.456c5.52-3.024 9.168-7.969 10.624-13.505 1.52-5.52.815-11.663-2.448-16.991zm416.496-577.747c-57.056-110.304-155.586-191.63-275.762-223.118-8.56-2.24-17.311-3.984-26.048-5.712l79.824-40.48c11.008-6.033 17.568-19.632 11.04-30.369l-3.153-8.16c-6.56-10.736-20.752-14.528-31.727-8.528L519.262 80.654c-.176.112-.384.08-.577.208l-9.967 5.472c-5.537 3.04-9.168 7.967-10.624 13.503-1.52 5.52-.816 11.648 2.464 16.976l5.92 9.712c.096.192.272.305.384.497l91.92 143.648c6.512 10.736 20.688 14.528 31.712 8.513l7.216-5.025c11.008-6 11.727-21.536 5.231-32.24l-59.2-91.856c13.008 2 25.968 4.416 38.624 7.76 103.232 27.04 187.393 96.864 236.4 191.568 46.32 89.519 55.024 191.695 24.48 287.728-30.511 96.047-96.655 174.448-186.174 220.816-15.233 7.887-21.168 26.607-13.28 41.87 5.519 10.64 16.335 16.768 27.599 16.768 4.8 0 9.664-1.12 14.272-3.488 104.272-53.936 181.248-145.279 216.816-257.119 35.536-111.904 25.393-230.929-28.574-335.152z"/>
-                </svg>
-            </span>
-            <span class="button dots-button" onclick="showContextMenu(event, '{page["id"]}')">
-                <!-- Three-dot icon -->
-                <svg class="icon dots-icon" viewBox="0 0 13 3">
-                    <g>
-                        <path d="M3,1.5A1.5,1.5,0,1,1,1.5,0,1.5,1.5,0,0,1,3,1.5Z"></path>
-                        <path d="M8,1.5A1.5,1.5,0,1,1,6.5,0,1.5,1.5,0,0,1,8,1.5Z"></path>
-                        <path d="M13,1.5A1.5,1.5,0,1,1,11.5,0,1.5,1.5,0,0,1,13,1.5Z"></path>
-                    </g>
-                </svg>
-            </span>
-            <span class="button plus-button" onclick="addSubPage('{page["id"]}')">
-                <!-- Plus icon -->
-                <svg class="icon plus-icon" viewBox="0 0 14 14">
-                    <path d="M2 7.16357C2 7.59692 2.36011 7.95093 2.78735 7.95093H6.37622V11.5398C6.37622 11.9731 6.73022 12.3271 7.16357 12.3271C7.59692 12.3271 7.95093 11.9731 7.95093 11.5398V7.95093H11.5398C11.9731 7.95093 12.3271 7.59692 12.3271 7.16357C12.3271 6.73022 11.9731 6.37622 11.5398 6.37622H7.95093V2.78735C7.95093 2.36011 7.59692 2 7.16357 2C6.73022 2 6.37622 2.36011 6.37622 2.78735V6.37622H2.78735C2.36011 6.37622 2 6.73022 2 7.16357Z"></path>
-                </svg>
-            </span>
-        </div>
-    '''
-
-    html += '</div>'
-
-    # Subpages
-    if has_children:
-        html += '<ul class="nav flex-column ml-3 subpage-list" style="display: none;">'
-        for child in page.get('children', []):
-            html += render_page_tree(child)
-        html += '</ul>'
-    html += '</li>'
-    return html
+    # Cached per node and invalidated on tree changes (see SidebarRenderer)
+    return sidebar_renderer.render(page)
 
 
 @app.route('/refresh_page_tree/<page_id>')
@@ -255,12 +386,17 @@ def refresh_page_tree(page_id):
     try:
         # Update the node's children in the cache
         update_node_children_in_cache(page_id)
-        # Re-render the page tree starting from this node
+        # Re-render the page tree starting from this node; 304 if its subtree is unchanged
+        version, changed = tree_versions.get(page_id)
+        etag = make_etag(tree_versions.token, version, 'refresh')
+        not_modified = conditional_response(etag, changed)
+        if not_modified is not None:
+            return not_modified
         page_tree = get_cached_page_tree()
         page = find_page_in_cache(page_id, page_tree)
         if page:
             html = render_page_tree(page)
-            return jsonify({'success': True, 'html': html})
+            return with_validators(jsonify({'success': True, 'html': html}), etag, changed)
         else:
             return jsonify({'success': False, 'message': 'Page not found in cache'})
     except Exception as e:
@@ -268,22 +404,80 @@ def refresh_page_tree(page_id):
         return jsonify({'success': False, 'message': str(e)})
 
 
+@app.route('/cache_stats')
+def cache_stats():
+    if 'username' not in session:
+        return jsonify({'error': '未登录'}), 401
+    return jsonify({
+        'page_tree': get_cache_metrics(),
+        'rendered_pages': page_cache.get_stats(),
+        'sidebar_fragments': sidebar_renderer.get_stats(),
+        'tree_crawler': notion_parser.tree_crawler.get_stats(),
+        'delta_sync': notion_parser.delta_sync.get_stats(),
+        'search_index': search_index.get_stats(),
+        'title_index': title_index.get_stats(),
+        'notion_api': notion.get_stats() if hasattr(notion, 'get_stats') else None,
+        'saves': save_metrics,
+        'save_queue': save_queue.get_stats() if save_queue is not None else None
+    })
+
+
 @app.route('/get_sub_pages/<page_id>')
 def get_sub_pages(page_id):
-    sub_pages = get_sub_pages_from_cache(page_id)
-    return jsonify(sub_pages)
+    # ?depth=N returns N levels in one response; missing levels are fetched on the server
+    depth = max(1, min(request.args.get('depth', 1, type=int), config.get('sidebar_prefetch_max_depth', 3)))
+    # Version taken before any missing level is fetched, so the ETag never claims a newer tree
+    notion_parser.get_cached_tree_index()
+    version, changed = tree_versions.get(page_id)
+    etag = make_etag(tree_versions.token, version, depth)
+    not_modified = conditional_response(etag, changed)
+    if not_modified is not None:
+        return not_modified
+    if depth == 1:
+        sub_pages = to_plain(get_sub_pages_from_cache(page_id))
+    else:
+        sub_pages = get_sub_page_tree(page_id, depth)
+    return with_validators(jsonify(sub_pages), etag, changed)
+
+
+@app.route('/search')
+def search():
+    # Answered from the local index only (titles of cached pages, text of pages rendered or saved here)
+    if 'username' not in session:
+        return jsonify({'error': '未登录'}), 401
+    query = request.args.get('q', '').strip()
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    results = search_index.search(query, limit) if query else []
+    for result in results:
+        result['url'] = url_for('view_page', page_id=result['id'])
+    return jsonify({'query': query, 'results': results, 'took_ms': search_index.stats['last_query_ms'] if query else 0})
+
+
+@app.route('/quick_switch')
+def quick_switch():
+    # Typeahead over the names of every cached page: prefix matches first, then fuzzy ones
+    if 'username' not in session:
+        return jsonify({'error': '未登录'}), 401
+    query = request.args.get('q', '').strip()
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+    page_tree = notion_parser.get_cached_tree_index()
+    matches = title_index.lookup(query, limit) if query else []
+    for match in matches:
+        # Ancestors, to tell apart pages with the same name
+        match['path'] = [crumb['name'] for crumb in page_tree.breadcrumbs(match['id'])[:-1]]
+        match['url'] = url_for('view_page', page_id=match['id'])
+    return jsonify({'query': query, 'results': matches, 'took_ms': title_index.stats['last_query_ms'] if query else 0})
 
 def update_notion_page_content(page_id, new_blocks):
     # 删除原有内容
     # 注意：Notion API 不支持直接替换整个页面的内容，需要先删除现有的子块
     # 获取现有子块
-    existing_blocks = notion.blocks.children.list(block_id=page_id)
-    for block in existing_blocks['results']:
-        notion.blocks.delete(block_id=block['id'])
+    existing_ids = [block['id'] for block in iter_block_children(notion, page_id, get_notion_page_size())]
+    for block_id in existing_ids:
+        notion.blocks.delete(block_id=block_id)
 
-    # 添加新的块
-    for block in new_blocks:
-        notion.blocks.children.append(block_id=page_id, children=[block])
+    # 添加新的块 (batched, see append_blocks)
+    append_blocks(notion, page_id, new_blocks)
 
 
 # timestamp in %Y%m%d%H%M%S + milliseconds
@@ -329,6 +523,8 @@ def delete_page(page_id):
         parent = find_parent_in_cache(page_id)
         parent_id = parent['id']
         notion.pages.update(page_id=page_id, archived=True)
+        page_cache.invalidate(page_id)
+        search_index.remove(page_id)
         # Update cache
         update_parent_children_in_cache(parent_id)
 
@@ -365,40 +561,24 @@ def rename_page_route(page_id):
 
 @app.route('/duplicate_page/<page_id>', methods=['POST'])
 def duplicate_page(page_id):
+    """
+    Start a deep copy of the page in the background; poll status_url for progress.
+    """
     try:
-        # Retrieve the original page
-        original_page = notion.pages.retrieve(page_id)
-        parent_id = original_page['parent']['page_id']
-        properties = original_page['properties']
-        children = notion.blocks.children.list(block_id=page_id)['results']
-        
-        # Create a new page with "(copy)" appended to the title
-        title_property = properties['title']['title']
-        original_title = ''.join([t['plain_text'] for t in title_property])
-        new_title = original_title + ' (copy)'
-
-        new_page = notion.pages.create(
-            parent={"page_id": original_page['parent']['page_id']},
-            properties={
-                "title": {
-                    "title": [
-                        {
-                            "text": {
-                                "content": new_title
-                            }
-                        }
-                    ]
-                }
-            },
-            children=children
-        )
-        # Update cache
-        update_parent_children_in_cache(parent_id)
-        return jsonify({'success': True})
+        job_id = page_copier.start(page_id, on_done=lambda job, new_page: update_parent_children_in_cache(new_page['parent']['page_id']))
+        return jsonify({'success': True, 'job_id': job_id, 'status_url': url_for('duplicate_status', job_id=job_id)})
     except Exception as e:
         print(f"Error duplicating page {page_id}: {e}")
         return jsonify({'success': False})
 
+
+@app.route('/duplicate_status/<job_id>', methods=['GET'])
+def duplicate_status(job_id):
+    status = page_copier.get_status(job_id)
+    if status is None:
+        return jsonify({'success': False, 'error': 'Unknown copy job'}), 404
+    return jsonify(dict(status, success=status['status'] != 'failed'))
+
 @app.route('/biupag', methods=['GET'])
 def create_sub_page():
     parent_id = request.args.get('parent_id')
@@ -0,0 +1,299 @@
+# app/save_queue.py
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# queued -> running -> done | failed; a queued save replaced by a newer one for
+# the same page becomes superseded and points at its replacement
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+SUPERSEDED = 'superseded'
+
+
+class LeaseLost(Exception):
+    """
+    The job's lease ran out and another worker has taken the job over.
+    """
+
+
+class SaveQueue:
+    """
+    Durable write-behind queue for page saves.
+
+    Jobs live in a SQLite file (WAL), so a save that was acknowledged survives a
+    restart and can be run by the worker thread of any process on the host.
+    A job waits coalesce_delay seconds before it is run; a newer save of the same
+    page supersedes a queued one, so only the latest content is written.  Saves
+    of one page never run concurrently; a worker that dies mid-save loses its
+    lease and the job is picked up again.
+
+    handler(page_id, content, renew) performs the save and returns a JSON-able
+    report.  It calls renew() before each write: that extends the lease of a
+    long save, and raises LeaseLost once the job belongs to another worker, so
+    two workers never write the same page.
+    """
+
+    def __init__(self, path, handler, coalesce_delay=2.0, max_attempts=3, lease=300, retention=86400):
+        self.path = path
+        self.handler = handler
+        self.coalesce_delay = coalesce_delay
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self.retention = retention
+        self.poll_interval = 1.0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._last_purge = 0.0
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS save_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                page_id TEXT NOT NULL,
+                content TEXT,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                not_before REAL NOT NULL,
+                lease_until REAL,
+                superseded_by INTEGER,
+                report TEXT,
+                error TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS save_jobs_page ON save_jobs (page_id, status);
+            CREATE INDEX IF NOT EXISTS save_jobs_status ON save_jobs (status, not_before);
+        ''')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            # An acknowledged save must not be lost
+            conn.execute('PRAGMA synchronous=FULL')
+            conn.execute('PRAGMA busy_timeout=10000')
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self, work):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            result = work(conn)
+            conn.execute('COMMIT')
+            return result
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def enqueue(self, page_id, content):
+        """
+        Queue a save and return its job id.  Saves of the page still waiting are superseded.
+        """
+        def work(conn):
+            now = time.time()
+            job_id = conn.execute(
+                'INSERT INTO save_jobs (page_id, content, status, not_before, created, updated) VALUES (?, ?, ?, ?, ?, ?)',
+                (page_id, content, QUEUED, now + self.coalesce_delay, now, now)
+            ).lastrowid
+            conn.execute(
+                'UPDATE save_jobs SET status = ?, superseded_by = ?, content = NULL, updated = ? '
+                'WHERE page_id = ? AND status = ? AND id < ?',
+                (SUPERSEDED, job_id, now, page_id, QUEUED, job_id)
+            )
+            return job_id
+        job_id = self._transaction(work)
+        self._wakeup.set()
+        return job_id
+
+    def get_status(self, job_id):
+        """
+        Status of a job; for a superseded job, the status of the save that replaced it.
+        """
+        conn = self._conn()
+        requested_id = job_id
+        row = None
+        for _ in range(1000):
+            row = conn.execute(
+                'SELECT id, page_id, status, attempts, superseded_by, report, error, created, updated '
+                'FROM save_jobs WHERE id = ?', (job_id,)
+            ).fetchone()
+            if row is None or row[2] != SUPERSEDED or row[4] is None:
+                break
+            job_id = row[4]
+        if row is None:
+            return None
+        return {
+            'job_id': requested_id,
+            'effective_job_id': row[0],
+            'page_id': row[1],
+            'status': row[2],
+            'attempts': row[3],
+            'report': json.loads(row[5]) if row[5] else None,
+            'error': row[6],
+            'created': row[7],
+            'updated': row[8]
+        }
+
+    def get_pending_content(self, page_id):
+        """
+        The latest content of page_id that is queued or being written, or None.
+        """
+        row = self._conn().execute(
+            'SELECT content FROM save_jobs WHERE page_id = ? AND status IN (?, ?) ORDER BY id DESC LIMIT 1',
+            (page_id, QUEUED, RUNNING)
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_stats(self):
+        rows = self._conn().execute('SELECT status, COUNT(*) FROM save_jobs GROUP BY status').fetchall()
+        return {status: count for status, count in rows}
+
+    def start(self):
+        """
+        Start this process's worker thread (once).
+        """
+        with self._thread_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._thread = threading.Thread(target=self._run, name='page-save-queue', daemon=True)
+            self._thread.start()
+            return True
+
+    def _run(self):
+        while True:
+            try:
+                if self.run_pending():
+                    continue
+                self._purge()
+            except Exception as e:
+                print(f"Error in page save queue: {e}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def run_pending(self):
+        """
+        Run every job that is due; returns how many were run.
+        """
+        count = 0
+        while True:
+            job = self._claim()
+            if job is None:
+                return count
+            self._execute(*job)
+            count += 1
+
+    def _claim(self):
+        def work(conn):
+            now = time.time()
+            row = conn.execute(
+                'SELECT id, page_id, content, attempts FROM save_jobs '
+                'WHERE ((status = ? AND not_before <= ?) OR (status = ? AND lease_until <= ?)) '
+                'AND page_id NOT IN (SELECT page_id FROM save_jobs WHERE status = ? AND lease_until > ?) '
+                'ORDER BY id LIMIT 1',
+                (QUEUED, now, RUNNING, now, RUNNING, now)
+            ).fetchone()
+            if row is None:
+                return None
+            newer = conn.execute(
+                'SELECT MAX(id) FROM save_jobs WHERE page_id = ? AND id > ? AND status = ?', (row[1], row[0], QUEUED)
+            ).fetchone()[0]
+            if newer is not None:
+                # e.g. a job recovered from a dead worker that has been edited since
+                conn.execute(
+                    'UPDATE save_jobs SET status = ?, superseded_by = ?, content = NULL, lease_until = NULL, updated = ? WHERE id = ?',
+                    (SUPERSEDED, newer, now, row[0])
+                )
+                return work(conn)
+            conn.execute(
+                'UPDATE save_jobs SET status = ?, attempts = attempts + 1, lease_until = ?, updated = ? WHERE id = ?',
+                (RUNNING, now + self.lease, now, row[0])
+            )
+            return row[0], row[1], row[2], row[3] + 1
+        return self._transaction(work)
+
+    def _execute(self, job_id, page_id, content, attempts):
+        try:
+            report = self.handler(page_id, content, self._lease_renewer(job_id, attempts))
+        except LeaseLost:
+            print(f"Page save {page_id} (job {job_id}, attempt {attempts}) stopped: another worker took the job over")
+            return
+        except Exception as e:
+            print(f"Error saving page {page_id} (job {job_id}, attempt {attempts}): {e}")
+            self._fail(job_id, attempts, str(e))
+            return
+        self._conn().execute(
+            'UPDATE save_jobs SET status = ?, content = NULL, report = ?, error = NULL, lease_until = NULL, updated = ? '
+            'WHERE id = ? AND status = ? AND attempts = ?',
+            (DONE, json.dumps(report, ensure_ascii=False), time.time(), job_id, RUNNING, attempts)
+        )
+
+    def _lease_renewer(self, job_id, attempts):
+        """
+        renew() for the handler running job_id.  A claim is identified by its
+        attempt number: a worker taking over a lapsed lease increments it.
+        May be called from any thread; the lease is written at most every
+        tenth of its length, and cannot be taken over in between.
+        """
+        lock = threading.Lock()
+        renewed = [time.time()]
+
+        def renew():
+            now = time.time()
+            with lock:
+                if now - renewed[0] < self.lease / 10:
+                    return
+                renewed[0] = now
+            owned = self._conn().execute(
+                'UPDATE save_jobs SET lease_until = ?, updated = ? WHERE id = ? AND status = ? AND attempts = ?',
+                (now + self.lease, now, job_id, RUNNING, attempts)
+            ).rowcount
+            if not owned:
+                raise LeaseLost(f'job {job_id} attempt {attempts}')
+        return renew
+
+    def _fail(self, job_id, attempts, error):
+        # Only while the job is still this worker's claim
+        now = time.time()
+        owned = 'AND status = ? AND attempts = ?'
+        newer = self._conn().execute(
+            'SELECT MAX(id) FROM save_jobs WHERE page_id = (SELECT page_id FROM save_jobs WHERE id = ?) AND id > ? AND status = ?',
+            (job_id, job_id, QUEUED)
+        ).fetchone()[0]
+        if newer is not None:
+            # A newer save of the page is already waiting and will write the latest content
+            self._conn().execute(
+                'UPDATE save_jobs SET status = ?, superseded_by = ?, content = NULL, lease_until = NULL, error = ?, updated = ? WHERE id = ? ' + owned,
+                (SUPERSEDED, newer, error, now, job_id, RUNNING, attempts)
+            )
+        elif attempts < self.max_attempts:
+            self._conn().execute(
+                'UPDATE save_jobs SET status = ?, not_before = ?, lease_until = NULL, error = ?, updated = ? WHERE id = ? ' + owned,
+                (QUEUED, now + min(300, 5 * 2 ** (attempts - 1)), error, now, job_id, RUNNING, attempts)
+            )
+        else:
+            self._conn().execute(
+                'UPDATE save_jobs SET status = ?, lease_until = NULL, error = ?, updated = ? WHERE id = ? ' + owned,
+                (FAILED, error, now, job_id, RUNNING, attempts)
+            )
+
+    def _purge(self):
+        # Finished jobs are only kept for the status endpoint
+        now = time.time()
+        if now - self._last_purge < 60:
+            return
+        self._last_purge = now
+        self._conn().execute(
+            'DELETE FROM save_jobs WHERE status IN (?, ?, ?) AND updated < ?',
+            (DONE, FAILED, SUPERSEDED, now - self.retention)
+        )
@@ -0,0 +1,345 @@
+# app/search_index.py
+#
+# Local full-text search, so finding a page does not mean expanding the
+# sidebar (and asking Notion for every level on the way).  Titles come from
+# the cached page tree (as a tree change listener), page text from the HTML
+# parse_block renders and from saved editor HTML.  The index only knows the
+# text of pages rendered or saved at least once; it is kept in memory and
+# written to a gzip'ed JSON file, like the page tree snapshot.
+
+import atexit
+import gzip
+import html
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+
+from markupsafe import escape
+
+INDEX_VERSION = 1
+MAX_TEXT_CHARS = 50000  # Indexed (and kept for snippets) per page
+SNIPPET_CHARS = 160
+TITLE_BOOST = 3.0
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Chinese / Japanese / Korean have no spaces between words; they are indexed as character bigrams
+CJK = '぀-ヿ㐀-䶿一-鿿가-힯豈-﫿'
+TOKEN_RE = re.compile(f'[{CJK}]+|[^\\W_{CJK}]+')
+CJK_RE = re.compile(f'[{CJK}]')
+TAG_RE = re.compile(r'<(script|style)\b.*?</\1\s*>|<[^>]*>', re.S | re.I)
+SPACE_RE = re.compile(r'\s+')
+
+
+def tokenize(text):
+    """
+    Lower-cased words; runs of CJK characters become overlapping bigrams.
+    """
+    tokens = []
+    for match in TOKEN_RE.finditer(text.lower()):
+        word = match.group()
+        if CJK_RE.match(word) and len(word) > 1:
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.append(word)
+    return tokens
+
+
+def html_to_text(content_html):
+    """
+    Visible text of rendered page HTML, whitespace collapsed.
+    """
+    return SPACE_RE.sub(' ', html.unescape(TAG_RE.sub(' ', content_html))).strip()
+
+
+class SearchIndex:
+    """
+    Inverted index over page titles and text, ranked with BM25 (title matches
+    boosted).  All query terms must match; snippets are cut from the stored text.
+    get_tree() returns the cached PageTree (or None); pages missing from it are
+    left out of results and of a loaded index.
+    """
+
+    def __init__(self, path=None, get_tree=None):
+        self.path = path
+        self.get_tree = get_tree
+        self._documents = {}  # page_id -> {'title', 'text', 'length'}
+        self._postings = {}  # token -> {page_id: [title count, text count]}
+        self._total_length = 0
+        self._changes = 0
+        self._saved_changes = 0
+        self._lock = threading.Lock()
+        self._writer = None
+        self.stats = {
+            'queries': 0,
+            'updates': 0,
+            'saves': 0,
+            'last_query_ms': None
+        }
+
+    def __len__(self):
+        return len(self._documents)
+
+    def set_title(self, page_id, title):
+        with self._lock:
+            document = self._documents.get(page_id)
+            if document is not None and document['title'] == title:
+                return
+            self._put(page_id, title, document['text'] if document is not None else '')
+
+    def set_text(self, page_id, content_html, title=None):
+        """
+        Index the text of a page's rendered or saved HTML.
+        """
+        text = html_to_text(content_html)[:MAX_TEXT_CHARS]
+        with self._lock:
+            document = self._documents.get(page_id)
+            if title is None:
+                title = document['title'] if document is not None else ''
+            if document is not None and document['title'] == title and document['text'] == text:
+                return
+            self._put(page_id, title, text)
+
+    def has_text(self, page_id):
+        with self._lock:
+            document = self._documents.get(page_id)
+            return document is not None and bool(document['text'])
+
+    def remove(self, page_id):
+        with self._lock:
+            self._drop(page_id)
+
+    def _put(self, page_id, title, text):
+        self._drop(page_id)
+        title_tokens = tokenize(title)
+        text_tokens = tokenize(text)
+        counts = {}
+        for field, tokens in ((0, title_tokens), (1, text_tokens)):
+            for token in tokens:
+                counts.setdefault(token, [0, 0])[field] += 1
+        for token, count in counts.items():
+            self._postings.setdefault(token, {})[page_id] = count
+        length = len(title_tokens) + len(text_tokens)
+        self._documents[page_id] = {'title': title, 'text': text, 'length': length}
+        self._total_length += length
+        self._changes += 1
+        self.stats['updates'] += 1
+
+    def _drop(self, page_id):
+        document = self._documents.pop(page_id, None)
+        if document is None:
+            return
+        for token in set(tokenize(document['title'])) | set(tokenize(document['text'])):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(page_id, None)
+                if not postings:
+                    del self._postings[token]
+        self._total_length -= document['length']
+        self._changes += 1
+
+    def search(self, query, limit=20):
+        """
+        Best matches first: [{'id', 'title', 'snippet' (HTML, matches in <mark>), 'score'}].
+        """
+        started = time.perf_counter()
+        terms = list(dict.fromkeys(tokenize(query)))
+        results = []
+        tree = self._get_tree()
+        with self._lock:
+            postings = [self._postings.get(term) for term in terms]
+            if terms and all(postings):
+                postings.sort(key=len)
+                candidates = set(postings[0])
+                for posting in postings[1:]:
+                    candidates.intersection_update(posting)
+                if tree is not None:
+                    # Removed from the tree by another worker, or only ever rendered from a stale link
+                    candidates = [page_id for page_id in candidates if page_id in tree]
+                scored = sorted(((self._score(page_id, postings), page_id) for page_id in candidates), reverse=True)
+                for score, page_id in scored[:limit]:
+                    document = self._documents[page_id]
+                    results.append({
+                        'id': page_id,
+                        'title': document['title'],
+                        'snippet': make_snippet(document['text'], query),
+                        'score': round(score, 4)
+                    })
+        self.stats['queries'] += 1
+        self.stats['last_query_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        return results
+
+    def _score(self, page_id, postings):
+        documents = len(self._documents)
+        average_length = self._total_length / documents if documents else 1
+        length = self._documents[page_id]['length']
+        score = 0.0
+        for posting in postings:
+            title_count, text_count = posting[page_id]
+            idf = math.log(1 + (documents - len(posting) + 0.5) / (len(posting) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (average_length or 1))
+            score += idf * (TITLE_BOOST * min(title_count, 1) + text_count * (BM25_K1 + 1) / (text_count + norm))
+        return score
+
+    def on_tree_change(self, page_tree, op, args):
+        """
+        PageTree listener: keeps titles in step with the cached tree; removed pages leave the index.
+        """
+        if op == 'rename':
+            self.set_title(args[0], args[1])
+        elif op == 'remove':
+            node = page_tree.get(args[0]) if page_tree is not None else None
+            for removed in _iter_subtree([node] if node is not None else []):
+                self.remove(removed['id'])
+        elif op in ('replace', 'set_children', 'add_root', 'add_child'):
+            # replace / set_children carry a list of nodes, add_root / add_child a single one
+            nodes = args[-1] if op in ('replace', 'set_children') else [args[-1]]
+            kept = {node['id'] for node in _iter_subtree(nodes)}
+            if op == 'replace':
+                with self._lock:
+                    for page_id in [page_id for page_id in self._documents if page_id not in kept]:
+                        self._drop(page_id)
+            elif op == 'set_children':
+                parent = page_tree.get(args[0]) if page_tree is not None else None
+                for removed in _iter_subtree(parent['children'] if parent is not None else []):
+                    if removed['id'] not in kept:
+                        self.remove(removed['id'])
+            for node in _iter_subtree(nodes):
+                self.set_title(node['id'], node['name'])
+
+    def save_if_changed(self):
+        """
+        Write the index to path if it changed since the last save (atomic replace).
+        """
+        if not self.path:
+            return False
+        with self._lock:
+            if self._changes == self._saved_changes:
+                return False
+            changes = self._changes
+            payload = {
+                'version': INDEX_VERSION,
+                'documents': {page_id: [document['title'], document['text']] for page_id, document in self._documents.items()}
+            }
+        data = gzip.compress(json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), compresslevel=6)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory or '.', prefix='.search_index.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._lock:
+            self._saved_changes = changes
+            self.stats['saves'] += 1
+        return True
+
+    def load(self):
+        """
+        Load the index saved at path; returns the number of pages loaded.
+        Pages indexed meanwhile keep their newer title and text, and pages no
+        longer in the cached tree (if there is one yet) are skipped.
+        """
+        if not self.path:
+            return 0
+        try:
+            with open(self.path, 'rb') as index_file:
+                payload = json.loads(gzip.decompress(index_file.read()).decode('utf-8'))
+        except FileNotFoundError:
+            return 0
+        except (OSError, EOFError, ValueError) as e:
+            print(f"Ignoring unreadable search index {self.path}: {e}")
+            return 0
+        if payload.get('version') != INDEX_VERSION:
+            return 0
+        tree = self._get_tree()
+        skipped = 0
+        with self._lock:
+            for page_id, (title, text) in payload['documents'].items():
+                if tree is not None and page_id not in tree:
+                    skipped += 1
+                    continue
+                document = self._documents.get(page_id)
+                if document is None:
+                    self._put(page_id, title, text)
+                elif not document['text'] and text:
+                    # Only its title was indexed so far (from the page tree)
+                    self._put(page_id, document['title'], text)
+            # With pages skipped the file is out of date, so it is written again
+            self._saved_changes = self._changes if not skipped else -1
+        return len(payload['documents']) - skipped
+
+    def start(self, interval):
+        """
+        Load the saved index in the background (a large one takes seconds), then
+        save every interval seconds if it changed, and once more at exit.
+        """
+        if not self.path or self._writer is not None:
+            return False
+        self._writer = threading.Thread(target=self._run, args=(interval,), name='search-index-writer', daemon=True)
+        self._writer.start()
+        atexit.register(self._save_quietly)
+        return True
+
+    def _run(self, interval):
+        try:
+            self.load()
+        except Exception as e:
+            print(f"Error loading search index: {e}")
+        while True:
+            time.sleep(interval)
+            self._save_quietly()
+
+    def _save_quietly(self):
+        try:
+            self.save_if_changed()
+        except Exception as e:
+            print(f"Error saving search index: {e}")
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, pages=len(self._documents), terms=len(self._postings))
+
+    def _get_tree(self):
+        return self.get_tree() if self.get_tree is not None else None
+
+
+def _iter_subtree(nodes):
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(node.get('children') or [])
+
+
+def make_snippet(text, query):
+    """
+    About SNIPPET_CHARS of text around the first match of a query word, escaped, matches in <mark>.
+    """
+    words = [word for word in query.lower().split() if word]
+    lowered = text.lower()
+    positions = [position for position in (lowered.find(word) for word in words) if position >= 0]
+    if not positions:
+        snippet = text[:SNIPPET_CHARS]
+        return str(escape(snippet)) + ('…' if len(text) > SNIPPET_CHARS else '')
+    start = max(0, min(positions) - SNIPPET_CHARS // 3)
+    end = min(len(text), start + SNIPPET_CHARS)
+    snippet = text[start:end]
+    pattern = re.compile('|'.join(re.escape(word) for word in sorted(words, key=len, reverse=True)), re.I)
+    out = []
+    last = 0
+    for match in pattern.finditer(snippet):
+        out.append(str(escape(snippet[last:match.start()])))
+        out.append(f'<mark>{escape(match.group())}</mark>')
+        last = match.end()
+    out.append(str(escape(snippet[last:])))
+    return ('…' if start > 0 else '') + ''.join(out) + ('…' if end < len(text) else '')
@@ -0,0 +1,140 @@
+# app/sidebar_renderer.py
+#
+# HTML of the sidebar page tree.  The icons are defined once, as <symbol>s of
+# the SVG sprite sidebar.html includes, and every node only references them
+# with <use>; that keeps a node at a few hundred bytes instead of several KB
+# of repeated paths.  Rendered nodes are cached and dropped when the page tree
+# changes at or below them (see on_tree_change).
+
+import threading
+
+from markupsafe import Markup, escape
+
+from .page_tree import changed_page_ids
+
+ICON_SPRITE = Markup('''<svg xmlns="http://www.w3.org/2000/svg" style="display: none;">
+    <symbol id="icon-chevron" viewBox="0 0 12 12">
+        <path d="M6.02734 8.80274C6.27148 8.80274 6.47168 8.71484 6.66211 8.51465L10.2803 4.82324C10.4268 4.67676 10.5 4.49609 10.5 4.28125C10.5 3.85156 10.1484 3.5 9.72363 3.5C9.50879 3.5 9.30859 3.58789 9.15234 3.74902L6.03223 6.9668L2.90722 3.74902C2.74609 3.58789 2.55078 3.5 2.33105 3.5C1.90137 3.5 1.55469 3.85156 1.55469 4.28125C1.55469 4.49609 1.62793 4.67676 1.77441 4.82324L5.39258 8.51465C5.58789 8.71973 5.78808 8.80274 6.02734 8.80274Z"></path>
+    </symbol>
+    <symbol id="icon-document" viewBox="0 0 14 14">
+        <path d="M4.35645 15.4678H11.6367C13.0996 15.4678 13.8584 14.6953 13.8584 13.2256V7.02539C13.8584 6.0752 13.7354 5.6377 13.1406 5.03613L9.55176 1.38574C8.97754 0.804688 8.50586 0.667969 7.65137 0.667969H4.35645C2.89355 0.667969 2.13477 1.44043 2.13477 2.91016V13.2256C2.13477 14.7021 2.89355 15.4678 4.35645 15.4678ZM4.46582 14.1279C3.80273 14.1279 3.47461 13.7793 3.47461 13.1436V2.99219C3.47461 2.36328 3.80273 2.00781 4.46582 2.00781H7.37793V5.75391C7.37793 6.73145 7.86328 7.20312 8.83398 7.20312H12.5186V13.1436C12.5186 13.7793 12.1836 14.1279 11.5205 14.1279H4.46582ZM8.95703 6.02734C8.67676 6.02734 8.56055 5.9043 8.56055 5.62402V2.19238L12.334 6.02734H8.95703ZM10.4336 9.00098H5.42969C5.16992 9.00098 4.98535 9.19238 4.98535 9.43164C4.98535 9.67773 5.16992 9.86914 5.42969 9.86914H10.4336C10.6797 9.86914 10.8643 9.67773 10.8643 9.43164C10.8643 9.19238 10.6797 9.00098 10.4336 9.00098ZM10.4336 11.2979H5.42969C5.16992 11.2979 4.98535 11.4893 4.98535 11.7354C4.98535 11.9746 5.16992 12.1592 5.42969 12.1592H10.4336C10.6797 12.1592 10.8643 11.9746 10.8643 11.7354C10.8643 11.4893 10.6797 11.2979 10.4336 11.2979Z"></path>
+    </symbol>
+    <symbol id="icon-refresh" viewBox="0 0 1024 1024">
+        <path d="M497.408 898.56c-.08-.193-.272-.323-.385-.483l-91.92-143.664c-6.528-10.72-20.688-14.527-31.728-8.512l-8.193 5.04c-11.007 6-10.767 21.537-4.255 32.256l58.927 91.409c-5.024-1.104-10.096-2-15.056-3.296-103.184-26.993-190.495-96.832-239.535-191.6-46.336-89.52-55.04-191.695-24.512-287.743 30.512-96.048 99.775-174.464 189.295-220.784 15.248-7.888 21.2-26.64 13.312-41.856-7.872-15.264-26.64-21.231-41.855-13.327-104.272 53.952-184.4 145.28-219.969 257.152C45.982 485.008 56.11 604.033 110.078 708.29c57.136 110.336 158.832 191.664 279.024 223.136 1.36.352 2.784.56 4.16.911l-81.311 41.233c-11.008 6.032-14.657 19.631-8.128 30.351l3.152 8.176c6.56 10.72 17.84 14.527 28.815 8.512L484.622 944.4c.193-.128.385-.096.578-.224l9.984-5.456c5.52-3.024 9.168-7.969 10.624-13.505 1.52-5.52.815-11.663-2.448-16.991zm416.496-577.747c-57.056-110.304-155.586-191.63-275.762-223.118-8.56-2.24-17.311-3.984-26.048-5.712l79.824-40.48c11.008-6.033 17.568-19.632 11.04-30.369l-3.153-8.16c-6.56-10.736-20.752-14.528-31.727-8.528L519.262 80.654c-.176.112-.384.08-.577.208l-9.967 5.472c-5.537 3.04-9.168 7.967-10.624 13.503-1.52 5.52-.816 11.648 2.464 16.976l5.92 9.712c.096.192.272.305.384.497l91.92 143.648c6.512 10.736 20.688 14.528 31.712 8.513l7.216-5.025c11.008-6 11.727-21.536 5.231-32.24l-59.2-91.856c13.008 2 25.968 4.416 38.624 7.76 103.232 27.04 187.393 96.864 236.4 191.568 46.32 89.519 55.024 191.695 24.48 287.728-30.511 96.047-96.655 174.448-186.174 220.816-15.233 7.887-21.168 26.607-13.28 41.87 5.519 10.64 16.335 16.768 27.599 16.768 4.8 0 9.664-1.12 14.272-3.488 104.272-53.936 181.248-145.279 216.816-257.119 35.536-111.904 25.393-230.929-28.574-335.152z"></path>
+    </symbol>
+    <symbol id="icon-dots" viewBox="0 0 13 3">
+        <path d="M3,1.5A1.5,1.5,0,1,1,1.5,0,1.5,1.5,0,0,1,3,1.5Z"></path>
+        <path d="M8,1.5A1.5,1.5,0,1,1,6.5,0,1.5,1.5,0,0,1,8,1.5Z"></path>
+        <path d="M13,1.5A1.5,1.5,0,1,1,11.5,0,1.5,1.5,0,0,1,13,1.5Z"></path>
+    </symbol>
+    <symbol id="icon-plus" viewBox="0 0 14 14">
+        <path d="M2 7.16357C2 7.59692 2.36011 7.95093 2.78735 7.95093H6.37622V11.5398C6.37622 11.9731 6.73022 12.3271 7.16357 12.3271C7.59692 12.3271 7.95093 11.9731 7.95093 11.5398V7.95093H11.5398C11.9731 7.95093 12.3271 7.59692 12.3271 7.16357C12.3271 6.73022 11.9731 6.37622 11.5398 6.37622H7.95093V2.78735C7.95093 2.36011 7.59692 2 7.16357 2C6.73022 2 6.37622 2.36011 6.37622 2.78735V6.37622H2.78735C2.36011 6.37622 2 6.73022 2 7.16357Z"></path>
+    </symbol>
+</svg>''')
+
+CHEVRON_ICON = '<svg class="icon chevron-icon"><use href="#icon-chevron"></use></svg>'
+DOCUMENT_ICON = '<svg class="icon document-icon"><use href="#icon-document"></use></svg>'
+
+NODE_TEMPLATE = (
+    '<li class="nav-item">'
+    '<div class="nav-link page-item" data-page-id="{id}" data-has-children="{has_children}">'
+    '<span class="icon-container" onclick="toggleSubPages(this)">{icon}</span>'
+    '<a href="{url}" class="page-title">{name}</a>'
+    '<div class="action-buttons">'
+    '<span class="button refresh-button" onclick="refreshPageTree(\'{id}\')">'
+    '<svg fill="#000000" width="16px" height="16px"><use href="#icon-refresh"></use></svg></span>'
+    '<span class="button dots-button" onclick="showContextMenu(event, \'{id}\')">'
+    '<svg class="icon dots-icon"><use href="#icon-dots"></use></svg></span>'
+    '<span class="button plus-button" onclick="addSubPage(\'{id}\')">'
+    '<svg class="icon plus-icon"><use href="#icon-plus"></use></svg></span>'
+    '</div>'
+    '</div>'
+    '<ul class="nav flex-column ml-3 subpage-list" style="display: none;">{children}</ul>'
+    '</li>'
+)
+
+
+class SidebarRenderer:
+    """
+    Renders page tree nodes as sidebar <li> items and caches the result per node.
+
+    An entry is (node, html) and only used while it belongs to the very node
+    object being rendered, so a node replaced in the tree (rebuild, reloaded
+    children) is never served from an older entry.  In-place changes (rename,
+    new children) are reported through on_tree_change, which drops the entries
+    of the changed node and its ancestors, whose subtree HTML contains it.
+    """
+
+    def __init__(self, page_url):
+        self.page_url = page_url
+        self._fragments = {}  # (page_id, with children) -> (node, html)
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'invalidations': 0
+        }
+
+    def render(self, node, with_children=True):
+        """
+        The <li> for node; with_children also renders its loaded sub pages (collapsed).
+        """
+        key = (node['id'], with_children)
+        with self._lock:
+            entry = self._fragments.get(key)
+            if entry is not None and entry[0] is node:
+                self.stats['hits'] += 1
+                return entry[1]
+            self.stats['misses'] += 1
+            generation = self._generation
+        children = ''
+        if with_children and node['has_children']:
+            children = ''.join(self.render(child) for child in list(node.get('children') or []))
+        html = NODE_TEMPLATE.format(
+            id=escape(node['id']),
+            has_children=node['has_children'],
+            icon=CHEVRON_ICON if node['has_children'] else DOCUMENT_ICON,
+            url=escape(self.page_url(node['id'])),
+            name=escape(node['name']),
+            children=children
+        )
+        with self._lock:
+            # Not stored if the tree changed while rendering
+            if generation == self._generation:
+                self._fragments[key] = (node, html)
+        return html
+
+    def render_roots(self, roots):
+        """
+        Top level of the sidebar; sub pages are loaded when a root is expanded.
+        """
+        return Markup(''.join(self.render(root, with_children=False) for root in roots))
+
+    def on_tree_change(self, page_tree, op, args):
+        """
+        PageTree listener, called before op is applied to page_tree.
+        """
+        page_ids = changed_page_ids(page_tree, op, args)
+        if page_ids is None:
+            self.clear()
+        else:
+            self.invalidate(page_ids)
+
+    def invalidate(self, page_ids):
+        with self._lock:
+            self._generation += 1
+            for page_id in page_ids:
+                for key in ((page_id, True), (page_id, False)):
+                    if self._fragments.pop(key, None) is not None:
+                        self.stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self.stats['invalidations'] += len(self._fragments)
+            self._fragments.clear()
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._fragments))
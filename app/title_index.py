@@ -0,0 +1,428 @@
+# app/title_index.py
+#
+# Title typeahead for the quick switcher.  Every cached page name is kept in a
+# sorted list of lookup keys, so a prefix query is a binary search plus a short
+# scan instead of a walk over the recursive tree.  Keys start at each word of
+# a title and at each CJK character (those titles have no spaces), so "guide"
+# finds "Deploy guide" and "据库" finds "数据库设计".  When no prefix matches,
+# titles with a prefix within one or two typos are looked for ("depoly" ->
+# "Deploy guide"): the first three to five characters of every key are also
+# indexed under each string left by deleting one of them, so the key prefixes
+# one typo away from the start of the query are found with a few dictionary
+# lookups of the query's own deletions, and only the keys under them get an
+# edit distance.
+#
+# A whole new tree, or a bulk load, is indexed by a background thread which
+# sorts a new key list and swaps it in; lookups keep using the previous list
+# meanwhile, so no request waits for a rebuild.
+
+import itertools
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter
+
+from .search_index import CJK
+
+MAX_KEYS_PER_TITLE = 24
+# A non-space character after a non-alphanumeric one (or at the start), or any CJK character
+KEY_START_RE = re.compile(f'(?<![^\\W_])\\S|[{CJK}]')
+PREFIX_SCAN_FACTOR = 8  # Prefix candidates looked at per result wanted
+REBUILD_THRESHOLD = 2000  # More inserts than this are sorted in by a background rebuild instead
+FUZZY_CHARS_PER_EDIT = 4
+FUZZY_HEAD_CHARS = 5  # Key prefixes up to this long are indexed for typo lookups
+
+
+def normalize_title(title):
+    # Case- and width-insensitive ("Ｎｏｔｅ" == "note"), whitespace collapsed
+    return ' '.join(unicodedata.normalize('NFKC', title).casefold().split())
+
+
+def title_keys(normalized):
+    """
+    Suffixes of the title starting at a word start or a CJK character.
+    """
+    starts = itertools.islice(KEY_START_RE.finditer(normalized), MAX_KEYS_PER_TITLE)
+    return [normalized[match.start():] for match in starts]
+
+
+def key_heads(key):
+    # The prefixes indexed for typo lookups; a query of FUZZY_CHARS_PER_EDIT characters
+    # (the shortest allowed a typo) is within one edit of a prefix no shorter than this
+    return [key[:length] for length in range(FUZZY_CHARS_PER_EDIT - 1, min(len(key), FUZZY_HEAD_CHARS) + 1)]
+
+
+def deletion_variants(text, deletions):
+    """
+    text and every string left by deleting up to `deletions` of its characters.
+    """
+    variants = level = {text}
+    for _ in range(deletions):
+        level = {variant[:i] + variant[i + 1:] for variant in level for i in range(len(variant))}
+        variants = variants | level
+    return variants
+
+
+def prefix_edit_distance(query, text, limit):
+    """
+    Fewest edits (insert, delete, substitute, swap neighbours) turning query
+    into some prefix of text; limit + 1 as soon as it must exceed limit.
+    """
+    text = text[:len(query) + limit]
+    before = None
+    previous = list(range(len(query) + 1))
+    best = previous[-1]
+    for j in range(len(text)):
+        current = next_edit_row(query, text, j, previous, before)
+        if min(current) > limit:
+            # Longer prefixes are further still
+            break
+        best = min(best, current[-1])
+        before, previous = previous, current
+    return min(best, limit + 1)
+
+
+def next_edit_row(query, text, j, previous, before):
+    """
+    Edit distances from each prefix of query to text[:j + 1], given those to
+    text[:j] (previous) and text[:j - 1] (before).
+    """
+    char = text[j]
+    swap_char = text[j - 1] if j > 0 else None
+    value = j + 1
+    current = [value]
+    # The minimums spelled out: this runs for every character of every key checked
+    for i in range(1, len(query) + 1):
+        left = value + 1
+        value = previous[i - 1] + (query[i - 1] != char)
+        if previous[i] + 1 < value:
+            value = previous[i] + 1
+        if left < value:
+            value = left
+        if i > 1 and query[i - 1] == swap_char and query[i - 2] == char and before[i - 2] + 1 < value:
+            value = before[i - 2] + 1
+        current.append(value)
+    return current
+
+
+class TitleIndex:
+    """
+    Prefix and fuzzy lookup over the names of the cached page tree.
+
+    Used as a page tree change listener, so renames, loaded children, moves
+    and removals (update_page_name_in_cache, the children-update functions,
+    delta sync, replays from other workers) keep it in step with the tree.
+    A whole new tree ('replace', e.g. a restored snapshot) and bulk loads are
+    indexed in the background (see _rebuild); changes made meanwhile are
+    replayed on the result before it is swapped in.
+    """
+
+    def __init__(self, get_tree):
+        self.get_tree = get_tree
+        self._titles = {}  # page_id -> (name, normalized name)
+        self._keys = []  # sorted (key, page_id)
+        self._heads = {}  # key_heads prefix -> number of keys in _keys starting with it
+        self._variants = {}  # head or head with one character deleted -> [heads]
+        self._loaded = False  # Titles read from a tree at least once
+        self._keys_stale = False  # _keys misses titles added since the last sort
+        self._inserts = 0  # Keys inserted one by one since _keys was last sorted
+        self._request = None  # Next rebuild: ('tree', root nodes) or ('titles', None)
+        self._pending = None  # While a rebuild runs: [(op, page_id, name)] to replay on its result
+        self._rebuilder = None
+        self._lock = threading.Lock()
+        self.stats = {
+            'queries': 0,
+            'rebuilds': 0,
+            'last_rebuild_ms': None,
+            'last_query_ms': None
+        }
+
+    def __len__(self):
+        return len(self._titles)
+
+    def on_tree_change(self, page_tree, op, args):
+        """
+        PageTree listener, called before op is applied to page_tree.
+        """
+        with self._lock:
+            if op == 'replace':
+                self._loaded = True
+                self._schedule_rebuild('tree', args[0])
+            elif not self._loaded or page_tree is None:
+                return
+            elif op == 'rename':
+                if self._pending is not None:
+                    # The page may only be in the tree being rebuilt
+                    self._pending.append(('rename', args[0], args[1]))
+                if args[0] in self._titles:
+                    self._add(args[0], args[1], log=False)
+            elif op == 'remove':
+                node = page_tree.get(args[0])
+                if node is not None:
+                    self._remove_subtrees([node])
+            elif op == 'set_children':
+                node = page_tree.get(args[0])
+                if node is not None:
+                    self._remove_subtrees(node['children'])
+                    self._add_subtrees(args[1])
+            elif op == 'add_root' or (op == 'add_child' and args[0] in page_tree):
+                self._add_subtrees([args[-1]])
+
+    def _add_subtrees(self, nodes):
+        stack = list(nodes)
+        while stack:
+            node = stack.pop()
+            self._add(node['id'], node['name'])
+            stack.extend(list(node.get('children') or []))
+
+    def _remove_subtrees(self, nodes):
+        stack = list(nodes)
+        while stack:
+            node = stack.pop()
+            self._remove(node['id'])
+            stack.extend(node.get('children') or [])
+
+    def _add(self, page_id, name, log=True):
+        if log and self._pending is not None:
+            self._pending.append(('add', page_id, name))
+        if page_id in self._titles:
+            if self._titles[page_id][0] == name:
+                return
+            self._remove(page_id, log=False)
+        normalized = normalize_title(name)
+        self._titles[page_id] = (name, normalized)
+        if self._keys_stale:
+            return
+        self._inserts += 1
+        if self._inserts > REBUILD_THRESHOLD:
+            # A bulk load is cheaper sorted once than inserted key by key
+            self._keys_stale = True
+            self._schedule_rebuild('titles')
+            return
+        for key in title_keys(normalized):
+            insort(self._keys, (key, page_id))
+            for head in key_heads(key):
+                self._add_head(head)
+
+    def _remove(self, page_id, log=True):
+        if log and self._pending is not None:
+            self._pending.append(('remove', page_id, None))
+        entry = self._titles.pop(page_id, None)
+        if entry is None or self._keys_stale:
+            return
+        for key in title_keys(entry[1]):
+            position = bisect_left(self._keys, (key, page_id))
+            if position < len(self._keys) and self._keys[position] == (key, page_id):
+                del self._keys[position]
+                for head in key_heads(key):
+                    self._remove_head(head)
+
+    def _add_head(self, head):
+        count = self._heads.get(head, 0)
+        self._heads[head] = count + 1
+        if count == 0:
+            for variant in deletion_variants(head, 1):
+                self._variants.setdefault(variant, []).append(head)
+
+    def _remove_head(self, head):
+        count = self._heads.pop(head) - 1
+        if count > 0:
+            self._heads[head] = count
+            return
+        for variant in deletion_variants(head, 1):
+            heads = self._variants[variant]
+            heads.remove(head)
+            if not heads:
+                del self._variants[variant]
+
+    def _schedule_rebuild(self, kind, roots=None):
+        # Called with _lock held; a pending whole tree is not overridden by a re-sort
+        if kind == 'tree':
+            self._request = (kind, roots)
+            self._pending = []
+        elif self._request is None and self._pending is None:
+            self._request = (kind, None)
+            self._pending = []
+        if self._rebuilder is None:
+            self._rebuilder = threading.Thread(target=self._run_rebuilds, name='title-index-rebuild', daemon=True)
+            self._rebuilder.start()
+
+    def _run_rebuilds(self):
+        while True:
+            with self._lock:
+                request = self._request
+                self._request = None
+                if request is None:
+                    self._rebuilder = None
+                    return
+            try:
+                self._rebuild(*request)
+            except Exception as e:
+                print(f"Error rebuilding title index: {e}")
+                with self._lock:
+                    self._pending = None
+
+    def _rebuild(self, kind, roots):
+        """
+        Index the titles of a whole tree (or re-sort the current ones) off the
+        request threads, then swap the result in.
+        """
+        started = time.perf_counter()
+        if kind == 'tree':
+            titles = {}
+            stack = list(roots)
+            while stack:
+                node = stack.pop()
+                titles[node['id']] = (node['name'], normalize_title(node['name']))
+                stack.extend(node.get('children') or [])
+        else:
+            with self._lock:
+                titles = dict(self._titles)
+        keys = sorted((key, page_id) for page_id, (_, normalized) in titles.items() for key in title_keys(normalized))
+        heads = Counter()
+        for length in range(FUZZY_CHARS_PER_EDIT - 1, FUZZY_HEAD_CHARS + 1):
+            # key_heads of every key, a length at a time
+            heads.update(key[:length] for key, _ in keys if len(key) >= length)
+        variants = {}
+        for head in heads:
+            for variant in deletion_variants(head, 1):
+                variants.setdefault(variant, []).append(head)
+        with self._lock:
+            if self._request is not None and self._request[0] == 'tree':
+                # Another tree replaced this one meanwhile; its rebuild follows
+                return
+            pending, self._pending = self._pending or [], None
+            self._titles, self._keys = titles, keys
+            self._heads, self._variants = heads, variants
+            self._keys_stale = False
+            self._inserts = 0
+            # Changes made while sorting; many of them are sorted in by another rebuild
+            for op, page_id, name in pending:
+                if op == 'remove':
+                    self._remove(page_id)
+                elif op == 'add' or page_id in self._titles:
+                    self._add(page_id, name)
+            self.stats['rebuilds'] += 1
+            self.stats['last_rebuild_ms'] = round((time.perf_counter() - started) * 1000, 3)
+
+    def lookup(self, query, limit=10):
+        """
+        Up to limit [{'id', 'name', 'match': 'prefix' | 'fuzzy'}], best first.
+        """
+        started = time.perf_counter()
+        normalized = normalize_title(query)
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            results = self._prefix_matches(normalized, limit) if normalized else []
+            if normalized and not results:
+                results = self._fuzzy_matches(normalized, limit)
+        self.stats['queries'] += 1
+        self.stats['last_query_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        return results
+
+    def _load(self):
+        # The tree existed before the index listened to it; index it in the background
+        page_tree = self.get_tree()
+        if page_tree is not None:
+            self._loaded = True
+            self._schedule_rebuild('tree', list(page_tree.roots))
+
+    def _entry(self, key, page_id):
+        # While _keys is stale it can hold keys of renamed or removed pages
+        entry = self._titles.get(page_id)
+        if entry is None or not entry[1].endswith(key):
+            return None
+        return entry
+
+    def _prefix_matches(self, normalized, limit):
+        candidates = {}
+        position = bisect_left(self._keys, (normalized,))
+        scanned = 0
+        while position < len(self._keys) and scanned < limit * PREFIX_SCAN_FACTOR:
+            key, page_id = self._keys[position]
+            if not key.startswith(normalized):
+                break
+            position += 1
+            scanned += 1
+            entry = self._entry(key, page_id)
+            if entry is None:
+                continue
+            name, title = entry
+            # Exact title, then title prefix, then word prefix; shorter titles first
+            rank = (0 if title == normalized else 1 if key == title else 2, len(title), name)
+            if page_id not in candidates or rank < candidates[page_id]:
+                candidates[page_id] = rank
+        best = sorted(candidates.items(), key=lambda item: item[1])[:limit]
+        return [{'id': page_id, 'name': rank[2], 'match': 'prefix'} for page_id, rank in best]
+
+    def _fuzzy_matches(self, normalized, limit):
+        # One typo per FUZZY_CHARS_PER_EDIT characters; too short a query would match anything
+        edits = min(len(normalized) // FUZZY_CHARS_PER_EDIT, 2)
+        if edits == 0:
+            return []
+        # A key within one edit of the probe starts with an indexed head within one edit of the
+        # probe's first FUZZY_HEAD_CHARS +- 1 characters (or of all of a shorter probe).  With two
+        # typos allowed the probe is the query's first half, so keys are found when at most one
+        # of the typos is in it; they are then checked against the whole query.
+        probe = normalized if edits == 1 else normalized[:len(normalized) // 2]
+        heads = set()
+        for length in range(FUZZY_HEAD_CHARS - 1, min(len(probe), FUZZY_HEAD_CHARS + 1) + 1):
+            for variant in deletion_variants(probe[:length], 1):
+                heads.update(self._variants.get(variant, ()))
+        best = {}
+        scanned = None
+        for head in sorted(heads):
+            if scanned is not None and head.startswith(scanned):
+                continue
+            if len(head) < min(FUZZY_HEAD_CHARS, len(probe) - 1) or prefix_edit_distance(head, probe, 1) > 1:
+                continue
+            self._fuzzy_scan(head, normalized, edits, limit, best)
+            scanned = head
+        scored = sorted((distance, len(self._titles[page_id][1]), self._titles[page_id][0], page_id) for page_id, distance in best.items())
+        return [{'id': page_id, 'name': name, 'match': 'fuzzy'} for _, _, name, page_id in scored[:limit]]
+
+    def _fuzzy_scan(self, head, query, edits, limit, best):
+        """
+        Edit distances from query to the keys starting with head, into best.
+        The keys are sorted, so each one only extends the distance table of the
+        characters it shares with the previous one, and a prefix already too
+        far from the query skips every key starting with it.  Keys agreeing on
+        their first len(query) + edits characters are the same distance away;
+        like prefix matches, such a run adds PREFIX_SCAN_FACTOR keys per result wanted.
+        """
+        window = len(query) + edits
+        rows = [list(range(len(query) + 1))]  # rows[j]: distances to path[:j]
+        closest = [len(query)]  # closest[j]: prefix distance to path[:j]
+        path = ''
+        position = bisect_left(self._keys, (head,))
+        while position < len(self._keys) and self._keys[position][0].startswith(head):
+            part = self._keys[position][0][:window]
+            shared = 0
+            while shared < len(path) and shared < len(part) and path[shared] == part[shared]:
+                shared += 1
+            del rows[shared + 1:], closest[shared + 1:]
+            for j in range(shared, len(part)):
+                row = next_edit_row(query, part, j, rows[j], rows[j - 1] if j else None)
+                if min(row) > edits:
+                    break
+                rows.append(row)
+                closest.append(min(closest[j], row[-1]))
+            path = part[:len(rows) - 1]
+            if len(path) < len(part):
+                # No key starting with part[:len(path) + 1] gets any closer than path
+                end = bisect_left(self._keys, (part[:len(path) + 1] + '\U0010ffff',), position)
+            else:
+                end = bisect_left(self._keys, (part + ('\U0010ffff' if len(part) == window else '\0'),), position)
+            distance = closest[-1]
+            if distance <= edits:
+                for key, page_id in self._keys[position:min(end, position + limit * PREFIX_SCAN_FACTOR)]:
+                    if self._entry(key, page_id) is not None and distance < best.get(page_id, edits + 1):
+                        best[page_id] = distance
+            position = end
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, pages=len(self._titles), keys=len(self._keys), heads=len(self._heads), rebuilding=self._pending is not None)
@@ -0,0 +1,200 @@
+# app/tree_crawler.py
+#
+# Background crawl of the whole workspace into the cached page tree.  Without
+# it the tree only grows when someone expands a node or opens a deep link, and
+# a deep link walks its ancestors one pages.retrieve call at a time.
+
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from .block_loader import get_executor
+
+
+class TreeCrawler:
+    """
+    Loads the sub pages of every node of the page tree, breadth-first from the
+    roots, with at most max_workers listings in flight and budget_per_minute
+    listings per minute, so interactive requests keep most of the rate limit.
+
+    The work left is derived from the tree itself (nodes with has_children but
+    no loaded children), so a crawl resumes where it stopped: after a restart
+    from the tree snapshot, in another worker process through the shared
+    backend, or after a rebuild reset the tree to its roots.  With a shared
+    backend one process crawls at a time (the 'crawl' lock, taken per slice);
+    progress counters are published there as well.
+
+    get_tree() returns the current PageTree (or None), fetch_sub_pages(page_id)
+    lists a node's sub pages from Notion and store_sub_pages(page_id, sub_pages)
+    stores them unless the node was loaded meanwhile, returning True if stored.
+    """
+
+    LOCK_NAME = 'crawl'
+    PROGRESS_KEY = 'tree_crawl:progress'
+
+    def __init__(self, get_tree, fetch_sub_pages, store_sub_pages, backend=None, max_workers=2,
+                 budget_per_minute=60, idle_interval=60, slice_seconds=60):
+        self.get_tree = get_tree
+        self.fetch_sub_pages = fetch_sub_pages
+        self.store_sub_pages = store_sub_pages
+        self.backend = backend
+        self.max_workers = max_workers
+        self.budget_per_minute = budget_per_minute
+        self.idle_interval = idle_interval
+        self.slice_seconds = slice_seconds
+        self._next_slot = 0.0
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'listings': 0,
+            'nodes_loaded': 0,
+            'errors': 0,
+            'pending': None,
+            'complete': False,
+            'last_complete_at': None,
+            'running': False
+        }
+
+    def start(self):
+        """
+        Start this process's crawler thread (once).
+        """
+        with self._thread_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._thread = threading.Thread(target=self._run, name='page-tree-crawler', daemon=True)
+            self._thread.start()
+            return True
+
+    def _run(self):
+        while True:
+            try:
+                if self.crawl_slice():
+                    continue
+            except Exception as e:
+                print(f"Error crawling page tree: {e}")
+            time.sleep(self.idle_interval)
+
+    def crawl_slice(self):
+        """
+        Crawl for up to slice_seconds; returns True if there is more to do right away.
+        """
+        if self.backend is not None and not self.backend.try_lock(self.LOCK_NAME, self.slice_seconds * 2):
+            return False
+        try:
+            self._resume_stats()
+            self._update_stats(running=True)
+            return self._crawl(time.time() + self.slice_seconds)
+        finally:
+            self._update_stats(running=False)
+            if self.backend is not None:
+                self.backend.release_lock(self.LOCK_NAME)
+
+    def _crawl(self, deadline):
+        frontier = deque(node['id'] for node in self.missing_nodes())
+        if not frontier:
+            self._update_stats(pending=0, complete=True, last_complete_at=time.time())
+            return False
+        self._update_stats(pending=len(frontier), complete=False)
+        executor = get_executor(self.max_workers, name='crawl')
+        in_flight = {}
+        while frontier or in_flight:
+            while frontier and len(in_flight) < self.max_workers and time.time() < deadline:
+                page_id = frontier.popleft()
+                if not self._still_missing(page_id):
+                    continue
+                self._wait_for_budget()
+                in_flight[executor.submit(self.fetch_sub_pages, page_id)] = page_id
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                page_id = in_flight.pop(future)
+                try:
+                    sub_pages = future.result()
+                except Exception as e:
+                    print(f"Error crawling sub pages of {page_id}: {e}")
+                    self._count(listings=1, errors=1)
+                    continue
+                stored = self.store_sub_pages(page_id, sub_pages)
+                self._count(listings=1, nodes_loaded=1 if stored else 0)
+                if stored:
+                    # Breadth-first: the next level goes behind the current one
+                    frontier.extend(sub_page['id'] for sub_page in sub_pages if sub_page['has_children'])
+            self._update_stats(pending=len(frontier) + len(in_flight))
+        return bool(frontier)
+
+    def missing_nodes(self):
+        """
+        Nodes whose sub pages are not loaded yet, in breadth-first order.
+        """
+        page_tree = self.get_tree()
+        if page_tree is None:
+            return []
+        missing = []
+        level = list(page_tree.roots)
+        while level:
+            next_level = []
+            for node in level:
+                if node['has_children'] and not node['children']:
+                    missing.append(node)
+                next_level.extend(node['children'])
+            level = next_level
+        return missing
+
+    def _still_missing(self, page_id):
+        page_tree = self.get_tree()
+        node = page_tree.get(page_id) if page_tree is not None else None
+        return node is not None and node['has_children'] and not node['children']
+
+    def _wait_for_budget(self):
+        # Evenly spaced listings: budget_per_minute / 60 per second
+        now = time.time()
+        if self._next_slot > now:
+            time.sleep(self._next_slot - now)
+            now = self._next_slot
+        self._next_slot = now + 60.0 / self.budget_per_minute
+
+    def _resume_stats(self):
+        # Carry on the counters of whichever process crawled last
+        if self.backend is None or not self.backend.shared:
+            return
+        stored = self.backend.get_content(self.PROGRESS_KEY)
+        if stored:
+            shared = json.loads(stored[1])
+            with self._stats_lock:
+                for key in ('listings', 'nodes_loaded', 'errors', 'last_complete_at'):
+                    self.stats[key] = shared.get(key, self.stats[key])
+
+    def _count(self, **amounts):
+        with self._stats_lock:
+            for key, amount in amounts.items():
+                self.stats[key] += amount
+        self._publish()
+
+    def _update_stats(self, **fields):
+        with self._stats_lock:
+            self.stats.update(fields)
+        self._publish()
+
+    def _publish(self):
+        if self.backend is not None and self.backend.shared:
+            try:
+                self.backend.set_content(self.PROGRESS_KEY, 0, json.dumps(self.get_stats(local=True)))
+            except Exception as e:
+                print(f"Error publishing crawl progress: {e}")
+
+    def get_stats(self, local=False):
+        """
+        Progress of the crawl; with a shared backend, as last published by whichever process crawled.
+        """
+        with self._stats_lock:
+            stats = dict(self.stats)
+        if not local and not stats['running'] and self.backend is not None and self.backend.shared:
+            stored = self.backend.get_content(self.PROGRESS_KEY)
+            if stored:
+                stats = json.loads(stored[1])
+        return stats
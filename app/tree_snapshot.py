@@ -0,0 +1,65 @@
+# app/tree_snapshot.py
+
+import gzip
+import json
+import os
+import tempfile
+
+from .page_tree import new_page_node
+
+SNAPSHOT_VERSION = 1
+
+
+def save_tree_snapshot(path, roots, timestamp):
+    """
+    Write the page tree to a gzip'ed JSON file, replacing any previous snapshot atomically.
+
+    Nodes are stored as compact [id, name, has_children, children] lists, so the
+    expansion state learned at runtime (loaded sub pages, traced ancestors) is kept.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    payload = {
+        'version': SNAPSHOT_VERSION,
+        'timestamp': timestamp,
+        'tree': [_pack_node(node) for node in roots]
+    }
+    data = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    fd, tmp_path = tempfile.mkstemp(dir=directory or '.', prefix='.page_tree.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            tmp_file.write(gzip.compress(data, compresslevel=6))
+        # Readers only ever see a complete file
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return len(data)
+
+
+def load_tree_snapshot(path):
+    """
+    Returns (roots, timestamp), or None if there is no usable snapshot.
+    """
+    try:
+        with open(path, 'rb') as snapshot_file:
+            payload = json.loads(gzip.decompress(snapshot_file.read()).decode('utf-8'))
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, ValueError) as e:
+        print(f"Ignoring unreadable page tree snapshot {path}: {e}")
+        return None
+    if payload.get('version') != SNAPSHOT_VERSION:
+        return None
+    return [_unpack_node(node) for node in payload['tree']], payload.get('timestamp')
+
+
+def _pack_node(node):
+    return [node['id'], node['name'], node['has_children'], [_pack_node(child) for child in node['children']]]
+
+
+def _unpack_node(packed):
+    page_id, name, has_children, children = packed
+    return new_page_node(page_id, name, has_children, [_unpack_node(child) for child in children])
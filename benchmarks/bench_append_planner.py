@@ -0,0 +1,176 @@
+# benchmarks/bench_append_planner.py
+#
+# Counts the blocks.children.append round trips needed to write a large pasted
+# document with the request planner (app/append_planner.py) and with the
+# previous append_blocks, which sent one request per list of children.  The
+# fake client checks the API limits (100 blocks per array, two nesting levels,
+# 1000 blocks per request), that nested children sit inside the type object as
+# the API requires, and that the written tree matches the input.  A second,
+# deeper document needs follow-up requests for many parents, which run
+# concurrently.
+#
+#   python benchmarks/bench_append_planner.py [--blocks 2000] [--nested 0.3] [--depth 2] [--latency 0.05]
+
+import argparse
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_append_planner():
+    # Register an empty 'app' package so the module's relative imports resolve
+    # without running app/__init__.py (which needs config.json and the Flask app)
+    package = types.ModuleType('app')
+    package.__path__ = [os.path.join(ROOT, 'app')]
+    sys.modules.setdefault('app', package)
+    from app import append_planner
+    return append_planner
+
+
+class LimitCheckingClient:
+    """
+    Stand-in for notion_client.Client recording the tree and the requests.
+    """
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.children = {}
+        self.store = {}
+        self.calls = 0
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        client = self
+
+        class Children:
+            def append(self, block_id, children, after=None):
+                return client.append(block_id, children, after)
+
+        self.blocks = types.SimpleNamespace(children=Children())
+
+    def append(self, parent_id, children, after):
+        with self._lock:
+            self.calls += 1
+            self._in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self._in_flight)
+        time.sleep(self.latency)
+        total = self._check(children, 0)
+        assert total <= 1000, f'{total} blocks in one request'
+        with self._lock:
+            self._in_flight -= 1
+            siblings = self.children.setdefault(parent_id, [])
+            position = siblings.index(after) + 1 if after else len(siblings)
+            results = []
+            for block in children:
+                block_id = self._store(parent_id, block, siblings, position)
+                position += 1
+                results.append({'id': block_id, 'type': block['type']})
+        return {'results': results}
+
+    def _check(self, blocks, level):
+        assert len(blocks) <= 100, f'{len(blocks)} blocks in one children array'
+        total = 0
+        for block in blocks:
+            total += 1
+            # Notion rejects a top-level 'children' key: body.children[0].children should not be present
+            assert 'children' not in block, 'children outside the block type object'
+            nested = block[block['type']].get('children')
+            if nested:
+                assert level < 2, 'more than two levels of nesting'
+                total += self._check(nested, level + 1)
+        return total
+
+    def _store(self, parent_id, block, siblings, position):
+        block_id = f'b{next(self._ids)}'
+        nested = block[block['type']].get('children')
+        self.store[block_id] = block
+        siblings.insert(position, block_id)
+        own = self.children.setdefault(block_id, [])
+        for child in nested or []:
+            self._store(block_id, child, own, len(own))
+        return block_id
+
+    def tree(self, parent_id):
+        return [(self.store[block_id][self.store[block_id]['type']].get('text'), self.tree(block_id))
+                for block_id in self.children.get(parent_id, [])]
+
+
+MAX_DEEP_DEPTH = 6
+
+
+def make_block(text, children=None):
+    block = {'type': 'paragraph', 'paragraph': {'text': text}}
+    if children:
+        block['type'] = 'bulleted_list_item'
+        block['bulleted_list_item'] = block.pop('paragraph')
+        block['children'] = children
+    return block
+
+
+def make_document(blocks, nested, depth, seed=1):
+    rng = random.Random(seed)
+    counter = itertools.count()
+
+    def subtree(level):
+        if level < depth and rng.random() < nested:
+            return make_block(f't{next(counter)}', [subtree(level + 1) for _ in range(rng.randint(1, 4))])
+        return make_block(f't{next(counter)}')
+
+    return [subtree(0) for _ in range(blocks)]
+
+
+def expected_tree(blocks):
+    return [(block[block['type']]['text'], expected_tree(block.get('children') or [])) for block in blocks]
+
+
+def legacy_calls(blocks):
+    # append_blocks before the planner: one request per children list, however long
+    if not blocks:
+        return 0
+    return 1 + sum(legacy_calls(block.get('children')) for block in blocks)
+
+
+def run(planner, name, document, latency, workers):
+    client = LimitCheckingClient(latency)
+    started = time.perf_counter()
+    calls = planner.append_block_tree(client, 'page', document, max_workers=workers)
+    elapsed = time.perf_counter() - started
+
+    assert client.tree('page') == expected_tree(document), 'written tree differs from the document'
+    old = legacy_calls(document)
+    print(name)
+    print(f'  blocks:           {planner.count_blocks({"type": "page", "children": document}) - 1}')
+    print(f'  legacy requests:  {old}  (~{old * latency:.1f}s serial at {latency}s each)')
+    print(f'  planner requests: {calls}  ({elapsed:.2f}s, up to {client.max_in_flight} in flight)')
+    print(f'  reduction:        {old / calls:.1f}x fewer round trips')
+    return client
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--blocks', type=int, default=2000, help='top-level blocks')
+    parser.add_argument('--nested', type=float, default=0.3, help='probability that a block has children')
+    parser.add_argument('--depth', type=int, default=2, help='maximum nesting depth')
+    parser.add_argument('--latency', type=float, default=0.05, help='simulated seconds per request')
+    parser.add_argument('--workers', type=int, default=3)
+    args = parser.parse_args()
+
+    planner = load_append_planner()
+    run(planner, f'document, depth {args.depth}', make_document(args.blocks, args.nested, args.depth), args.latency, args.workers)
+    # Nested deeper than one request can carry: each subtree below the second
+    # level is a follow-up for its own parent, and those run side by side
+    deep = make_document(max(1, args.blocks // 100), 0.7, MAX_DEEP_DEPTH, seed=2)
+    client = run(planner, f'deep document, depth {MAX_DEEP_DEPTH}', deep, args.latency, args.workers)
+    if args.workers > 1:
+        assert client.max_in_flight > 1, 'follow-ups for different parents did not run concurrently'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,365 @@
+# benchmarks/bench_block_renderer.py
+#
+# Compares the dispatch-table renderer (app/block_renderer.py) with the previous
+# if/elif + string concatenation parse_block on synthetic pages, and checks that
+# both produce the same HTML.
+#
+#   python benchmarks/bench_block_renderer.py [--blocks 10000] [--repeat 5] [--shape mixed|deep] [--depth N]
+
+import argparse
+import importlib.util
+import os
+import random
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_block_renderer():
+    # Load the module by path so the Flask app (and its config.json) is not needed
+    spec = importlib.util.spec_from_file_location('block_renderer', os.path.join(ROOT, 'app', 'block_renderer.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# ---- previous implementation, kept here as the reference -------------------
+# Children are read from block['children'] (as preloaded by load_block_tree)
+# instead of being fetched from Notion.
+
+def legacy_parse_block(block):
+    block_type = block['type']
+    block_id = block['id']
+    content = ''
+
+    if block_type == 'paragraph':
+        text = legacy_rich_text_to_html(block['paragraph']['rich_text'])
+        content += f'<p data-notion-block-type="paragraph" data-notion-block-id="{block_id}">{text}</p>'
+        # 处理子块
+        if block['has_children']:
+            children = block['children']
+            for child in children:
+                content += legacy_parse_block(child)
+
+    elif block_type == 'heading_1':
+        text = legacy_rich_text_to_html(block['heading_1']['rich_text'])
+        content += f'<h1 data-notion-block-type="heading_1" data-notion-block-id="{block_id}">{text}</h1>'
+        if block['has_children']:
+            children = block['children']
+            for child in children:
+                content += legacy_parse_block(child)
+
+    elif block_type == 'heading_2':
+        text = legacy_rich_text_to_html(block['heading_2']['rich_text'])
+        content += f'<h2 data-notion-block-type="heading_2" data-notion-block-id="{block_id}">{text}</h2>'
+        if block['has_children']:
+            children = block['children']
+            for child in children:
+                content += legacy_parse_block(child)
+
+    elif block_type == 'heading_3':
+        text = legacy_rich_text_to_html(block['heading_3']['rich_text'])
+        content += f'<h3 data-notion-block-type="heading_3" data-notion-block-id="{block_id}">{text}</h3>'
+        if block['has_children']:
+            children = block['children']
+            for child in children:
+                content += legacy_parse_block(child)
+
+    elif block_type == 'bulleted_list_item':
+        text = legacy_rich_text_to_html(block['bulleted_list_item']['rich_text'])
+        content += f'<ul data-notion-block-type="bulleted_list" data-notion-block-id="{block_id}"><li>{text}'
+        # 处理子块
+        if block['has_children']:
+            content += '<ul>'
+            children = block['children']
+            for child in children:
+                content += legacy_parse_block(child)
+            content += '</ul>'
+        content += '</li></ul>'
+
+    elif block_type == 'numbered_list_item':
+        text = legacy_rich_text_to_html(block['numbered_list_item']['rich_text'])
+        content += f'<ol data-notion-block-type="numbered_list" data-notion-block-id="{block_id}"><li>{text}'
+        # 处理子块
+        if block['has_children']:
+            content += '<ol>'
+            children = block['children']
+            for child in children:
+                content += legacy_parse_block(child)
+            content += '</ol>'
+        content += '</li></ol>'
+
+    elif block_type == 'to_do':
+        # 获取任务内容和完成状态
+        text = legacy_rich_text_to_html(block['to_do']['rich_text'])
+        checked = block['to_do']['checked']
+        # 构建 CKEditor 的待办事项 HTML
+        checkbox = f'<input type="checkbox" tabindex="-1" {"checked" if checked else ""}>'
+        # 包装为 CKEditor 的待办事项格式
+        content += f'''
+        <ul class="todo-list" data-notion-block-type="to_do" data-notion-block-id="{block_id}">
+            <li>
+                <span class="todo-list__label">
+                    <span contenteditable="false">{checkbox}</span>
+                    <span class="todo-list__label__description">{text}</span>
+                </span>
+        '''
+
+        # 处理子块（如果有）
+        if block['has_children']:
+            children = block['children']
+            for child in children:
+                content += legacy_parse_block(child)
+        content+= '</li></ul>'
+
+    elif block_type == 'divider':
+        content += f'<hr data-notion-block-type="divider" data-notion-block-id="{block_id}"/>'
+
+    elif block_type == 'image':
+        image_url = block['image'].get('file', {}).get('url', '') or block['image'].get('external', {}).get('url', '')
+        caption = legacy_rich_text_to_html(block['image'].get('caption', []))
+        content += f'<figure data-notion-block-type="image" data-notion-block-id="{block_id}"><img src="{image_url}" alt="{caption}"/><figcaption>{caption}</figcaption></figure>'
+
+    elif block_type == 'callout':
+        text = legacy_rich_text_to_html(block['callout']['rich_text'])
+        icon = block['callout'].get('icon', {}).get('emoji', '')
+        content += f'<div class="callout" data-notion-block-type="callout" data-notion-block-id="{block_id}">{icon} {text}'
+
+        # 处理子块（如果有）
+        if block['has_children']:
+            children = block['children']
+            for child in children:
+                content += legacy_parse_block(child)
+        content += '</div>'
+        
+    elif block_type == 'code':
+        code_text = ''.join([t['plain_text'] for t in block['code']['rich_text']])
+        language = block['code'].get('language', '').lower()
+        code_text_escaped = code_text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+        content += f'<pre data-notion-block-type="code" data-notion-block-id="{block_id}"><code class="language-{language}">{code_text_escaped}</code></pre>'
+
+    elif block_type == 'file':
+        file_info = block['file']
+        file_url = file_info.get('file', {}).get('url', '') or file_info.get('external', {}).get('url', '')
+        file_name = file_info.get('name', 'Download File')
+        content += f'<p data-notion-block-type="file" data-notion-block-id="{block_id}"><a href="{file_url}" download="{file_name}">{file_name}</a></p>'
+
+    elif block_type == 'bookmark':
+        url = block['bookmark']['url']
+        caption = legacy_rich_text_to_html(block['bookmark'].get('caption', []))
+        display_text = caption if caption else url
+        content += f'<p data-notion-block-type="bookmark" data-notion-block-id="{block_id}"><a href="{url}">{display_text}</a></p>'
+
+    elif block_type == 'link_preview':
+        url = block['link_preview']['url']
+        content += f'<p data-notion-block-type="link_preview" data-notion-block-id="{block_id}"><a href="{url}">{url}</a></p>'
+
+    elif block_type == 'link_to_page':
+        link_type = block['link_to_page']['type']
+        if link_type == 'page_id':
+            linked_page_id = block['link_to_page']['page_id']
+            page_title = 'Untitled'
+            page_url = f"/page/{linked_page_id}"
+            content += f'<p data-notion-block-type="link_to_page" data-notion-block-id="{block_id}"><a href="{page_url}">{page_title}</a></p>'
+        else:
+            content += f'<p data-notion-block-type="link_to_page" data-notion-block-id="{block_id}">[Unsupported link type]</p>'
+
+    elif block_type == 'table':
+        table_info = block['table']
+        has_column_header = table_info['has_column_header']
+        content += f'<table data-notion-block-type="table" data-notion-block-id="{block_id}">'
+        table_rows = block['children']
+        for idx, row_block in enumerate(table_rows):
+            if row_block['type'] == 'table_row':
+                cells = row_block['table_row']['cells']
+                row_tag = 'th' if has_column_header and idx == 0 else 'td'
+                content += '<tr>'
+                for cell in cells:
+                    cell_content = legacy_rich_text_to_html(cell)
+                    content += f'<{row_tag}>{cell_content}</{row_tag}>'
+                content += '</tr>'
+        content += '</table>'
+
+    elif block_type == 'toggle':
+        title = legacy_rich_text_to_html(block['toggle']['rich_text'])
+        content += f'<details data-notion-block-type="toggle" data-notion-block-id="{block_id}"><summary>{title}</summary>'
+        # 处理子块
+        if block['has_children']:
+            children = block['children']
+            for child in children:
+                content += legacy_parse_block(child)
+        content += '</details>'
+
+    elif block_type == 'audio':
+        audio_info = block['audio']
+        audio_url = audio_info.get('file', {}).get('url', '') or audio_info.get('external', {}).get('url', '')
+        content += f'<audio controls data-notion-block-type="audio" data-notion-block-id="{block_id}"><source src="{audio_url}">Your browser does not support the audio element.</audio>'
+
+    elif block_type == 'child_page':
+        page_title = block['child_page']['title']
+        page_url = f"/page/{block_id}"
+        content += f'<p data-notion-block-type="child_page" data-notion-block-id="{block_id}"><a href="{page_url}">{page_title}</a></p>'
+
+    elif block_type == 'quote':
+        text = legacy_rich_text_to_html(block['quote']['rich_text'])
+        content += f'<blockquote data-notion-block-type="quote" data-notion-block-id="{block_id}">{text}</blockquote>'
+        # 处理子块
+        if block['has_children']:
+            children = block['children']
+            for child in children:
+                content += legacy_parse_block(child)
+
+    else:
+        content += f'<p data-notion-block-type="{block_type}" data-notion-block-id="{block_id}">[Unsupported block type: {block_type}]</p>'
+
+    return content
+
+def legacy_rich_text_to_html(rich_text_array):
+    html_content = ''
+    for text_obj in rich_text_array:
+        annotations = text_obj.get('annotations', {})
+        plain_text = text_obj.get('plain_text', '')
+        href = text_obj.get('href')
+
+        text = plain_text
+        if annotations.get('bold'):
+            text = f'<strong>{text}</strong>'
+        if annotations.get('italic'):
+            text = f'<em>{text}</em>'
+        if annotations.get('underline'):
+            text = f'<u>{text}</u>'
+        if annotations.get('strikethrough'):
+            text = f'<s>{text}</s>'
+        if annotations.get('color') and annotations['color'] != 'default':
+            # check if color ends with 'background'：
+            if annotations['color'].endswith('_background'):
+                background_color = annotations['color'].replace('_background', '')
+                text = f'<span style="background-color:{background_color}">{text}</span>'
+            else:
+                text = f'<span style="color:{annotations["color"]}">{text}</span>'
+        if annotations.get('code'):
+            text = f'<code>{text}</code>'
+        if href:
+            text = f'<a href="{href}">{text}</a>'
+        html_content += text
+    return html_content
+
+
+# ---- synthetic pages ---------------------------------------------------------
+
+def rich_text(rng, words=8):
+    runs = []
+    for _ in range(rng.randint(1, 4)):
+        runs.append({
+            'plain_text': ' '.join(rng.choice(('notion', 'flask', 'cache', 'page', 'block', 'render')) for _ in range(words)),
+            'href': 'https://example.com' if rng.random() < 0.1 else None,
+            'annotations': {
+                'bold': rng.random() < 0.3,
+                'italic': rng.random() < 0.2,
+                'underline': False,
+                'strikethrough': False,
+                'code': rng.random() < 0.05,
+                'color': rng.choice(('default', 'default', 'red', 'blue_background'))
+            }
+        })
+    return runs
+
+
+def make_block(rng, counter, depth, max_depth):
+    counter[0] += 1
+    block_id = f'block-{counter[0]}'
+    kind = rng.choice(('paragraph', 'heading_2', 'bulleted_list_item', 'numbered_list_item', 'to_do', 'toggle', 'quote', 'code', 'divider', 'callout'))
+    block = {'id': block_id, 'type': kind, 'has_children': False}
+    if kind == 'code':
+        block['code'] = {'rich_text': [{'plain_text': 'print("<hello>")'}], 'language': 'Python'}
+    elif kind == 'divider':
+        block['divider'] = {}
+    elif kind == 'to_do':
+        block['to_do'] = {'rich_text': rich_text(rng), 'checked': rng.random() < 0.5}
+    elif kind == 'callout':
+        block['callout'] = {'rich_text': rich_text(rng), 'icon': {'emoji': '💡'}}
+    else:
+        block[kind] = {'rich_text': rich_text(rng)}
+    if kind in ('bulleted_list_item', 'numbered_list_item', 'toggle', 'to_do') and depth < max_depth and rng.random() < 0.4:
+        block['has_children'] = True
+        block['children'] = []
+    return block
+
+
+def make_page(total_blocks, max_depth=4, seed=1):
+    rng = random.Random(seed)
+    counter = [0]
+    top = []
+    open_parents = []
+    while counter[0] < total_blocks:
+        if open_parents and rng.random() < 0.6:
+            parent, depth = rng.choice(open_parents)
+            block = make_block(rng, counter, depth + 1, max_depth)
+            parent['children'].append(block)
+        else:
+            depth = 0
+            block = make_block(rng, counter, depth, max_depth)
+            top.append(block)
+        if block.get('children') is not None:
+            open_parents.append((block, depth))
+    return top
+
+
+def make_deep_page(total_blocks, depth, seed=1):
+    """
+    A single chain of `depth` nested toggles sharing total_blocks paragraphs:
+    the case where per-level string concatenation copies the most.
+    """
+    rng = random.Random(seed)
+    per_level = max(1, total_blocks // depth - 1)
+    top = []
+    siblings = top
+    for level in range(depth):
+        toggle = {'id': f'toggle-{level}', 'type': 'toggle', 'has_children': True, 'toggle': {'rich_text': rich_text(rng)}, 'children': []}
+        siblings.append(toggle)
+        for index in range(per_level):
+            toggle['children'].append({'id': f'p-{level}-{index}', 'type': 'paragraph', 'has_children': False, 'paragraph': {'rich_text': rich_text(rng)}})
+        siblings = toggle['children']
+    return top
+
+
+def bench(label, render, page, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        html = render(page)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    print(f'{label:<28} {best * 1000:9.1f} ms   {len(html) / 1024:8.0f} KiB')
+    return best, html
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--blocks', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--shape', choices=('mixed', 'deep'), default='mixed',
+                        help='mixed: random block types nested up to --depth; deep: one chain of --depth nested toggles')
+    parser.add_argument('--depth', type=int, default=None, help='nesting depth (default 4 for mixed, 250 for deep)')
+    args = parser.parse_args()
+
+    block_renderer = load_block_renderer()
+    renderer = block_renderer.BlockRenderer()
+    if args.shape == 'deep':
+        depth = args.depth or 250
+        page = make_deep_page(args.blocks, depth)
+    else:
+        depth = args.depth or 4
+        page = make_page(args.blocks, depth)
+    print(f'{args.blocks} blocks, {args.shape} shape, depth <= {depth}, best of {args.repeat}')
+
+    legacy_time, legacy_html = bench('legacy parse_block', lambda blocks: ''.join(legacy_parse_block(b) for b in blocks), page, args.repeat)
+    new_time, new_html = bench('BlockRenderer', renderer.render_blocks, page, args.repeat)
+
+    if legacy_html != new_html:
+        raise SystemExit('Output differs between legacy parse_block and BlockRenderer')
+    print(f'identical output, speed-up x{legacy_time / new_time:.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+# benchmarks/bench_color_converter.py
+#
+# Classifies the colour styles of a heavily formatted page (many spans, few
+# distinct colours) with the memoised, table-driven app/color_converter.py and
+# with the previous implementation, which recompiled the regexes and
+# recomputed every colour, and checks that both give the same Notion colours.
+#
+#   python benchmarks/bench_color_converter.py [--spans 50000] [--colors 16] [--repeat 5]
+
+import argparse
+import importlib.util
+import os
+import random
+import re
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_color_converter():
+    # Load the module by path so the Flask app (and its config.json) is not needed
+    spec = importlib.util.spec_from_file_location('color_converter', os.path.join(ROOT, 'app', 'color_converter.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# ---- previous implementation, kept here as the reference -------------------
+
+def legacy_parse_hsl(hsl_str):
+    pattern = r'hsl\(\s*(\d+(?:\.\d+)?)\s*,\s*(\d+(?:\.\d+)?)%\s*,\s*(\d+(?:\.\d+)?)%\s*\)\s*;?'
+    match = re.match(pattern, hsl_str.strip(), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid HSL format: {hsl_str}")
+    h, s, l = match.groups()
+    return float(h) % 360, float(s), float(l)
+
+
+def legacy_hsl_to_color_name(h, s, l):
+    if s < 10:
+        return "gray"
+    if 20 <= h <= 40 and s >= 30 and l <= 50:
+        return "brown"
+    if (0 <= h <= 15) or (345 <= h <= 360):
+        return "red"
+    elif 16 <= h <= 45:
+        return "orange"
+    elif 46 <= h <= 65:
+        return "yellow"
+    elif 66 <= h <= 165:
+        return "green"
+    elif 166 <= h <= 255:
+        return "blue"
+    elif 256 <= h <= 310:
+        return "purple"
+    elif 322 <= h <= 344:
+        return "pink"
+    else:
+        return "default"
+
+
+def legacy_parse_hex(hex_str):
+    hex_str = hex_str.strip().lower()
+    match = re.match(r'^#([0-9a-f]{3}|[0-9a-f]{6})$', hex_str)
+    if not match:
+        raise ValueError(f"Invalid hex color format: {hex_str}")
+    hex_value = match.group(1)
+    if len(hex_value) == 3:
+        hex_value = ''.join([c * 2 for c in hex_value])
+    return int(hex_value[0:2], 16), int(hex_value[2:4], 16), int(hex_value[4:6], 16)
+
+
+def legacy_rgb_to_hsl(r, g, b):
+    r /= 255
+    g /= 255
+    b /= 255
+    max_val = max(r, g, b)
+    min_val = min(r, g, b)
+    l = (max_val + min_val) / 2
+    if max_val == min_val:
+        h = s = 0
+    else:
+        d = max_val - min_val
+        s = d / (2 - max_val - min_val) if l > 0.5 else d / (max_val + min_val)
+        if max_val == r:
+            h = (g - b) / d + (6 if g < b else 0)
+        elif max_val == g:
+            h = (b - r) / d + 2
+        else:
+            h = (r - g) / d + 4
+        h /= 6
+    return round(h * 360) % 360, round(s * 100), round(l * 100)
+
+
+def legacy_style_to_color(style):
+    # The colour branch of the previous html_to_rich_text
+    if 'color' in style and 'background-color' not in style:
+        text_color = style.replace('color:', '').replace(';', '')
+        if 'hsl' in text_color:
+            try:
+                return legacy_hsl_to_color_name(*legacy_parse_hsl(text_color))
+            except Exception:
+                return "default"
+        elif '#' in text_color:
+            try:
+                return legacy_hsl_to_color_name(*legacy_rgb_to_hsl(*legacy_parse_hex(text_color)))
+            except Exception:
+                return "default"
+        elif 'black' in text_color or 'white' in text_color:
+            return "default"
+        return text_color
+    elif 'background-color' in style:
+        text_color = style.replace('background-color:', '').replace(';', '')
+        if 'hsl' in text_color:
+            try:
+                return legacy_hsl_to_color_name(*legacy_parse_hsl(text_color)) + '_background'
+            except Exception:
+                return "default_background"
+        return text_color + '_background'
+    return None
+
+# -----------------------------------------------------------------------------
+
+
+def make_styles(spans, colors, seed):
+    rng = random.Random(seed)
+    palette = []
+    for _ in range(colors):
+        kind = rng.randrange(4)
+        if kind == 0:
+            palette.append(f'color:hsl({rng.randrange(360)}, {rng.randrange(101)}%, {rng.randrange(101)}%);')
+        elif kind == 1:
+            palette.append(f'color:#{rng.getrandbits(24):06x};')
+        elif kind == 2:
+            palette.append(f'background-color:hsl({rng.randrange(360)}, {rng.randrange(101)}%, {rng.randrange(101)}%);')
+        else:
+            palette.append(f'color:#{rng.getrandbits(12):03x};')
+    return [rng.choice(palette) for _ in range(spans)]
+
+
+def best_of(repeat, func):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--spans', type=int, default=50000, help='coloured spans on the page')
+    parser.add_argument('--colors', type=int, default=16, help='distinct colour styles')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    converter = load_color_converter()
+    styles = make_styles(args.spans, args.colors, args.seed)
+
+    legacy_time, legacy = best_of(args.repeat, lambda: [legacy_style_to_color(style) for style in styles])
+    # Cold memo on the first round, warm afterwards (as in a long-running worker)
+    cached_time, cached = best_of(args.repeat, lambda: [converter.style_to_notion_color(style) for style in styles])
+    batch_time, batch = best_of(args.repeat, lambda: converter.classify_styles(styles))
+
+    assert cached == legacy, 'memoised classification differs from the previous implementation'
+    assert [batch[style] for style in styles] == legacy, 'batch classification differs'
+
+    print(f"spans: {args.spans}, distinct styles: {len(set(styles))}")
+    print(f"previous:  {legacy_time * 1000:8.1f} ms")
+    print(f"memoised:  {cached_time * 1000:8.1f} ms  ({legacy_time / cached_time:.1f}x)")
+    print(f"batch:     {batch_time * 1000:8.1f} ms  ({legacy_time / batch_time:.1f}x)")
+    print(f"cache:     {converter.get_color_cache_stats()['style']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+# benchmarks/bench_html_parser.py
+#
+# Converts a large synthetic editor document with html_to_notion_blocks using
+# each parser backend (app/html_dom.py), checks that every backend produces
+# exactly the blocks of the BeautifulSoup html.parser reference, and reports
+# the conversion time and the size of the resulting JSON.  lxml is only
+# measured when it is installed.  It also checks that nested lists rendered by
+# block_renderer.py parse back into the same block tree, since a save diffs
+# the parsed blocks against the page and archives whatever is missing.
+#
+#   python benchmarks/bench_html_parser.py [--blocks 1000] [--repeat 5] [--seed 1]
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_html_to_notion():
+    # Register an empty 'app' package so the module's relative imports resolve
+    # without running app/__init__.py (which needs config.json and the Flask app)
+    package = types.ModuleType('app')
+    package.__path__ = [os.path.join(ROOT, 'app')]
+    sys.modules.setdefault('app', package)
+    from app import block_renderer, html_dom, html_to_notion
+    return block_renderer, html_dom, html_to_notion
+
+
+WORDS = ['notion', 'editor', 'page', 'block', 'cache', '数据', '页面', 'a&amp;b', '&lt;tag&gt;', 'x&nbsp;y', '&#169;', '&unknown;']
+COLORS = ['color:#e03e3e;', 'color:hsl(0, 75%, 60%);', 'color:black;', 'background-color:yellow;', 'background-color:hsl(210, 75%, 60%);']
+
+
+def words(rng, count):
+    return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+
+def inline(rng):
+    kind = rng.randrange(9)
+    text = words(rng, rng.randint(1, 4))
+    if kind == 0:
+        return f'<strong>{text}</strong>'
+    if kind == 1:
+        return f'<em>{text}</em>'
+    if kind == 2:
+        return f'<strong><em>{text}</em></strong>'
+    if kind == 3:
+        return f'<span style="{rng.choice(COLORS)}">{text}</span>'
+    if kind == 4:
+        return f'<a href="https://example.com/{rng.randrange(100)}">{text}</a>'
+    if kind == 5:
+        return f'<code>{text}</code>'
+    if kind == 6:
+        return f'<u>{text}</u> <s>{text}</s>'
+    if kind == 7:
+        return f'{text}<br>{text}'
+    return text
+
+
+def paragraph_html(rng):
+    return ' '.join(inline(rng) for _ in range(rng.randint(1, 6)))
+
+
+def list_html(rng, tag, depth):
+    items = []
+    for _ in range(rng.randint(1, 5)):
+        nested = list_html(rng, rng.choice(['ul', 'ol']), depth - 1) if depth and rng.random() < 0.3 else ''
+        items.append(f'<li data-notion-block-id="{rng.getrandbits(64):x}">{paragraph_html(rng)}{nested}</li>')
+    return f'<{tag}>\n' + '\n'.join(items) + f'\n</{tag}>'
+
+
+def todo_html(rng, depth):
+    items = []
+    for _ in range(rng.randint(1, 4)):
+        checked = ' checked="checked"' if rng.random() < 0.5 else ''
+        nested = todo_html(rng, depth - 1) if depth and rng.random() < 0.3 else ''
+        items.append(
+            '<li><label class="todo-list__label"><input type="checkbox" disabled="disabled"' + checked + '>'
+            f'<span class="todo-list__label__description">{paragraph_html(rng)}</span></label>{nested}</li>'
+        )
+    return '<ul class="todo-list">' + ''.join(items) + '</ul>'
+
+
+def table_html(rng):
+    rows = []
+    width = rng.randint(1, 5)
+    for _ in range(rng.randint(1, 12)):
+        rows.append('<tr>' + ''.join(f'<td>{paragraph_html(rng)}</td>' for _ in range(width)) + '</tr>')
+    table = '<table><tbody>' + ''.join(rows) + '</tbody></table>'
+    return f'<figure class="table">{table}</figure>' if rng.random() < 0.5 else table
+
+
+def block_html(rng, idx):
+    kind = rng.randrange(12)
+    block_id = f'data-notion-block-id="{idx:08x}-0000"'
+    if kind < 3:
+        return f'<p data-notion-block-type="paragraph" {block_id}>{paragraph_html(rng)}</p>'
+    if kind == 3:
+        level = rng.randint(1, 5)
+        return f'<h{level}>{paragraph_html(rng)}</h{level}>'
+    if kind == 4:
+        return list_html(rng, rng.choice(['ul', 'ol']), 2)
+    if kind == 5:
+        return todo_html(rng, 2)
+    if kind == 6:
+        return table_html(rng)
+    if kind == 7:
+        code = words(rng, 8).replace(' ', '\n    ')
+        return f'<pre><code class="language-python">def f():\n    {code}\n</code></pre>'
+    if kind == 8:
+        return f'<figure class="image"><img src="https://example.com/{idx}.png"><figcaption>{words(rng, 3)}</figcaption></figure>'
+    if kind == 9:
+        return f'<blockquote><p>{paragraph_html(rng)}</p> {words(rng, 2)} <p>{paragraph_html(rng)}</p></blockquote>'
+    if kind == 10:
+        return (
+            f'<details data-notion-block-type="toggle" {block_id}><summary>{paragraph_html(rng)}</summary>'
+            f'<p>{paragraph_html(rng)}</p>{list_html(rng, "ul", 1)}</details>'
+        )
+    return '<hr><!-- comment -->'
+
+
+def build_document(count, seed):
+    rng = random.Random(seed)
+    return '\n'.join(block_html(rng, idx) for idx in range(count))
+
+
+def rendered_list_item(block_id, text, children=(), block_type='bulleted_list_item'):
+    rich_text = [{
+        'type': 'text',
+        'text': {'content': text, 'link': None},
+        'plain_text': text,
+        'href': None,
+        'annotations': {'bold': False, 'italic': False, 'strikethrough': False, 'underline': False, 'code': False, 'color': 'default'}
+    }]
+    return {'id': block_id, 'type': block_type, block_type: {'rich_text': rich_text}, 'has_children': bool(children), 'children': list(children)}
+
+
+def nested_list_blocks():
+    # Lists three levels deep, mixed list types and a non-list child of a list item
+    paragraph = {'id': 'p1', 'type': 'paragraph', 'paragraph': {'rich_text': []}, 'has_children': False}
+    return [
+        rendered_list_item('a', 'A', [
+            rendered_list_item('a1', 'A1', [rendered_list_item('a11', 'A11', block_type='numbered_list_item')]),
+            rendered_list_item('a2', 'A2'),
+            paragraph
+        ]),
+        rendered_list_item('b', 'B', [rendered_list_item('b1', 'B1', block_type='numbered_list_item')], block_type='numbered_list_item')
+    ]
+
+
+def block_shape(blocks):
+    return [(block.get('id'), block['type'], block_shape(block.get('children') or [])) for block in blocks]
+
+
+def check_round_trip(block_renderer, convert, backend):
+    blocks = nested_list_blocks()
+    html = block_renderer.BlockRenderer().render_blocks(blocks)
+    return block_shape(convert(html, backend)) == block_shape(blocks)
+
+
+def time_backend(convert, html, backend, repeat):
+    best = None
+    blocks = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        blocks = convert(html, backend)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, blocks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--blocks', type=int, default=1000, help='top-level elements in the document')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    block_renderer, html_dom, html_to_notion = load_html_to_notion()
+    html = build_document(args.blocks, args.seed)
+    backends = ['html.parser', 'fast'] + (['lxml'] if html_dom.lxml_available() else [])
+    print(f"document: {len(html) / 1024:.0f} KiB, {args.blocks} top-level elements")
+
+    reference = None
+    reference_time = None
+    for backend in backends:
+        elapsed, blocks = time_backend(html_to_notion.html_to_notion_blocks, html, backend, args.repeat)
+        if reference is None:
+            reference, reference_time = json.dumps(blocks, sort_keys=True), elapsed
+            parity = 'reference'
+        else:
+            parity = 'identical' if json.dumps(blocks, sort_keys=True) == reference else 'DIFFERENT'
+        size = len(json.dumps(blocks, ensure_ascii=False).encode('utf-8'))
+        print(f"{backend:12s} {elapsed * 1000:8.1f} ms  {reference_time / elapsed:5.1f}x  {len(blocks)} blocks  {size / 1024:.0f} KiB JSON  {parity}")
+        if parity == 'DIFFERENT' and backend == 'fast':
+            sys.exit(1)
+
+    for backend in backends:
+        round_trip = check_round_trip(block_renderer, html_to_notion.html_to_notion_blocks, backend)
+        print(f"{backend:12s} nested list round trip: {'ok' if round_trip else 'BLOCKS LOST'}")
+        if not round_trip:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+# benchmarks/bench_page_tree_memory.py
+#
+# Memory of a large cached page tree: the previous representation (a dict per
+# node, an empty list per leaf, ids as decoded from JSON) against the PageNode
+# tree of app/page_tree.py, both with the id index and parent links.  The tree
+# arrives as JSON, the way the snapshot and the shared change log hand it over.
+#
+#   python benchmarks/bench_page_tree_memory.py [--pages 100000] [--fanout 12]
+
+import argparse
+import gc
+import importlib.util
+import json
+import os
+import time
+import tracemalloc
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_page_tree():
+    # Load the module by path so the Flask app (and its config.json) is not needed
+    spec = importlib.util.spec_from_file_location('page_tree', os.path.join(ROOT, 'app', 'page_tree.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_tree_json(pages, fanout):
+    # Breadth-first tree of `pages` nodes, names like a real workspace's
+    count = 0
+    roots = []
+    level = []
+    while count < pages and len(roots) < fanout:
+        node = {'id': str(uuid.uuid4()), 'name': f'Section {count}', 'has_children': False, 'children': []}
+        roots.append(node)
+        level.append(node)
+        count += 1
+    while count < pages:
+        next_level = []
+        for parent in level:
+            for i in range(fanout):
+                if count >= pages:
+                    break
+                node = {'id': str(uuid.uuid4()), 'name': f'{parent["name"]} / Page {i}', 'has_children': False, 'children': []}
+                parent['children'].append(node)
+                parent['has_children'] = True
+                next_level.append(node)
+                count += 1
+        level = next_level
+    return json.dumps(roots)
+
+
+def legacy_tree(payload):
+    # What PageTree held before: the decoded dicts plus the id index and parent links
+    roots = json.loads(payload)
+    nodes = {}
+    parents = {}
+    stack = [(root, None) for root in roots]
+    while stack:
+        node, parent_id = stack.pop()
+        nodes[node['id']] = node
+        parents[node['id']] = parent_id
+        stack.extend((child, node['id']) for child in node['children'])
+    return roots, nodes, parents
+
+
+def compact_tree(page_tree_module, payload):
+    return page_tree_module.PageTree(json.loads(payload))
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    tree = build()
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return tree, size, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', type=int, default=100000)
+    parser.add_argument('--fanout', type=int, default=12)
+    args = parser.parse_args()
+
+    page_tree = load_page_tree()
+    payload = make_tree_json(args.pages, args.fanout)
+
+    legacy, legacy_size, legacy_time = measure(lambda: legacy_tree(payload))
+    del legacy
+    compact, compact_size, compact_time = measure(lambda: compact_tree(page_tree, payload))
+
+    # Same tree either way
+    assert len(compact) == args.pages
+    assert json.loads(json.dumps(page_tree.to_plain(compact.roots))) == json.loads(payload)
+
+    print(f'{args.pages} pages, fanout {args.fanout}')
+    print(f'  dict nodes:     {legacy_size / 1e6:8.1f} MB  {legacy_size / args.pages:6.0f} B/page  built in {legacy_time:.2f}s')
+    print(f'  PageNode slots: {compact_size / 1e6:8.1f} MB  {compact_size / args.pages:6.0f} B/page  built in {compact_time:.2f}s')
+    print(f'  saving:         {(1 - compact_size / legacy_size) * 100:8.1f} %')
+
+
+if __name__ == '__main__':
+    main()
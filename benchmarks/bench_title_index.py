@@ -0,0 +1,144 @@
+# benchmarks/bench_title_index.py
+#
+# Quick switcher index (app/title_index.py) over a large page tree: how long a
+# 'replace' (a new tree) holds up the tree change and the next lookup, how long
+# the background rebuild takes, and prefix / fuzzy lookup latency.  Fuzzy
+# lookups (one or two typos anywhere in the query) are compared against a scan
+# of every key, for speed and for how often they return the same pages.
+#
+#   python benchmarks/bench_title_index.py [--pages 100000] [--queries 300] [--scans 10] [--seed 1]
+
+import argparse
+import os
+import random
+import sys
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_modules():
+    # Register an empty 'app' package so the module's relative imports resolve
+    # without running app/__init__.py (which needs config.json and the Flask app)
+    package = types.ModuleType('app')
+    package.__path__ = [os.path.join(ROOT, 'app')]
+    sys.modules.setdefault('app', package)
+    from app import page_tree, title_index
+    return page_tree, title_index
+
+
+def make_roots(page_tree, pages, rng):
+    # A thousand sections of random titles from a vocabulary of made-up and CJK words
+    vocabulary = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(3, 9))) for _ in range(20000)]
+    vocabulary += [''.join(rng.choice('项目会议记录数据周报设计文档计划总结产品需求测试发布') for _ in range(rng.randint(2, 4))) for _ in range(3000)]
+    per_root = max(1, pages // 1000)
+    roots = []
+    for i in range(0, pages, per_root):
+        children = [page_tree.new_page_node(f'n{i + j}', ' '.join(rng.choices(vocabulary, k=rng.randint(1, 4))), False) for j in range(per_root)]
+        roots.append(page_tree.new_page_node(f'r{i}', f'Section {i}', True, children))
+    return roots
+
+
+def with_typos(rng, text, typos):
+    # Substitutions, deletions, insertions or swaps of neighbours, first characters included
+    chars = list(text)
+    for _ in range(typos):
+        position = rng.randrange(len(chars) - 1)
+        kind = rng.randrange(4)
+        if kind == 0:
+            chars[position] = 'q' if chars[position] != 'q' else 'z'
+        elif kind == 1:
+            del chars[position]
+        elif kind == 2:
+            chars.insert(position, 'x')
+        else:
+            chars[position], chars[position + 1] = chars[position + 1], chars[position]
+    return ''.join(chars)
+
+
+def scan_fuzzy(title_index, index, query, limit=10):
+    # Reference: the edit distance to every key of every page, as lookup ranks them.
+    # Returns the best page ids and the distance of every page that matches
+    normalized = title_index.normalize_title(query)
+    edits = min(len(normalized) // title_index.FUZZY_CHARS_PER_EDIT, 2)
+    best = {}
+    for page_id, (name, title) in index._titles.items():
+        for key in title_index.title_keys(title):
+            distance = title_index.prefix_edit_distance(normalized, key, edits)
+            if distance <= edits and distance < best.get(page_id, (edits + 1,))[0]:
+                best[page_id] = (distance, len(title), name, page_id)
+    return [page_id for *_, page_id in sorted(best.values())[:limit]], {page_id: entry[0] for page_id, entry in best.items()}
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=300)
+    parser.add_argument('--scans', type=int, default=10, help='fuzzy queries per typo count checked against a scan of every key')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    page_tree, title_index = load_modules()
+    rng = random.Random(args.seed)
+    roots = make_roots(page_tree, args.pages, rng)
+    tree = page_tree.PageTree()
+    index = title_index.TitleIndex(lambda: tree)
+    index.lookup('')
+
+    _, replace_ms = timed(index.on_tree_change, tree, 'replace', (roots,))
+    tree = page_tree.PageTree(roots)
+    _, first_ms = timed(index.lookup, 'section')
+    started = time.perf_counter()
+    while index.get_stats()['rebuilding']:
+        time.sleep(0.01)
+    rebuilt_ms = (time.perf_counter() - started) * 1000 + first_ms
+    assert len(index) == len(tree)
+    titles = [entry[1] for entry in index._titles.values()]
+
+    prefix_ms = []
+    for _ in range(args.queries):
+        title = rng.choice(titles)
+        results, elapsed = timed(index.lookup, title[:rng.randint(2, 8)])
+        assert results and results[0]['match'] == 'prefix'
+        prefix_ms.append(elapsed)
+
+    fuzzy = {}
+    for typos, lengths in ((1, (5, 10)), (2, (10, 14))):
+        long_enough = [title for title in titles if len(title) >= lengths[0]]
+        queries = [with_typos(rng, title[:rng.randint(*lengths)], typos) for title in rng.sample(long_enough, args.queries)]
+        answered = [(query, *timed(index.lookup, query)) for query in queries if len(query) >= typos * 4]
+        answered = [(query, results, elapsed) for query, results, elapsed in answered if results and results[0]['match'] == 'fuzzy']
+        scanned = [timed(scan_fuzzy, title_index, index, query) for query, _, _ in answered[:args.scans]]
+        same = close = 0
+        for (_, results, _), ((reference, distances), _) in zip(answered, scanned):
+            ids = [result['id'] for result in results]
+            same += ids == reference
+            # Long runs of keys alike (like 'Section 1', 'Section 2', ...) contribute
+            # PREFIX_SCAN_FACTOR keys per result wanted, as for prefix matches
+            close += [distances.get(page_id) for page_id in ids] == [distances[page_id] for page_id in reference]
+        fuzzy[typos] = ([elapsed for _, _, elapsed in answered], [elapsed for _, elapsed in scanned], same, close)
+
+    def summary(times):
+        times = sorted(times)
+        return f'median {times[len(times) // 2]:7.3f} ms  p99 {times[int(len(times) * 0.99)]:7.3f} ms'
+
+    print(f'{len(tree)} pages, {len(index._keys)} keys, {len(index._heads)} heads, {len(index._variants)} head variants')
+    print(f'  replace (listener):        {replace_ms:9.3f} ms')
+    print(f'  first lookup after it:     {first_ms:9.3f} ms  (served from the previous index)')
+    print(f'  background rebuild:        {rebuilt_ms:9.1f} ms')
+    print(f'  prefix lookup:             {summary(prefix_ms)}')
+    for typos, (indexed_ms, scanned_ms, same, close) in fuzzy.items():
+        print(f'  fuzzy lookup, {typos} typo{"s" if typos > 1 else " "}:     {summary(indexed_ms)}')
+        print(f'    scanning every key:      {summary(scanned_ms)}')
+        print(f'    same pages as the scan:  {same}/{len(scanned_ms)}, equally close {close}/{len(scanned_ms)}')
+
+
+if __name__ == '__main__':
+    main()